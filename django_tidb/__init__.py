@@ -7,3 +7,14 @@ from .utils import check_django_compatability
 __version__ = pkg_resources.get_distribution("django-tidb").version
 
 check_django_compatability()
+
+# Allow models to declare TiDB table options, see
+# DatabaseSchemaEditor.table_sql(). The migration state imports its own
+# reference to DEFAULT_NAMES, which may predate this module.
+from django.db.migrations import state  # NOQA isort:skip
+from django.db.models import options  # NOQA isort:skip
+
+if 'tidb_options' not in options.DEFAULT_NAMES:
+    options.DEFAULT_NAMES += ('tidb_options',)
+if 'tidb_options' not in state.DEFAULT_NAMES:
+    state.DEFAULT_NAMES += ('tidb_options',)
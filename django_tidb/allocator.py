@@ -0,0 +1,89 @@
+import threading
+
+import MySQLdb
+from django.db import ProgrammingError
+from django.db.backends.utils import truncate_name
+
+
+class PKAllocator:
+    """
+    Hand out primary key values from blocks reserved in a TiDB SEQUENCE.
+
+    Each table gets a sequence that increments by the block size, so a single
+    NEXTVAL() reserves a whole range of ids. Ranges are cached per process and
+    shared by every connection to the same database, which lets bulk_create()
+    assign primary keys client-side before the INSERT is sent.
+
+    Every writer of an allocated table should go through the allocator;
+    AUTO_INCREMENT values handed out by the server aren't coordinated with
+    the sequence.
+    """
+    def __init__(self, block_size):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        # Maps (host, port, database, table) to the [next, stop) range which
+        # is still available to this process.
+        self._blocks = {}
+
+    def sequence_name(self, connection, table):
+        return truncate_name('%s_pk_seq' % table, connection.ops.max_name_length())
+
+    def allocate(self, connection, opts, count):
+        key = (
+            connection.settings_dict['HOST'],
+            connection.settings_dict['PORT'],
+            connection.settings_dict['NAME'],
+            opts.db_table,
+        )
+        ids = []
+        with self._lock:
+            next_id, stop = self._blocks.get(key, (0, 0))
+            while len(ids) < count:
+                if next_id >= stop:
+                    next_id = self._reserve(connection, opts)
+                    stop = next_id + self.block_size
+                take = min(count - len(ids), stop - next_id)
+                ids.extend(range(next_id, next_id + take))
+                next_id += take
+            self._blocks[key] = (next_id, stop)
+        return ids
+
+    def _reserve(self, connection, opts):
+        sequence = connection.ops.quote_name(self.sequence_name(connection, opts.db_table))
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute('SELECT NEXTVAL(%s)' % sequence)
+            except ProgrammingError:
+                self._create_sequence(connection, opts, sequence)
+                cursor.execute('SELECT NEXTVAL(%s)' % sequence)
+            return cursor.fetchone()[0]
+
+    def _create_sequence(self, connection, opts, sequence):
+        # DDL implicitly commits, so create the sequence on a separate
+        # connection to leave any transaction of the caller untouched. The
+        # sequence starts after the rows already in the table. The connection
+        # doesn't come from the pool nor touch the state of the wrapper.
+        quote_name = connection.ops.quote_name
+        raw_connection = MySQLdb.connect(**connection.get_connection_params())
+        try:
+            cursor = raw_connection.cursor()
+            cursor.execute('SELECT COALESCE(MAX(%s), 0) + 1 FROM %s' % (
+                quote_name(opts.pk.column), quote_name(opts.db_table),
+            ))
+            start = cursor.fetchone()[0]
+            cursor.execute('CREATE SEQUENCE IF NOT EXISTS %s START WITH %d INCREMENT BY %d NOCACHE' % (
+                sequence, start, self.block_size,
+            ))
+        finally:
+            raw_connection.close()
+
+
+_allocators = {}
+_allocators_lock = threading.Lock()
+
+
+def get_pk_allocator(block_size):
+    with _allocators_lock:
+        if block_size not in _allocators:
+            _allocators[block_size] = PKAllocator(block_size)
+        return _allocators[block_size]
@@ -0,0 +1,34 @@
+from django.db.migrations import autodetector
+
+from .migration_operations import AlterTiDBOptions
+
+
+class MigrationAutodetector(autodetector.MigrationAutodetector):
+    def generate_altered_options(self):
+        super().generate_altered_options()
+        self.generate_altered_tidb_options()
+
+    def generate_altered_tidb_options(self):
+        """
+        Work out if Meta.tidb_options changed and make an operation to apply
+        the new table options.
+        """
+        for app_label, model_name in sorted(self.kept_model_keys):
+            old_model_name = self.renamed_models.get((app_label, model_name), model_name)
+            old_model_state = self.from_state.models[app_label, old_model_name]
+            new_model_state = self.to_state.models[app_label, model_name]
+            old_tidb_options = old_model_state.options.get('tidb_options') or {}
+            new_tidb_options = new_model_state.options.get('tidb_options') or {}
+            if 'tiflash_replica' not in new_tidb_options:
+                # The replicas are managed with SetTiFlashReplica instead.
+                old_tidb_options = {
+                    name: value for name, value in old_tidb_options.items() if name != 'tiflash_replica'
+                }
+            if old_tidb_options != new_tidb_options:
+                self.add_operation(
+                    app_label,
+                    AlterTiDBOptions(
+                        name=model_name,
+                        tidb_options=new_tidb_options,
+                    )
+                )
@@ -2,20 +2,47 @@
 MySQL database backend for Django.
 Requires mysqlclient: https://pypi.org/project/mysqlclient/
 """
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
 from django.db.backends.mysql.base import (
+    CursorWrapper as MysqlCursorWrapper,
     DatabaseWrapper as MysqlDatabaseWrapper,
 )
+from django.utils.asyncio import async_unsafe
 from django.utils.functional import cached_property
+from MySQLdb.cursors import SSCursor
 
 # Some of these import MySQLdb, so import them after checking if it's installed.
+from .allocator import get_pk_allocator
 from .features import DatabaseFeatures
+from .instrumentation import QueryInstrumentation, get_sinks
 from .introspection import DatabaseIntrospection
 from .operations import DatabaseOperations
+from .pool import get_pool
+from .prepared import PreparedCursor, PreparedStatements
+from .retry import CursorWrapper, RetryPolicy
 from .schema import DatabaseSchemaEditor
+from .streaming import StreamingCursorWrapper
 from .version import TiDBVersion
 
 server_version = TiDBVersion()
 
+# tidb_server_data shared by the wrappers of this process, maps
+# (host, port, database) to (data, expiry time).
+_server_data_cache = {}
+_server_data_lock = threading.Lock()
+
+
+def clear_server_data_cache():
+    """Forget the server data of all databases, e.g. after an upgrade."""
+    with _server_data_lock:
+        _server_data_cache.clear()
+
+
 class DatabaseWrapper(MysqlDatabaseWrapper):
     vendor = 'tidb'
     display_name = 'TiDB'
@@ -26,6 +53,54 @@ class DatabaseWrapper(MysqlDatabaseWrapper):
     introspection_class = DatabaseIntrospection
     ops_class = DatabaseOperations
 
+    pk_allocation_modes = {'sequence', 'auto_increment'}
+    replica_read_modes = {
+        'leader', 'follower', 'leader-and-follower', 'prefer-leader',
+        'closest-replicas', 'closest-adaptive', 'learner',
+    }
+    storage_engines = {'tikv', 'tiflash', 'tidb'}
+    # OPTIONS consumed by the backend rather than passed to MySQLdb.connect().
+    tidb_options = {
+        'tidb_pk_allocation', 'tidb_pk_allocation_block_size', 'tidb_read_staleness',
+        'tidb_replica_read', 'tidb_isolation_read_engines', 'tidb_tiflash_aggregates',
+        'tidb_server_data', 'tidb_server_data_ttl', 'tidb_endpoints', 'tidb_load_balancing',
+        'tidb_pool_size', 'tidb_pool_health_check_interval', 'tidb_endpoint_backoff',
+        'tidb_retry_attempts', 'tidb_retry_base_delay', 'tidb_retry_max_delay',
+        'tidb_streaming_cursors', 'tidb_ddl_progress_interval', 'tidb_merge_alter_statements',
+        'tidb_index_foreign_keys', 'tidb_metrics_sinks', 'tidb_tag_statements', 'tidb_prepared_statements',
+        'tidb_bulk_batch_bytes', 'tidb_in_list_threshold',
+    }
+    # The StreamingCursorWrapper whose result set is being read.
+    stream = None
+    # The number of statements retried on this connection.
+    statement_retries = 0
+    # The PreparedStatements of the connection, if enabled.
+    prepared_statements = None
+    # Values per INSERT into the temporary table of a large IN lookup.
+    in_list_batch_size = 10000
+    # Whether the compiler may move large IN lookups to temporary tables,
+    # only while it executes a statement.
+    in_list_tables_allowed = False
+    server_data_defaults = {
+        'sql_mode': '',
+        'default_storage_engine': 'InnoDB',
+        'sql_auto_is_null': False,
+        'lower_case_table_names': False,
+        'has_zoneinfo_database': True,
+        'auto_increment_increment': 1,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The temporary tables holding the values of large IN lookups.
+        self.in_list_tables = []
+        options = self.settings_dict['OPTIONS']
+        if options.get('tidb_metrics_sinks') or options.get('tidb_tag_statements'):
+            self.execute_wrappers.append(QueryInstrumentation(
+                get_sinks(options.get('tidb_metrics_sinks') or ()),
+                tag_statements=options.get('tidb_tag_statements', False),
+            ))
+
     @cached_property
     def display_name(self):
         return 'TiDB'
@@ -42,9 +117,271 @@ class DatabaseWrapper(MysqlDatabaseWrapper):
             return check_constraints
         return {}
 
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for name in self.tidb_options:
+            kwargs.pop(name, None)
+        # Validate the replica read mode, if specified.
+        replica_read = self.settings_dict['OPTIONS'].get('tidb_replica_read')
+        if replica_read:
+            replica_read = replica_read.lower()
+            if replica_read not in self.replica_read_modes:
+                raise ImproperlyConfigured(
+                    "Invalid replica read mode '%s' specified.\n"
+                    "Use one of %s, or None." % (
+                        replica_read,
+                        ', '.join("'%s'" % s for s in sorted(self.replica_read_modes))
+                    ))
+        self.replica_read = replica_read
+        read_engines = self.settings_dict['OPTIONS'].get('tidb_isolation_read_engines')
+        try:
+            self.isolation_read_engines = self._check_read_engines(read_engines) if read_engines else None
+        except ValueError as e:
+            raise ImproperlyConfigured(str(e))
+        return kwargs
+
+    @cached_property
+    def pool(self):
+        options = self.settings_dict['OPTIONS']
+        if options.get('tidb_endpoints') or options.get('tidb_pool_size'):
+            return get_pool(self.settings_dict)
+        return None
+
+    def get_new_connection(self, conn_params):
+        size = self.settings_dict['OPTIONS'].get('tidb_prepared_statements')
+        # A pooled connection may have statements prepared under the same
+        # names, preparing them again replaces them.
+        self.prepared_statements = PreparedStatements(size) if size else None
+        if self.pool is None:
+            return super().get_new_connection(conn_params)
+        return self.pool.acquire(conn_params, super().get_new_connection)
+
+    def _close(self):
+        # A connection which raised an error may be broken and one with an
+        # unread result set can't run statements, don't reuse them.
+        reusable = not self.errors_occurred and self.stream is None
+        self.stream = None
+        if self.connection is not None and self.pool is not None and reusable and self.in_list_tables:
+            # Drop the temporary tables of a session going back to the pool,
+            # its next user would fail to create them.
+            try:
+                self.drop_in_list_tables()
+            except DatabaseError:
+                reusable = False
+        # Otherwise they go away with the session.
+        self.in_list_tables = []
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            return self.pool.release(self.connection, reusable=reusable)
+
+    @cached_property
+    def retry_policy(self):
+        options = self.settings_dict['OPTIONS']
+        return RetryPolicy(
+            options.get('tidb_retry_attempts', 0),
+            options.get('tidb_retry_base_delay', 0.05),
+            options.get('tidb_retry_max_delay', 1),
+        )
+
+    @async_unsafe
+    def create_cursor(self, name=None):
+        self.release_stream()
+        if name is not None:
+            return StreamingCursorWrapper(self.connection.cursor(SSCursor), self)
+        cursor = self.connection.cursor()
+        if self.prepared_statements is not None:
+            cursor = PreparedCursor(cursor, self.prepared_statements)
+        if not self.retry_policy.attempts:
+            return MysqlCursorWrapper(cursor)
+        return CursorWrapper(cursor, self)
+
+    def chunked_cursor(self):
+        """
+        Return an unbuffered cursor, which fetches the rows from the server
+        as they are read, if OPTIONS['tidb_streaming_cursors'] is set.
+        """
+        if not self.settings_dict['OPTIONS'].get('tidb_streaming_cursors'):
+            return super().chunked_cursor()
+        return self._cursor(name='stream')
+
+    def create_in_list_table(self, column_type, values):
+        """
+        Create a local temporary table of a single `v` column holding
+        `values` and return its name. It's dropped before the next statement
+        of the query compiler.
+        """
+        name = 'django_tidb_in_%d' % len(self.in_list_tables)
+        unique = not any(word in column_type.lower() for word in ('text', 'blob', 'json'))
+        with self.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE %s (`v` %s%s)' % (
+                self.ops.quote_name(name), column_type, ', PRIMARY KEY (`v`)' if unique else '',
+            ))
+            self.in_list_tables.append(name)
+            for i in range(0, len(values), self.in_list_batch_size):
+                batch = values[i:i + self.in_list_batch_size]
+                cursor.execute(
+                    'INSERT IGNORE INTO %s (`v`) VALUES %s' % (
+                        self.ops.quote_name(name), ', '.join(['(%s)'] * len(batch)),
+                    ),
+                    batch,
+                )
+        return name
+
+    def drop_in_list_tables(self):
+        if not self.in_list_tables or self.connection is None:
+            return
+        tables, self.in_list_tables = self.in_list_tables, []
+        with self.cursor() as cursor:
+            cursor.execute('DROP TEMPORARY TABLE IF EXISTS %s' % ', '.join(map(self.ops.quote_name, tables)))
+
+    def release_stream(self):
+        """
+        Read the rest of the open streaming result set, if any, into memory
+        so that the connection can run another statement. A RuntimeWarning
+        is emitted if there were rows left.
+        """
+        if self.stream is not None:
+            self.stream.release()
+
+    def _commit(self):
+        self.release_stream()
+        return super()._commit()
+
+    def _rollback(self):
+        self.release_stream()
+        return super()._rollback()
+
+    def _set_autocommit(self, autocommit):
+        self.release_stream()
+        return super()._set_autocommit(autocommit)
+
+    def is_usable(self):
+        self.release_stream()
+        return super().is_usable()
+
+    def init_connection_state(self):
+        assignments = []
+        if self.features.is_sql_auto_is_null_enabled:
+            # SQL_AUTO_IS_NULL controls whether an AUTO_INCREMENT column on
+            # a recently inserted row will return when the field is tested
+            # for NULL. Disabling this brings this aspect of MySQL in line
+            # with SQL standards.
+            assignments.append('SET SQL_AUTO_IS_NULL = 0')
+
+        if self.isolation_level:
+            assignments.append('SET SESSION TRANSACTION ISOLATION LEVEL %s' % self.isolation_level.upper())
+
+        read_staleness = self.settings_dict['OPTIONS'].get('tidb_read_staleness')
+        session_variables = {
+            # Route the reads of this connection to followers / the closest
+            # replica instead of the region leader.
+            'tidb_replica_read': self.replica_read,
+            'tidb_isolation_read_engines': self.isolation_read_engines,
+            # Serve reads of this connection from data at most that many
+            # seconds old, from the nearest replica.
+            'tidb_read_staleness': '%d' % -abs(int(read_staleness)) if read_staleness else None,
+        }
+        for name, value in session_variables.items():
+            if value:
+                assignments.append("SET @@%s = '%s'" % (name, value))
+            elif self.pool is not None:
+                # A pooled session may have been changed by its previous
+                # user.
+                assignments.append('SET @@%s = DEFAULT' % name)
+
+        if assignments:
+            with self.cursor() as cursor:
+                cursor.execute('; '.join(assignments))
+
+    @contextmanager
+    def use_replica_read(self, mode):
+        """
+        Switch @@tidb_replica_read to `mode` for the queries run inside the
+        block, then restore the configured mode.
+        """
+        mode = mode.lower()
+        if mode not in self.replica_read_modes:
+            raise ValueError(
+                "Invalid replica read mode '%s'. Use one of %s." % (
+                    mode, ', '.join("'%s'" % s for s in sorted(self.replica_read_modes))
+                ))
+        with self._set_session_variable('tidb_replica_read', mode, lambda: self.replica_read or 'leader'):
+            yield
+
+    @contextmanager
+    def use_read_engines(self, *engines):
+        """
+        Restrict the storage engines the queries run inside the block may
+        read from, e.g. use_read_engines('tiflash', 'tidb') to run analytical
+        queries on TiFlash replicas.
+        """
+        engines = self._check_read_engines(engines)
+        default = 'tikv,tiflash,tidb'
+        with self._set_session_variable(
+            'tidb_isolation_read_engines', engines, lambda: self.isolation_read_engines or default,
+        ):
+            yield
+
+    def _check_read_engines(self, engines):
+        if isinstance(engines, str):
+            engines = engines.split(',')
+        engines = [engine.strip().lower() for engine in engines]
+        unknown = set(engines) - self.storage_engines
+        if unknown or not engines:
+            raise ValueError(
+                "Invalid isolation read engines %s. Use some of %s." % (
+                    ', '.join("'%s'" % s for s in sorted(unknown)) or 'none',
+                    ', '.join("'%s'" % s for s in sorted(self.storage_engines)),
+                ))
+        return ','.join(engines)
+
+    @contextmanager
+    def _set_session_variable(self, name, value, get_restore_value):
+        self.ensure_connection()
+        with self.cursor() as cursor:
+            cursor.execute('SET @@%s = %%s' % name, [value])
+        try:
+            yield
+        finally:
+            if self.connection is not None:
+                with self.cursor() as cursor:
+                    cursor.execute('SET @@%s = %%s' % name, [get_restore_value()])
+
+    @cached_property
+    def pk_allocation(self):
+        mode = self.settings_dict['OPTIONS'].get('tidb_pk_allocation')
+        if mode and mode not in self.pk_allocation_modes:
+            raise ImproperlyConfigured(
+                "Invalid primary key allocation mode '%s' specified.\n"
+                "Use one of %s, or None." % (
+                    mode, ', '.join("'%s'" % s for s in sorted(self.pk_allocation_modes))
+                ))
+        return mode
+
+    @cached_property
+    def pk_allocator(self):
+        return get_pk_allocator(self.settings_dict['OPTIONS'].get('tidb_pk_allocation_block_size', 1000))
+
     @cached_property
     def tidb_server_data(self):
+        options = self.settings_dict['OPTIONS']
+        if options.get('tidb_server_data'):
+            # Pre-seeded from the settings, no probe connection needed.
+            if 'version' not in options['tidb_server_data']:
+                raise ImproperlyConfigured("OPTIONS['tidb_server_data'] must include the 'version'.")
+            return {**self.server_data_defaults, **options['tidb_server_data']}
+        ttl = options.get('tidb_server_data_ttl', 300)
+        key = (self.settings_dict['HOST'], self.settings_dict['PORT'], self.settings_dict['NAME'])
+        data = self._get_cached_server_data(key)
+        if data is not None:
+            return data
         with self.temporary_connection() as cursor:
+            # Opening the connection may have looked the data up already,
+            # which is only cached on this wrapper when the ttl is 0.
+            data = self.__dict__.get('tidb_server_data') or self._get_cached_server_data(key)
+            if data is not None:
+                return data
             # Select some server variables and test if the time zone
             # definitions are installed. CONVERT_TZ returns NULL if 'UTC'
             # timezone isn't loaded into the mysql.time_zone table.
@@ -54,17 +391,33 @@ class DatabaseWrapper(MysqlDatabaseWrapper):
                        @@default_storage_engine,
                        @@sql_auto_is_null,
                        @@lower_case_table_names,
-                       CONVERT_TZ('2001-01-01 01:00:00', 'UTC', 'UTC') IS NOT NULL
+                       CONVERT_TZ('2001-01-01 01:00:00', 'UTC', 'UTC') IS NOT NULL,
+                       @@auto_increment_increment
             """)
             row = cursor.fetchone()
-        return {
+        data = {
             'version': row[0],
             'sql_mode': row[1],
             'default_storage_engine': row[2],
             'sql_auto_is_null': bool(row[3]),
             'lower_case_table_names': bool(row[4]),
             'has_zoneinfo_database': bool(row[5]),
+            'auto_increment_increment': int(row[6]),
         }
+        if ttl:
+            with _server_data_lock:
+                _server_data_cache[key] = (data, time.monotonic() + ttl)
+        return data
+
+    def _get_cached_server_data(self, key):
+        with _server_data_lock:
+            data, expires = _server_data_cache.get(key, (None, 0))
+        return data if expires > time.monotonic() else None
+
+    @cached_property
+    def mysql_server_data(self):
+        # Used by the inherited MySQL code, same query as tidb_server_data.
+        return self.tidb_server_data
 
     @cached_property
     def tidb_server_info(self):
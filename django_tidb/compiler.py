@@ -0,0 +1,187 @@
+from django.db.backends.mysql import compiler
+from django.db.models.lookups import In
+from django.db.models.sql.datastructures import BaseTable, Join
+
+from .fields import AutoRandomFieldMixin
+
+
+class SQLCompiler(compiler.SQLCompiler):
+    def add_optimizer_hints(self, sql):
+        """
+        Put the optimizer hints of the query right after the leading SELECT,
+        UPDATE or DELETE keyword.
+        """
+        hints = list(getattr(self.query, 'tidb_hints', ()))
+        keyword, space, rest = sql.partition(' ')
+        storage = self.get_read_storage() if keyword == 'SELECT' else None
+        tables = [alias for alias in self.query.alias_map if self.query.alias_refcount[alias]]
+        if storage and tables:
+            hints.append(self.connection.ops.read_from_storage_hint(storage, tables))
+        if not hints or keyword not in ('SELECT', 'UPDATE', 'DELETE'):
+            return sql
+        hints_sql = self.connection.ops.optimizer_hints_sql(hints).replace('%', '%%')
+        return '%s %s %s' % (keyword, hints_sql, rest)
+
+    def get_read_storage(self):
+        """
+        Return the storage engine the query should read from: the one set by
+        QuerySet.read_from_storage() or 'tiflash' for aggregations when the
+        connection routes them to TiFlash.
+        """
+        storage = getattr(self.query, 'tidb_read_storage', None)
+        if storage is not None:
+            return storage
+        if self.connection.settings_dict['OPTIONS'].get('tidb_tiflash_aggregates') and (
+            self.query.group_by is not None or any(
+                getattr(annotation, 'contains_aggregate', False)
+                for annotation in self.query.annotation_select.values()
+            )
+        ):
+            return 'tiflash'
+        return None
+
+    def compile_in_list_table(self, node):
+        """
+        Compile a large IN lookup as a semi-join against a temporary table
+        holding the values, which keeps the statement small and its
+        planning cost flat however many values there are. Return None if
+        the values can't be moved to a table.
+        """
+        lhs_sql, lhs_params = node.process_lhs(self, self.connection)
+        rhs_sql, rhs_params = node.process_rhs(self, self.connection)
+        column_type = node.lhs.output_field.rel_db_type(self.connection)
+        if column_type is None or rhs_sql != '(%s)' % ', '.join(['%s'] * len(rhs_params)):
+            # Expressions in the list.
+            return None
+        if '(None)' in column_type:
+            # A CharField without max_length, e.g. the output of Cast().
+            column_type = 'longtext'
+        collation = getattr(node.lhs.output_field, 'db_collation', None)
+        if collation:
+            column_type += ' COLLATE %s' % collation
+        table = self.connection.create_in_list_table(column_type, rhs_params)
+        return '%s IN (SELECT `v` FROM %s)' % (lhs_sql, self.connection.ops.quote_name(table)), lhs_params
+
+    def execute_sql(self, *args, **kwargs):
+        # The temporary tables of the previous statements aren't needed
+        # anymore.
+        self.connection.drop_in_list_tables()
+        if self.query.explain_query or self.connection.in_list_tables_allowed:
+            return super().execute_sql(*args, **kwargs)
+        # Only create temporary tables for the statements which are run,
+        # not when a query is merely compiled, e.g. by str(queryset).
+        self.connection.in_list_tables_allowed = True
+        try:
+            return super().execute_sql(*args, **kwargs)
+        finally:
+            self.connection.in_list_tables_allowed = False
+
+    def as_sql(self, *args, **kwargs):
+        sql, params = super().as_sql(*args, **kwargs)
+        if self.query.explain_query:
+            # Keep the hints of the explained statement.
+            prefix = self.connection.ops.explain_query_prefix(
+                self.query.explain_format, **self.query.explain_options
+            )
+            return '%s %s' % (prefix, self.add_optimizer_hints(sql[len(prefix) + 1:])), params
+        return self.add_optimizer_hints(sql), params
+
+    def compile(self, node):
+        as_of = getattr(self.query, 'tidb_as_of', None)
+        # A stale read can't see the temporary tables of the session.
+        if (
+            isinstance(node, In) and node.rhs_is_direct_value() and
+            self.connection.in_list_tables_allowed and as_of is None
+        ):
+            threshold = self.connection.settings_dict['OPTIONS'].get('tidb_in_list_threshold')
+            if threshold and len(node.rhs) > threshold and self.connection.features.supports_local_temporary_tables:
+                compiled = self.compile_in_list_table(node)
+                if compiled is not None:
+                    return compiled
+        sql, params = super().compile(node)
+        if as_of is not None and isinstance(node, (BaseTable, Join)):
+            # Every table of a stale read carries the same AS OF clause,
+            # right after the table name and alias.
+            as_of_sql, as_of_params = self.connection.ops.as_of_sql(as_of)
+            if isinstance(node, Join):
+                head, on, tail = sql.partition(' ON (')
+                sql = '%s %s%s%s' % (head, as_of_sql, on, tail)
+                params = (*as_of_params, *params)
+            else:
+                sql = '%s %s' % (sql, as_of_sql)
+                params = (*params, *as_of_params)
+        return sql, params
+
+
+class SQLInsertCompiler(compiler.SQLInsertCompiler, SQLCompiler):
+    def as_sql(self):
+        result = super().as_sql()
+        update_fields = getattr(self.query, 'tidb_on_duplicate_key_update', None)
+        if not update_fields:
+            return result
+        update_sql = self.connection.ops.on_duplicate_key_update_sql(update_fields)
+        return [('%s %s' % (sql, update_sql), params) for sql, params in result]
+
+    def execute_sql(self, returning_fields=None):
+        allocation = self.connection.pk_allocation
+        if not allocation or not returning_fields or self.query.ignore_conflicts:
+            return super().execute_sql(returning_fields)
+        opts = self.query.get_meta()
+        if opts.pk in self.query.fields:
+            # The primary keys are set by the caller, e.g. fixtures or
+            # bulk_create() of objects which have one.
+            return self._execute_with_given_pks(returning_fields)
+        auto_random = isinstance(opts.pk, AutoRandomFieldMixin)
+        if allocation == 'sequence' and not auto_random:
+            return self._execute_with_allocated_pks(returning_fields)
+        return self._execute_with_consecutive_pks(returning_fields)
+
+    def _execute_with_allocated_pks(self, returning_fields):
+        opts = self.query.get_meta()
+        objs = [obj for obj in self.query.objs if getattr(obj, opts.pk.attname) is None]
+        allocator = self.connection.pk_allocator
+        for obj, pk_value in zip(objs, allocator.allocate(self.connection, opts, len(objs))):
+            setattr(obj, opts.pk.attname, pk_value)
+        self.query.fields = [*self.query.fields, opts.pk]
+        try:
+            return self._execute_with_given_pks(returning_fields)
+        except Exception:
+            for obj in objs:
+                setattr(obj, opts.pk.attname, None)
+            raise
+
+    def _execute_with_given_pks(self, returning_fields):
+        super().execute_sql()
+        return [tuple(getattr(obj, field.attname) for field in returning_fields) for obj in self.query.objs]
+
+    def _execute_with_consecutive_pks(self, returning_fields):
+        # TiDB allocates the AUTO_INCREMENT values of a single multi-row
+        # INSERT as one consecutive range, so the ids can be derived from the
+        # first one without a follow-up SELECT. AUTO_RANDOM values of a
+        # statement share their shard bits and are consecutive too.
+        self.returning_fields = None
+        with self.connection.cursor() as cursor:
+            for sql, params in self.as_sql():
+                cursor.execute(sql, params)
+            first_id = cursor.lastrowid
+        if isinstance(self.query.get_meta().pk, AutoRandomFieldMixin):
+            step = 1
+        else:
+            step = self.connection.tidb_server_data['auto_increment_increment']
+        return [(first_id + i * step,) for i in range(len(self.query.objs))]
+
+
+class SQLDeleteCompiler(compiler.SQLDeleteCompiler, SQLCompiler):
+    def as_sql(self):
+        sql, params = super().as_sql()
+        return self.add_optimizer_hints(sql), params
+
+
+class SQLUpdateCompiler(compiler.SQLUpdateCompiler, SQLCompiler):
+    def as_sql(self):
+        sql, params = super().as_sql()
+        return self.add_optimizer_hints(sql), params
+
+
+class SQLAggregateCompiler(compiler.SQLAggregateCompiler, SQLCompiler):
+    pass
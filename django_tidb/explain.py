@@ -0,0 +1,197 @@
+import re
+from collections import namedtuple
+
+# A plan operator whose estimated and actual row counts differ by `ratio`.
+Mismatch = namedtuple('Mismatch', 'node ratio')
+
+# Column names of the row format, lowercased, to PlanNode attributes.
+# Before TiDB 4.0, estRows was named count.
+plan_columns = {
+    'id': 'id',
+    'estrows': 'est_rows',
+    'count': 'est_rows',
+    'actrows': 'act_rows',
+    'task': 'task',
+    'access object': 'access_object',
+    'execution info': 'execution_info',
+    'operator info': 'operator_info',
+    'memory': 'memory',
+    'disk': 'disk',
+}
+
+tree_prefix_re = re.compile(r'^[\s│├└─]*')
+# e.g. IndexRangeScan_9(Build), or IndexRangeScan(Build) in the brief format.
+operator_id_re = re.compile(r'^(?P<name>.*?)(?:_\d+)?(?:\((?P<role>\w+)\))?$')
+# Go durations, e.g. time:1.5ms or time:1m2.5s.
+execution_time_re = re.compile(r'\btime:\s*((?:[\d.]+(?:ns|µs|us|ms|s|m|h))+)')
+duration_part_re = re.compile(r'([\d.]+)(ns|µs|us|ms|s|m|h)')
+time_units = {'ns': 1e-9, 'µs': 1e-6, 'us': 1e-6, 'ms': 1e-3, 's': 1, 'm': 60, 'h': 3600}
+
+
+def _number(value, type):
+    if value is None or value in ('', 'N/A'):
+        return None
+    try:
+        return type(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class PlanNode:
+    """
+    An operator of a TiDB execution plan. `act_rows`, `execution_info`,
+    `memory` and `disk` are only set by EXPLAIN ANALYZE.
+    """
+    def __init__(self, id, est_rows=None, act_rows=None, task='', access_object='',
+                 execution_info='', operator_info='', memory=None, disk=None):
+        self.id = id
+        self.est_rows = _number(est_rows, float)
+        self.act_rows = _number(act_rows, int)
+        self.task = task or ''
+        self.access_object = access_object or ''
+        self.execution_info = execution_info or ''
+        self.operator_info = operator_info or ''
+        self.memory = None if memory == 'N/A' else memory
+        self.disk = None if disk == 'N/A' else disk
+        self.parent = None
+        self.children = []
+
+    def __repr__(self):
+        return '<PlanNode %s est_rows=%s act_rows=%s>' % (self.id, self.est_rows, self.act_rows)
+
+    @property
+    def name(self):
+        """The operator name without its plan id suffix, e.g. 'TableFullScan'."""
+        return operator_id_re.match(self.id)['name']
+
+    @property
+    def role(self):
+        """The side of the parent operator, such as 'Build' or 'Probe', if any."""
+        return operator_id_re.match(self.id)['role']
+
+    @property
+    def is_full_scan(self):
+        return self.name in ('TableFullScan', 'IndexFullScan')
+
+    @property
+    def pseudo_stats(self):
+        """Whether the estimate is based on pseudo (missing or outdated) statistics."""
+        return 'stats:pseudo' in self.operator_info
+
+    @property
+    def execution_time(self):
+        """The time spent in the operator in seconds, from the execution info."""
+        match = execution_time_re.search(self.execution_info)
+        if match is None:
+            return None
+        return sum(float(value) * time_units[unit] for value, unit in duration_part_re.findall(match[1]))
+
+    @property
+    def estimate_ratio(self):
+        """
+        How many times the estimated and actual row counts differ, 1 when
+        they match, None without actual row counts.
+        """
+        if self.act_rows is None or self.est_rows is None:
+            return None
+        high, low = max(self.est_rows, self.act_rows), min(self.est_rows, self.act_rows)
+        return high / max(low, 1)
+
+    def walk(self):
+        """Yield this operator and its descendants, depth first."""
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+class Plan:
+    """
+    A parsed TiDB execution plan of the row (or brief) format, a tree of
+    PlanNode whose `root` is the first row.
+    """
+    def __init__(self, root, analyzed=False):
+        self.root = root
+        self.analyzed = analyzed
+
+    def __repr__(self):
+        return '<Plan %s>' % self.root.id
+
+    def __iter__(self):
+        return self.root.walk()
+
+    @classmethod
+    def from_rows(cls, columns, rows):
+        """Build the tree from the column names and rows of an EXPLAIN."""
+        attributes = [plan_columns.get(column.lower()) for column in columns]
+        if 'id' not in attributes:
+            raise ValueError('The plan must be in the row format, got columns %s.' % ', '.join(columns))
+        root = None
+        # The last operator of each depth.
+        stack = []
+        for row in rows:
+            values = {
+                attribute: value
+                for attribute, value in zip(attributes, row)
+                if attribute is not None
+            }
+            # Each depth is indented by two characters of the tree drawing.
+            prefix = tree_prefix_re.match(values['id'])[0]
+            depth = len(prefix) // 2
+            values['id'] = values['id'][len(prefix):]
+            node = PlanNode(**values)
+            del stack[depth:]
+            if stack:
+                node.parent = stack[-1]
+                stack[-1].children.append(node)
+            elif root is None:
+                root = node
+            else:
+                raise ValueError('The plan has more than one root operator.')
+            stack.append(node)
+        if root is None:
+            raise ValueError('The plan is empty.')
+        return cls(root, analyzed='act_rows' in attributes)
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        """Build the plan from a cursor which executed an EXPLAIN."""
+        return cls.from_rows([column[0] for column in cursor.description], cursor.fetchall())
+
+    def mismatches(self, ratio=10, min_rows=100):
+        """
+        Return the operators whose estimated and actual row counts differ by
+        at least `ratio` times, ignoring those where both counts are below
+        `min_rows`, sorted from the largest difference. Large differences
+        on scans usually mean stale statistics, see ANALYZE TABLE.
+
+        The estimated rows of the inner side of an index join are per row
+        of the outer side, whereas the actual rows are the total.
+        """
+        if not self.analyzed:
+            raise ValueError('Estimate mismatches need a plan from EXPLAIN ANALYZE.')
+        found = [
+            Mismatch(node, node.estimate_ratio)
+            for node in self
+            if node.estimate_ratio is not None and node.estimate_ratio >= ratio and
+            max(node.est_rows, node.act_rows) >= min_rows
+        ]
+        return sorted(found, key=lambda mismatch: mismatch.ratio, reverse=True)
+
+    def full_scans(self):
+        """Return the TableFullScan and IndexFullScan operators."""
+        return [node for node in self if node.is_full_scan]
+
+    def pseudo_stats(self):
+        """Return the operators estimated with pseudo statistics."""
+        return [node for node in self if node.pseudo_stats]
+
+
+def explain(connection, sql, params=None, analyze=False, format=None):
+    """
+    Return the Plan of `sql`. With `analyze`, the statement is executed and
+    the plan contains the actual row counts.
+    """
+    prefix = connection.ops.explain_query_prefix(format, analyze=analyze)
+    with connection.cursor() as cursor:
+        cursor.execute('%s %s' % (prefix, sql), params)
+        return Plan.from_cursor(cursor)
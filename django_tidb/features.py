@@ -8,16 +8,13 @@ from django.utils.functional import cached_property
 
 class DatabaseFeatures(MysqlDatabaseFeatures):
     has_select_for_update = True
-    supports_transactions = False
-    uses_savepoints = False
-    can_release_savepoints = False
+    # DDL statements commit the current transaction.
     atomic_transactions = False
     supports_atomic_references_rename = False
     can_clone_databases = False
     can_rollback_ddl = False
     order_by_nulls_first = True
     supports_foreign_keys = False
-    indexes_foreign_keys = False
     test_collations = {
         'ci': 'utf8mb4_general_ci',
         'non_default': 'utf8mb4_unicode_ci',
@@ -351,10 +348,23 @@ class DatabaseFeatures(MysqlDatabaseFeatures):
 
     @cached_property
     def can_return_columns_from_insert(self):
-        return False
+        # Primary keys are only known without a follow-up SELECT when they
+        # are allocated by the backend, see DatabaseWrapper.pk_allocation.
+        return bool(self.connection.pk_allocation)
 
     can_return_rows_from_bulk_insert = property(operator.attrgetter('can_return_columns_from_insert'))
 
+    @cached_property
+    def supports_transactions(self):
+        # Pessimistic transactions are the default since TiDB 4.0.
+        return self.connection.tidb_version >= (4, 0)
+
+    @cached_property
+    def uses_savepoints(self):
+        return self.connection.tidb_version >= (6, 2)
+
+    can_release_savepoints = property(operator.attrgetter('uses_savepoints'))
+
     @cached_property
     def has_zoneinfo_database(self):
         return self.connection.tidb_server_data['has_zoneinfo_database']
@@ -422,3 +432,23 @@ class DatabaseFeatures(MysqlDatabaseFeatures):
     @cached_property
     def supports_expression_indexes(self):
         return self.connection.tidb_version >= (5, 1, )
+
+    @cached_property
+    def indexes_foreign_keys(self):
+        return bool(self.connection.settings_dict['OPTIONS'].get('tidb_index_foreign_keys'))
+
+    @cached_property
+    def supports_multi_schema_change(self):
+        return self.connection.tidb_version >= (6, 2)
+
+    @cached_property
+    def supports_local_temporary_tables(self):
+        return self.connection.tidb_version >= (5, 3)
+
+    @cached_property
+    def supports_non_transactional_delete(self):
+        return self.connection.tidb_version >= (6, 1)
+
+    @cached_property
+    def supports_non_transactional_update(self):
+        return self.connection.tidb_version >= (6, 5)
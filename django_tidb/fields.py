@@ -0,0 +1,67 @@
+from django.core import checks
+from django.db.models import BigAutoField
+
+
+class AutoRandomFieldMixin:
+    """
+    A primary key filled by TiDB with AUTO_RANDOM values.
+
+    The high `shard_bits` bits of every value are random, so consecutive
+    inserts are spread over all regions instead of piling up in the last one.
+    `range_bits` limits the total number of bits used (TiDB >= 6.3).
+    """
+    default_shard_bits = 5
+
+    def __init__(self, *args, shard_bits=None, range_bits=None, **kwargs):
+        self.shard_bits = self.default_shard_bits if shard_bits is None else shard_bits
+        self.range_bits = range_bits
+        super().__init__(*args, **kwargs)
+
+    def check(self, **kwargs):
+        return [
+            *super().check(**kwargs),
+            *self._check_auto_random_bits(),
+        ]
+
+    def _check_auto_random_bits(self):
+        errors = []
+        if not 1 <= self.shard_bits <= 15:
+            errors.append(
+                checks.Error(
+                    "'shard_bits' must be between 1 and 15.",
+                    obj=self,
+                    id='django_tidb.E001',
+                )
+            )
+        if self.range_bits is not None and not 32 <= self.range_bits <= 64:
+            errors.append(
+                checks.Error(
+                    "'range_bits' must be between 32 and 64.",
+                    obj=self,
+                    id='django_tidb.E002',
+                )
+            )
+        return errors
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.shard_bits != self.default_shard_bits:
+            kwargs['shard_bits'] = self.shard_bits
+        if self.range_bits is not None:
+            kwargs['range_bits'] = self.range_bits
+        return name, path, args, kwargs
+
+    def db_type(self, connection):
+        if self.range_bits is None:
+            return 'bigint AUTO_RANDOM(%d)' % self.shard_bits
+        return 'bigint AUTO_RANDOM(%d, %d)' % (self.shard_bits, self.range_bits)
+
+
+class BigAutoRandomField(AutoRandomFieldMixin, BigAutoField):
+    pass
+
+
+class AutoRandomField(BigAutoRandomField):
+    # TiDB only allows AUTO_RANDOM on BIGINT columns, the name is kept for
+    # symmetry with AutoField / BigAutoField.
+    pass
@@ -0,0 +1,413 @@
+import bisect
+import functools
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger('django_tidb.queries')
+
+# One executed statement, as passed to the sinks. `rows` is None when the
+# statement failed or the row count isn't known (streaming cursors), `error`
+# is the exception it raised, if any.
+QueryRecord = namedtuple('QueryRecord', 'alias digest digest_text sql duration rows retries error tag')
+
+# Seconds.
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+token_re = re.compile(r"""
+    (?P<comment>/\*.*?\*/|--[^\n]*|\#[^\n]*)
+    |(?P<string>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*")
+    |(?P<identifier>`(?:[^`]|``)*`)
+    |(?P<placeholder>%s|\?)
+    |(?P<number>0[xX][0-9a-fA-F]+|0[bB][01]+|(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+    |(?P<word>[A-Za-z_$@][\w$@]*)
+    |(?P<operator><=>|<=|>=|<>|!=|:=|\|\||&&|<<|>>|->>|->|\S)
+""", re.VERBOSE | re.DOTALL)
+# Tokens after which a sign is part of the following number.
+sign_contexts = {'(', ',', '+', '-', '>=', 'is', '<=', '=', '<', '>', 'select'}
+# Longer statements, e.g. with thousands of IN placeholders, aren't cached.
+max_cached_sql_length = 4096
+
+
+def normalize_sql(sql):
+    """
+    Return the normalized text and the digest of `sql` following the rules
+    of TiDB's parser.Normalize(): comments and optimizer hints are dropped,
+    literals and placeholders become ?, lists of them in IN and VALUES
+    become ..., keywords and identifiers are lowercased and tokens are
+    separated by single spaces. For the statements Django builds, which
+    quote all the identifiers, this matches the DIGEST_TEXT and DIGEST columns of
+    information_schema.statements_summary and of the slow query log.
+    """
+    if len(sql) > max_cached_sql_length:
+        return _normalize_sql(sql)
+    return _cached_normalize_sql(sql)
+
+
+def _normalize_sql(sql):
+    tokens = []
+    for match in token_re.finditer(sql):
+        kind = match.lastgroup
+        value = match.group()
+        if kind == 'comment':
+            continue
+        if kind == 'number' and _is_position(tokens):
+            # ORDER BY 1, GROUP BY (1, 2) refer to columns.
+            tokens.append(value)
+        elif kind in ('string', 'placeholder', 'number'):
+            if (
+                kind == 'number' and tokens and tokens[-1] in ('-', '+') and
+                (len(tokens) == 1 or tokens[-2] in sign_contexts)
+            ):
+                # A signed number is a single literal.
+                tokens.pop()
+            tokens.append('?')
+        elif kind in ('identifier', 'word'):
+            tokens.append(value.lower())
+        elif value == '*' and tokens[-2:] == ['count', '(']:
+            tokens.append('?')
+        else:
+            tokens.append(value)
+    normalized = ' '.join(_reduce_lists(tokens))
+    return normalized, hashlib.sha256(normalized.encode()).hexdigest()
+
+
+_cached_normalize_sql = functools.lru_cache(maxsize=1024)(_normalize_sql)
+
+
+def _is_position(tokens):
+    """
+    Return whether a number following `tokens` is a column position of an
+    ORDER BY or GROUP BY clause.
+    """
+    i = len(tokens)
+    # Skip the previous positions of the list.
+    while i >= 2 and tokens[i - 1] == ',':
+        i -= 2
+    if i >= 1 and tokens[i - 1] == '(':
+        i -= 1
+    return i >= 2 and tokens[i - 2] in ('order', 'group') and tokens[i - 1] == 'by'
+
+
+def _reduce_lists(tokens):
+    """
+    Replace the lists of literals of IN (...) and VALUES (...), (...) with
+    ( ... ), and LIMIT ?, ? with LIMIT ...
+    """
+    reduced = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in ('in', 'values', 'value') and tokens[i + 1:i + 2] == ['(']:
+            end = i + 1
+            # Consume the parenthesized groups made only of literals.
+            while end < len(tokens) and tokens[end] == '(':
+                close = end + 1
+                while close < len(tokens) and tokens[close] in ('?', ','):
+                    close += 1
+                if close == end + 1 or close >= len(tokens) or tokens[close] != ')':
+                    break
+                end = close + 1
+                if token == 'in' or tokens[end:end + 1] != [',']:
+                    break
+                end += 1
+            if end > i + 1 and tokens[end - 1] == ')':
+                reduced.extend([token, '(', '...', ')'])
+                i = end
+                continue
+        if token == 'limit' and tokens[i + 1:i + 4] == ['?', ',', '?']:
+            reduced.extend(['limit', '...'])
+            i += 4
+            continue
+        reduced.append(token)
+        i += 1
+    return reduced
+
+
+_tag = ContextVar('django_tidb_statement_tag', default=None)
+
+
+def get_statement_tag():
+    return _tag.get()
+
+
+@contextmanager
+def statement_tag(tag):
+    """
+    Tag the statements run inside the block with a /* tag */ comment, e.g.
+    statement_tag('billing:nightly_invoices').
+    """
+    token = _tag.set(tag)
+    try:
+        yield
+    finally:
+        _tag.reset(token)
+
+
+def view_tag(resolver_match):
+    """Return the 'app:view' tag of a resolved URL."""
+    func = getattr(resolver_match.func, 'view_class', resolver_match.func)
+    app = resolver_match.app_name or func.__module__.split('.')[0]
+    return '%s:%s' % (app, resolver_match.url_name or func.__name__)
+
+
+def tag_sql(sql, tag, formatted):
+    """
+    Append the /* tag */ comment to `sql`. `formatted` tells whether the
+    statement goes through %-formatting of its parameters.
+    """
+    tag = tag.replace('*/', '* /').replace('\n', ' ')
+    if formatted:
+        tag = tag.replace('%', '%%')
+    return '%s /* %s */' % (sql, tag)
+
+
+class StatementTagMiddleware:
+    """
+    Tag the statements run while handling a request with the
+    /* app:view */ of the view, see view_tag().
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _tag.set(None)
+        try:
+            return self.get_response(request)
+        finally:
+            _tag.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.resolver_match is not None:
+            _tag.set(view_tag(request.resolver_match))
+
+
+class QueryInstrumentation:
+    """
+    An execute wrapper recording the latency, row count, retries and error
+    of each statement to the metrics sinks, and optionally tagging the
+    statement with a comment.
+    """
+    def __init__(self, sinks, tag_statements=False):
+        self.sinks = sinks
+        self.tag_statements = tag_statements
+
+    def __call__(self, execute, sql, params, many, context):
+        connection = context['connection']
+        digest_text, digest = normalize_sql(sql)
+        tag = get_statement_tag() if self.tag_statements else None
+        if tag:
+            sql = tag_sql(sql, tag, many or params is not None)
+        retries = connection.statement_retries
+        error = None
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            rows = None
+            if error is None:
+                rows = context['cursor'].rowcount
+                rows = rows if rows is not None and rows >= 0 else None
+            self.record(QueryRecord(
+                connection.alias, digest, digest_text, sql, duration, rows,
+                connection.statement_retries - retries, error, tag,
+            ))
+
+    def record(self, record):
+        for sink in self.sinks:
+            try:
+                sink.record(record)
+            except Exception:
+                # Metrics must not break the queries.
+                logger.exception('Metrics sink %r failed.', sink)
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sinks(sinks):
+    """
+    Return the sinks of OPTIONS['tidb_metrics_sinks']: sink instances, or
+    dotted paths to sink instances or classes. Classes are instantiated once
+    per process.
+    """
+    result = []
+    for sink in sinks:
+        if isinstance(sink, str):
+            with _sinks_lock:
+                if sink not in _sinks:
+                    try:
+                        obj = import_string(sink)
+                    except ImportError as e:
+                        raise ImproperlyConfigured('Invalid metrics sink %r: %s' % (sink, e))
+                    _sinks[sink] = obj() if isinstance(obj, type) else obj
+                sink = _sinks[sink]
+        result.append(sink)
+    return result
+
+
+class MetricsSink:
+    """Receive a QueryRecord for each executed statement."""
+    def record(self, record):
+        raise NotImplementedError('Subclasses of MetricsSink must provide a record() method.')
+
+
+class DigestStats:
+    """Aggregated statistics of the statements of one digest."""
+    def __init__(self, alias, digest, digest_text, buckets):
+        self.alias = alias
+        self.digest = digest
+        self.digest_text = digest_text
+        self.buckets = buckets
+        # The last count is for the durations above the largest bucket.
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.rows = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    def __repr__(self):
+        return '<DigestStats %s count=%d mean=%.6f>' % (self.digest_text[:60], self.count, self.mean)
+
+    def add(self, record):
+        self.count += 1
+        self.errors += record.error is not None
+        self.retries += record.retries
+        self.rows += record.rows or 0
+        self.total_time += record.duration
+        self.max_time = max(self.max_time, record.duration)
+        self.bucket_counts[bisect.bisect_left(self.buckets, record.duration)] += 1
+
+    @property
+    def mean(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket holding the `q` quantile (0 to
+        1) of the durations, or the maximum duration past the last bucket.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.bucket_counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max_time
+
+
+class HistogramSink(MetricsSink):
+    """
+    Aggregate latency histograms and counters per database alias and
+    digest, in process. stats() returns a copy of the current statistics.
+    """
+    def __init__(self, buckets=default_buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, record):
+        key = (record.alias, record.digest)
+        with self.lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = DigestStats(record.alias, record.digest, record.digest_text, self.buckets)
+            stats.add(record)
+
+    def stats(self):
+        """Return the DigestStats of each (alias, digest), slowest first."""
+        with self.lock:
+            stats = []
+            for item in self._stats.values():
+                copy = DigestStats(item.alias, item.digest, item.digest_text, item.buckets)
+                copy.__dict__.update(item.__dict__, bucket_counts=list(item.bucket_counts))
+                stats.append(copy)
+        return sorted(stats, key=lambda item: item.total_time, reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self._stats.clear()
+
+
+class LoggingSink(MetricsSink):
+    """
+    Log each statement on the 'django_tidb.queries' logger, at DEBUG level,
+    or at WARNING level when it failed or took at least `slow_threshold`
+    seconds. With `only_slow`, the other statements aren't logged.
+    """
+    def __init__(self, slow_threshold=None, only_slow=False, logger=logger):
+        self.slow_threshold = slow_threshold
+        self.only_slow = only_slow
+        self.logger = logger
+
+    def record(self, record):
+        slow = self.slow_threshold is not None and record.duration >= self.slow_threshold
+        if record.error is None and not slow and self.only_slow:
+            return
+        level = logging.WARNING if slow or record.error is not None else logging.DEBUG
+        self.logger.log(
+            level, '(%.3f) digest=%s rows=%s retries=%d error=%s; %s',
+            record.duration, record.digest, record.rows, record.retries,
+            type(record.error).__name__ if record.error is not None else None, record.sql,
+            extra={'query': record},
+        )
+
+
+class PrometheusSink(MetricsSink):
+    """
+    Export the statements as prometheus_client metrics, labelled by
+    database alias and digest:
+
+        <namespace>_query_duration_seconds (histogram)
+        <namespace>_query_errors_total
+        <namespace>_query_retries_total
+        <namespace>_query_rows_total
+    """
+    def __init__(self, registry=None, namespace='django_tidb', buckets=default_buckets):
+        try:
+            import prometheus_client
+        except ImportError as e:
+            raise ImproperlyConfigured('PrometheusSink requires prometheus_client: %s' % e)
+        kwargs = {'namespace': namespace}
+        if registry is not None:
+            kwargs['registry'] = registry
+        labels = ['alias', 'digest']
+        self.duration = prometheus_client.Histogram(
+            'query_duration_seconds', 'Duration of the statements.', labels, buckets=buckets, **kwargs,
+        )
+        self.errors = prometheus_client.Counter(
+            'query_errors', 'Statements which raised an error.', labels + ['error'], **kwargs,
+        )
+        self.retries = prometheus_client.Counter('query_retries', 'Retries of the statements.', labels, **kwargs)
+        self.rows = prometheus_client.Counter('query_rows', 'Rows returned or affected.', labels, **kwargs)
+
+    def record(self, record):
+        labels = (record.alias, record.digest)
+        self.duration.labels(*labels).observe(record.duration)
+        if record.error is not None:
+            self.errors.labels(*labels, type(record.error).__name__).inc()
+        if record.retries:
+            self.retries.labels(*labels).inc(record.retries)
+        if record.rows:
+            self.rows.labels(*labels).inc(record.rows)
+
+
+# The default in process sink, 'django_tidb.instrumentation.histograms'.
+histograms = HistogramSink()
@@ -1,4 +1,6 @@
-from collections import namedtuple
+import re
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
 
 from django.db.backends.base.introspection import (
     BaseDatabaseIntrospection, FieldInfo as BaseFieldInfo, TableInfo,
@@ -8,96 +10,226 @@ from django.db.backends.mysql.introspection import (
 )
 from django.db.models import Index
 from django.utils.datastructures import OrderedSet
+from MySQLdb.constants import FIELD_TYPE
+
+from .fields import AutoRandomFieldMixin
 
 FieldInfo = namedtuple('FieldInfo', BaseFieldInfo._fields + ('extra', 'is_unsigned', 'has_json_constraint'))
 InfoLine = namedtuple(
     'InfoLine',
-    'col_name data_type max_len num_prec num_scale extra column_default '
-    'collation is_unsigned'
+    'table_name col_name data_type max_len num_prec num_scale extra column_default '
+    'collation is_unsigned is_nullable'
 )
 
 
 class DatabaseIntrospection(MysqlDatabaseIntrospection):
+    # The extra of an AUTO_RANDOM column, e.g. auto_random, AUTO_RANDOM(6) or
+    # AUTO_RANDOM(6, 54).
+    auto_random_re = re.compile(
+        r'\bauto_random\b(?:\s*\(\s*(?P<shard_bits>\d+)\s*(?:,\s*(?P<range_bits>\d+)\s*)?\))?',
+        re.IGNORECASE,
+    )
+    auto_random_default_range_bits = 64
+    # The type codes cursor.description reports for information_schema
+    # data types.
+    data_type_codes = {
+        'tinyint': FIELD_TYPE.TINY,
+        'smallint': FIELD_TYPE.SHORT,
+        'mediumint': FIELD_TYPE.INT24,
+        'int': FIELD_TYPE.LONG,
+        'bigint': FIELD_TYPE.LONGLONG,
+        'float': FIELD_TYPE.FLOAT,
+        'double': FIELD_TYPE.DOUBLE,
+        'decimal': FIELD_TYPE.NEWDECIMAL,
+        'bit': FIELD_TYPE.BIT,
+        'date': FIELD_TYPE.DATE,
+        'time': FIELD_TYPE.TIME,
+        'datetime': FIELD_TYPE.DATETIME,
+        'timestamp': FIELD_TYPE.TIMESTAMP,
+        'year': FIELD_TYPE.YEAR,
+        'char': FIELD_TYPE.STRING,
+        'binary': FIELD_TYPE.STRING,
+        'enum': FIELD_TYPE.STRING,
+        'set': FIELD_TYPE.STRING,
+        'varchar': FIELD_TYPE.VAR_STRING,
+        'varbinary': FIELD_TYPE.VAR_STRING,
+        'tinytext': FIELD_TYPE.BLOB,
+        'text': FIELD_TYPE.BLOB,
+        'mediumtext': FIELD_TYPE.BLOB,
+        'longtext': FIELD_TYPE.BLOB,
+        'tinyblob': FIELD_TYPE.BLOB,
+        'blob': FIELD_TYPE.BLOB,
+        'mediumblob': FIELD_TYPE.BLOB,
+        'longblob': FIELD_TYPE.BLOB,
+        'json': FIELD_TYPE.JSON,
+        'geometry': FIELD_TYPE.GEOMETRY,
+    }
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._snapshot = None
+
+    def get_field_type(self, data_type, description):
+        if self.auto_random_re.search(description.extra):
+            return 'django_tidb.fields.BigAutoRandomField'
+        return super().get_field_type(data_type, description)
+
+    def get_field_params(self, data_type, description):
+        """
+        Return the keyword arguments of the field type of get_field_type()
+        which Django's inspectdb doesn't know about.
+        """
+        match = self.auto_random_re.search(description.extra)
+        if not match:
+            return {}
+        # Keep the bits that differ from the defaults so that the model
+        # round-trips without a later migration altering the column.
+        params = {}
+        if match['shard_bits'] and int(match['shard_bits']) != AutoRandomFieldMixin.default_shard_bits:
+            params['shard_bits'] = int(match['shard_bits'])
+        if match['range_bits'] and int(match['range_bits']) != self.auto_random_default_range_bits:
+            params['range_bits'] = int(match['range_bits'])
+        return params
+
+    @contextmanager
+    def snapshot(self, cursor, table_names=None):
+        """
+        Load the columns, constraints and indexes of all tables (or of
+        `table_names`) in a handful of information_schema queries. Inside the
+        block, get_table_description(), get_constraints() and
+        get_relations() are answered from that snapshot instead of querying
+        each table. The snapshot isn't updated by schema changes.
+        """
+        table_names = list(table_names) if table_names else None
+        descriptions = self._get_table_descriptions(cursor, table_names)
+        self._snapshot = {
+            'descriptions': descriptions,
+            'constraints': self._get_constraints(cursor, table_names, descriptions),
+        }
+        try:
+            yield
+        finally:
+            self._snapshot = None
+
     def get_table_description(self, cursor, table_name):
         """
         Return a description of the table with the DB-API cursor.description
         interface."
         """
-        json_constraints = {}
+        if self._snapshot is not None and table_name in self._snapshot['descriptions']:
+            return self._snapshot['descriptions'][table_name]
+        return self._get_table_descriptions(cursor, [table_name]).get(table_name, [])
+
+    def get_constraints(self, cursor, table_name):
+        """
+        Retrieve any constraints or keys (unique, pk, fk, check, index) across
+        one or more columns.
+        """
+        if self._snapshot is not None and table_name in self._snapshot['descriptions']:
+            return self._snapshot['constraints'].get(table_name, {})
+        return self._get_constraints(cursor, [table_name]).get(table_name, {})
+
+    def get_key_columns(self, cursor, table_name):
+        """
+        Return a list of (column_name, referenced_table_name, referenced_column_name)
+        for all key columns in the given table.
+        """
+        if self._snapshot is None or table_name not in self._snapshot['descriptions']:
+            return super().get_key_columns(cursor, table_name)
+        return [
+            (constraint['columns'][0], *constraint['foreign_key'])
+            for constraint in self._snapshot['constraints'].get(table_name, {}).values()
+            if constraint['foreign_key']
+        ]
+
+    def _table_filter(self, column, table_names):
+        """
+        Return the SQL and params restricting `column` to `table_names`, or
+        nothing to cover all tables of the database.
+        """
+        if table_names is None:
+            return '', []
+        return 'AND %s IN (%s)' % (column, ', '.join(['%s'] * len(table_names))), list(table_names)
+
+    def _get_table_descriptions(self, cursor, table_names):
+        """
+        Return a dict mapping table names to their description, built from
+        information_schema only.
+        """
+        json_constraints = defaultdict(set)
         if self.connection.features.can_introspect_json_field:
             # JSON data type is an alias for LONGTEXT in MariaDB, select
             # JSON_VALID() constraints to introspect JSONField.
+            filter_sql, filter_params = self._table_filter('c.table_name', table_names)
             cursor.execute("""
-                SELECT c.constraint_name AS column_name
+                SELECT c.table_name, c.constraint_name AS column_name
                 FROM information_schema.check_constraints AS c
                 WHERE
-                    c.table_name = %s AND
                     LOWER(c.check_clause) = 'json_valid(`' + LOWER(c.constraint_name) + '`)' AND
-                    c.constraint_schema = DATABASE()
-            """, [table_name])
-            json_constraints = {row[0] for row in cursor.fetchall()}
-        # A default collation for the given table.
-        cursor.execute("""
-            SELECT  table_collation
-            FROM    information_schema.tables
-            WHERE   table_schema = DATABASE()
-            AND     table_name = %s
-        """, [table_name])
-        row = cursor.fetchone()
-        default_column_collation = row[0] if row else ''
+                    c.constraint_schema = DATABASE() %s
+            """ % filter_sql, filter_params)
+            for table_name, column_name in cursor.fetchall():
+                json_constraints[table_name].add(column_name)
         # information_schema database gives more accurate results for some figures:
         # - varchar length returned by cursor.description is an internal length,
         #   not visible length (#5725)
         # - precision and scale (for decimal fields) (#5014)
         # - auto_increment is not available in cursor.description
+        # The default collation of each table is joined in so that only the
+        # collations which differ from it are reported.
+        filter_sql, filter_params = self._table_filter('c.table_name', table_names)
         cursor.execute("""
             SELECT
-                column_name, data_type, character_maximum_length,
-                numeric_precision, numeric_scale, extra, column_default,
+                c.table_name, c.column_name, c.data_type, c.character_maximum_length,
+                c.numeric_precision, c.numeric_scale, c.extra, c.column_default,
                 CASE
-                    WHEN collation_name = %s THEN NULL
-                    ELSE collation_name
+                    WHEN c.collation_name = t.table_collation THEN NULL
+                    ELSE c.collation_name
                 END AS collation_name,
                 CASE
-                    WHEN column_type LIKE '%% unsigned' THEN 1
+                    WHEN c.column_type LIKE '%%%% unsigned' THEN 1
                     ELSE 0
-                END AS is_unsigned
-            FROM information_schema.columns
-            WHERE table_name = %s AND table_schema = DATABASE()
-        """, [default_column_collation, table_name])
-        field_info = {line[0]: InfoLine(*line) for line in cursor.fetchall()}
-
-        cursor.execute("SELECT * FROM %s LIMIT 1" % self.connection.ops.quote_name(table_name))
+                END AS is_unsigned,
+                c.is_nullable
+            FROM information_schema.columns AS c
+            LEFT JOIN information_schema.tables AS t
+                ON t.table_schema = c.table_schema AND t.table_name = c.table_name
+            WHERE c.table_schema = DATABASE() %s
+            ORDER BY c.table_name, c.ordinal_position
+        """ % filter_sql, filter_params)
 
         def to_int(i):
             return int(i) if i is not None else i
 
-        fields = []
-        for line in cursor.description:
-            info = field_info[line[0]]
-            fields.append(FieldInfo(
-                *line[:3],
-                to_int(info.max_len) or line[3],
-                to_int(info.num_prec) or line[4],
-                to_int(info.num_scale) or line[5],
-                line[6],
+        descriptions = defaultdict(list)
+        for line in cursor.fetchall():
+            info = InfoLine(*line)
+            descriptions[info.table_name].append(FieldInfo(
+                info.col_name,
+                self.data_type_codes.get(info.data_type.lower()),
+                None,
+                to_int(info.max_len),
+                to_int(info.num_prec),
+                to_int(info.num_scale),
+                info.is_nullable == 'YES',
                 info.column_default,
                 info.collation,
                 info.extra,
                 info.is_unsigned,
-                line[0] in json_constraints,
+                info.col_name in json_constraints[info.table_name],
             ))
-        return fields
+        return descriptions
 
-    def get_constraints(self, cursor, table_name):
+    def _get_constraints(self, cursor, table_names, descriptions=None):
         """
-        Retrieve any constraints or keys (unique, pk, fk, check, index) across
-        one or more columns.
+        Return a dict mapping table names to their constraints, see
+        get_constraints().
         """
-        constraints = {}
+        constraints = defaultdict(dict)
         # Get the actual constraint names and columns
+        filter_sql, filter_params = self._table_filter('kc.table_name', table_names)
         name_query = """
-            SELECT kc.`constraint_name`, kc.`column_name`,
+            SELECT kc.`table_name`, kc.`constraint_name`, kc.`column_name`,
                 kc.`referenced_table_name`, kc.`referenced_column_name`,
                 c.`constraint_type`
             FROM
@@ -106,15 +238,16 @@ class DatabaseIntrospection(MysqlDatabaseIntrospection):
             WHERE
                 kc.table_schema = DATABASE() AND
                 c.table_schema = kc.table_schema AND
+                c.table_name = kc.table_name AND
                 c.constraint_name = kc.constraint_name AND
-                c.constraint_type != 'CHECK' AND
-                kc.table_name = %s
-            ORDER BY kc.`ordinal_position`
-        """
-        cursor.execute(name_query, [table_name])
-        for constraint, column, ref_table, ref_column, kind in cursor.fetchall():
-            if constraint not in constraints:
-                constraints[constraint] = {
+                c.constraint_type != 'CHECK' %s
+            ORDER BY kc.`table_name`, kc.`ordinal_position`
+        """ % filter_sql
+        cursor.execute(name_query, filter_params)
+        for table_name, constraint, column, ref_table, ref_column, kind in cursor.fetchall():
+            table_constraints = constraints[table_name]
+            if constraint not in table_constraints:
+                table_constraints[constraint] = {
                     'columns': OrderedSet(),
                     'primary_key': kind == 'PRIMARY KEY',
                     'unique': kind in {'PRIMARY KEY', 'UNIQUE'},
@@ -123,14 +256,16 @@ class DatabaseIntrospection(MysqlDatabaseIntrospection):
                     'foreign_key': (ref_table, ref_column) if ref_column else None,
                 }
                 if self.connection.features.supports_index_column_ordering:
-                    constraints[constraint]['orders'] = []
-            constraints[constraint]['columns'].add(column)
+                    table_constraints[constraint]['orders'] = []
+            table_constraints[constraint]['columns'].add(column)
         # Add check constraints.
         if self.connection.features.can_introspect_check_constraints:
             unnamed_constraints_index = 0
-            columns = {info.name for info in self.get_table_description(cursor, table_name)}
+            if descriptions is None:
+                descriptions = self._get_table_descriptions(cursor, table_names)
+            filter_sql, filter_params = self._table_filter('tc.table_name', table_names)
             type_query = """
-                    SELECT cc.constraint_name, cc.check_clause
+                    SELECT tc.table_name, cc.constraint_name, cc.check_clause
                     FROM
                         information_schema.check_constraints AS cc,
                         information_schema.table_constraints AS tc
@@ -138,11 +273,11 @@ class DatabaseIntrospection(MysqlDatabaseIntrospection):
                         cc.constraint_schema = DATABASE() AND
                         tc.table_schema = cc.constraint_schema AND
                         cc.constraint_name = tc.constraint_name AND
-                        tc.constraint_type = 'CHECK' AND
-                        tc.table_name = %s
-                """
-            cursor.execute(type_query, [table_name])
-            for constraint, check_clause in cursor.fetchall():
+                        tc.constraint_type = 'CHECK' %s
+                """ % filter_sql
+            cursor.execute(type_query, filter_params)
+            for table_name, constraint, check_clause in cursor.fetchall():
+                columns = {info.name for info in descriptions[table_name]}
                 constraint_columns = self._parse_constraint_columns(check_clause, columns)
                 # Ensure uniqueness of unnamed constraints. Unnamed unique
                 # and check columns constraints have the same name as
@@ -150,7 +285,7 @@ class DatabaseIntrospection(MysqlDatabaseIntrospection):
                 if set(constraint_columns) == {constraint}:
                     unnamed_constraints_index += 1
                     constraint = '__unnamed_constraint_%s__' % unnamed_constraints_index
-                constraints[constraint] = {
+                constraints[table_name][constraint] = {
                     'columns': constraint_columns,
                     'primary_key': False,
                     'unique': False,
@@ -159,26 +294,32 @@ class DatabaseIntrospection(MysqlDatabaseIntrospection):
                     'foreign_key': None,
                 }
         # Now add in the indexes
-        cursor.execute("SHOW INDEX FROM %s" % self.connection.ops.quote_name(table_name))
-        for table, non_unique, index, colseq, column, order, type_ in [
-            x[:6] + (x[10],) for x in cursor.fetchall()
-        ]:
-            if index not in constraints:
-                constraints[index] = {
+        filter_sql, filter_params = self._table_filter('table_name', table_names)
+        cursor.execute("""
+            SELECT table_name, non_unique, index_name, column_name, collation, index_type
+            FROM information_schema.statistics
+            WHERE table_schema = DATABASE() %s
+            ORDER BY table_name, index_name, seq_in_index
+        """ % filter_sql, filter_params)
+        for table, non_unique, index, column, order, type_ in cursor.fetchall():
+            table_constraints = constraints[table]
+            if index not in table_constraints:
+                table_constraints[index] = {
                     'columns': OrderedSet(),
                     'primary_key': False,
-                    'unique': not non_unique,
+                    'unique': not int(non_unique),
                     'check': False,
                     'foreign_key': None,
                 }
                 if self.connection.features.supports_index_column_ordering:
-                    constraints[index]['orders'] = []
-            constraints[index]['index'] = True
-            constraints[index]['type'] = Index.suffix if type_ == 'BTREE' else type_.lower()
-            constraints[index]['columns'].add(column)
+                    table_constraints[index]['orders'] = []
+            table_constraints[index]['index'] = True
+            table_constraints[index]['type'] = Index.suffix if type_ == 'BTREE' else type_.lower()
+            table_constraints[index]['columns'].add(column)
             if self.connection.features.supports_index_column_ordering:
-                constraints[index]['orders'].append('DESC' if order == 'D' else 'ASC')
+                table_constraints[index]['orders'].append('DESC' if order == 'D' else 'ASC')
         # Convert the sorted sets to lists
-        for constraint in constraints.values():
-            constraint['columns'] = list(constraint['columns'])
+        for table_constraints in constraints.values():
+            for constraint in table_constraints.values():
+                constraint['columns'] = list(constraint['columns'])
         return constraints
@@ -0,0 +1,125 @@
+import os
+import tempfile
+from collections.abc import Mapping
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import AutoField
+
+# Escaping of MySQL's default LOAD DATA format: tab separated, backslash
+# escaped, \N for NULL.
+escapes = {
+    ord('\\'): b'\\\\',
+    ord('\t'): b'\\t',
+    ord('\n'): b'\\n',
+    ord('\r'): b'\\r',
+    0: b'\\0',
+}
+escaped_bytes = bytes(escapes)
+
+
+def encode_value(value):
+    """Return the LOAD DATA encoding of a value prepared for the database."""
+    if value is None:
+        return b'\\N'
+    if isinstance(value, bool):
+        return b'1' if value else b'0'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+    else:
+        value = str(value).encode()
+    if any(byte in value for byte in escaped_bytes):
+        value = b''.join(escapes.get(byte, bytes((byte,))) for byte in value)
+    return value
+
+
+def bulk_load(model, rows, fields=None, using=None, chunk_size=100000):
+    """
+    Insert `rows`, an iterable of model instances, of dicts mapping field
+    names to values or of tuples of values in the order of `fields`, with
+    LOAD DATA LOCAL INFILE. Rows are converted with the fields' database
+    preparation, written `chunk_size` at a time to a temporary file and
+    loaded chunk by chunk, so memory stays bounded whatever the number of
+    rows. Return the number of rows loaded.
+
+    `fields` defaults to the concrete fields but the auto-incremented
+    primary key. The values of model instances go through the fields'
+    pre_save(), as in bulk_create(), e.g. for auto_now fields. Dicts and
+    tuples must give a value for those fields. No signals are sent and the
+    primary keys of the instances aren't set. Requires 'local_infile': 1 in
+    OPTIONS.
+    """
+    using = using or DEFAULT_DB_ALIAS
+    connection = connections[using]
+    if not connection.settings_dict['OPTIONS'].get('local_infile'):
+        raise ImproperlyConfigured("bulk_load() requires 'local_infile': 1 in the database OPTIONS.")
+    opts = model._meta
+    if fields is None:
+        fields = [field for field in opts.concrete_fields if not isinstance(field, AutoField)]
+    else:
+        fields = [opts.pk if name == 'pk' else opts.get_field(name) for name in fields]
+    if any(not field.concrete or field.many_to_many for field in fields):
+        raise ValueError('bulk_load() can only be used with concrete fields.')
+    sql = (
+        "LOAD DATA LOCAL INFILE %%s INTO TABLE %s CHARACTER SET utf8mb4 "
+        "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' (%s)" % (
+            connection.ops.quote_name(opts.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+        )
+    )
+    loaded = 0
+    fd, path = tempfile.mkstemp(prefix='django_tidb_', suffix='.tsv')
+    try:
+        with os.fdopen(fd, 'w+b') as file:
+            count = 0
+            for row in rows:
+                file.write(b'\t'.join(
+                    encode_value(_prepare(field, value, connection))
+                    for field, value in zip(fields, _row_values(row, fields))
+                ))
+                file.write(b'\n')
+                count += 1
+                if count == chunk_size:
+                    loaded += _load(connection, sql, file, path)
+                    count = 0
+            if count:
+                loaded += _load(connection, sql, file, path)
+    finally:
+        os.remove(path)
+    return loaded
+
+
+def _row_values(row, fields):
+    if isinstance(row, Mapping):
+        values = [row[field.name] if field.name in row else field.get_default() for field in fields]
+    elif isinstance(row, (list, tuple)):
+        if len(row) != len(fields):
+            raise ValueError('bulk_load() rows must have %d values, got %d.' % (len(fields), len(row)))
+        values = row
+    else:
+        return [field.pre_save(row, add=True) for field in fields]
+    for field, value in zip(fields, values):
+        # Their value is only computed by pre_save(), LOAD DATA would turn
+        # the missing value into a NULL or zero date with a mere warning.
+        if value is None and (getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)):
+            raise ValueError(
+                'bulk_load() rows given as dicts or tuples must have a value for %s, only model '
+                'instances get the values of auto_now and auto_now_add fields.' % field.name
+            )
+    return values
+
+
+def _prepare(field, value, connection):
+    if hasattr(value, 'resolve_expression'):
+        raise TypeError('bulk_load() can\'t load the expression %r of %s.' % (value, field.name))
+    return field.get_db_prep_save(value, connection)
+
+
+def _load(connection, sql, file, path):
+    file.flush()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [path])
+        rows = cursor.rowcount
+    file.seek(0)
+    file.truncate()
+    return rows
@@ -0,0 +1,32 @@
+from django.core.management.commands import inspectdb
+from django.db import connections
+
+
+class Command(inspectdb.Command):
+    def handle_inspection(self, options):
+        # The module of the fields of this backend, such as
+        # BigAutoRandomField, is only known to be needed once the tables are
+        # inspected.
+        lines = list(self._handle_inspection(options))
+        fields_used = any('django_tidb.fields.' in line for line in lines)
+        for line in lines:
+            yield line
+            if fields_used and line == 'from %s import models' % self.db_module:
+                yield 'import django_tidb.fields'
+
+    def _handle_inspection(self, options):
+        connection = connections[options['database']]
+        if not hasattr(connection.introspection, 'snapshot'):
+            yield from super().handle_inspection(options)
+            return
+        # Introspect all the tables up front instead of running several
+        # queries per table.
+        with connection.cursor() as cursor:
+            with connection.introspection.snapshot(cursor, options['table']):
+                yield from super().handle_inspection(options)
+
+    def get_field_type(self, connection, table_name, row):
+        field_type, field_params, field_notes = super().get_field_type(connection, table_name, row)
+        if hasattr(connection.introspection, 'get_field_params'):
+            field_params.update(connection.introspection.get_field_params(row.type_code, row))
+        return field_type, field_params, field_notes
@@ -0,0 +1,15 @@
+from django.core.management.commands import makemigrations
+
+from django_tidb.autodetector import MigrationAutodetector
+
+
+class Command(makemigrations.Command):
+    def handle(self, *app_labels, **options):
+        # makemigrations has no hook for the autodetector class, swap it in
+        # for the duration of the command so Meta.tidb_options are diffed.
+        autodetector_class = makemigrations.MigrationAutodetector
+        makemigrations.MigrationAutodetector = MigrationAutodetector
+        try:
+            return super().handle(*app_labels, **options)
+        finally:
+            makemigrations.MigrationAutodetector = autodetector_class
@@ -0,0 +1,79 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, router
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the missing indexes of ForeignKey columns. TiDB adds indexes '
+        'online, without blocking reads and writes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'app_label', nargs='*',
+            help='App labels of the models to check, all the installed apps by default.',
+        )
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Nominates a database to create the indexes on. Defaults to the "default" database.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print the CREATE INDEX statements.',
+        )
+        parser.add_argument('--worker-cnt', type=int, help='tidb_ddl_reorg_worker_cnt of the index builds.')
+        parser.add_argument('--batch-size', type=int, help='tidb_ddl_reorg_batch_size of the index builds.')
+
+    def handle(self, *app_labels, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'tidb':
+            raise CommandError("Database '%s' isn't a TiDB database." % options['database'])
+        try:
+            app_configs = [apps.get_app_config(app_label) for app_label in app_labels] or apps.get_app_configs()
+        except LookupError as e:
+            raise CommandError(str(e))
+        models = [
+            model
+            for app_config in app_configs
+            for model in app_config.get_models()
+            if model._meta.managed and not model._meta.proxy and
+            router.allow_migrate_model(connection.alias, model)
+        ]
+        with connection.cursor() as cursor:
+            table_names = set(connection.introspection.table_names(cursor))
+            models = [model for model in models if model._meta.db_table in table_names]
+            with connection.introspection.snapshot(cursor, [model._meta.db_table for model in models]):
+                missing = [
+                    (model, field)
+                    for model in models
+                    for field in self.unindexed_foreign_keys(connection, cursor, model)
+                ]
+        if not missing:
+            self.stdout.write('All ForeignKey columns are indexed.')
+            return
+        with connection.schema_editor(collect_sql=options['dry_run'], atomic=False) as editor:
+            with editor.ddl_reorg(worker_cnt=options['worker_cnt'], batch_size=options['batch_size']):
+                for model, field in missing:
+                    if options['verbosity'] >= 1:
+                        self.stdout.write('Indexing %s.%s' % (model._meta.label, field.name))
+                    editor.execute(editor._create_index_sql(model, fields=[field]))
+        if options['dry_run']:
+            self.stdout.write('\n'.join(editor.collected_sql))
+
+    def unindexed_foreign_keys(self, connection, cursor, model):
+        """
+        Return the ForeignKeys of `model` whose column isn't the first
+        column of an index.
+        """
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        indexed = {
+            constraint['columns'][0]
+            for constraint in constraints.values()
+            if constraint['index'] or constraint['unique']
+        }
+        return [
+            field
+            for field in model._meta.local_concrete_fields
+            if field.get_internal_type() == 'ForeignKey' and field.db_index and field.column not in indexed
+        ]
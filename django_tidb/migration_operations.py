@@ -0,0 +1,229 @@
+import threading
+
+from django.db import connections
+from django.db.migrations.operations.base import Operation
+from django.db.migrations.operations.models import ModelOptionOperation
+
+
+class AlterTiDBOptions(ModelOptionOperation):
+    """
+    Change Meta.tidb_options (SHARD_ROW_ID_BITS, PRE_SPLIT_REGIONS,
+    partitioning) of a model. Without a 'tiflash_replica' key, the replica
+    count set by SetTiFlashReplica is kept.
+    """
+
+    def __init__(self, name, tidb_options):
+        self.tidb_options = tidb_options
+        super().__init__(name)
+
+    def deconstruct(self):
+        kwargs = {
+            'name': self.name,
+            'tidb_options': self.tidb_options,
+        }
+        return (
+            self.__class__.__qualname__,
+            [],
+            kwargs
+        )
+
+    def state_forwards(self, app_label, state):
+        model_state = state.models[app_label, self.name_lower]
+        tidb_options = dict(self.tidb_options or {})
+        old_tidb_options = model_state.options.get('tidb_options') or {}
+        if 'tiflash_replica' not in tidb_options and 'tiflash_replica' in old_tidb_options:
+            tidb_options['tiflash_replica'] = old_tidb_options['tiflash_replica']
+        if tidb_options:
+            model_state.options['tidb_options'] = tidb_options
+        else:
+            model_state.options.pop('tidb_options', None)
+        state.reload_model(app_label, self.name_lower, delay=True)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        new_model = to_state.apps.get_model(app_label, self.name)
+        if (
+            self.allow_migrate_model(schema_editor.connection.alias, new_model) and
+            hasattr(schema_editor, 'alter_tidb_options')
+        ):
+            old_model = from_state.apps.get_model(app_label, self.name)
+            schema_editor.alter_tidb_options(
+                new_model,
+                getattr(old_model._meta, 'tidb_options', None),
+                getattr(new_model._meta, 'tidb_options', None),
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        return self.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return "Change TiDB table options on %s" % self.name
+
+    @property
+    def migration_name_fragment(self):
+        return 'alter_%s_tidb_options' % self.name_lower
+
+
+class SetTiFlashReplica(ModelOptionOperation):
+    """
+    Set the number of TiFlash replicas of a model's table and, by default,
+    wait until they are available. The count is kept in
+    Meta.tidb_options['tiflash_replica'].
+    """
+
+    def __init__(self, name, count, wait=True, timeout=None):
+        self.count = count
+        self.wait = wait
+        self.timeout = timeout
+        super().__init__(name)
+
+    def deconstruct(self):
+        kwargs = {
+            'name': self.name,
+            'count': self.count,
+        }
+        if not self.wait:
+            kwargs['wait'] = self.wait
+        if self.timeout is not None:
+            kwargs['timeout'] = self.timeout
+        return (
+            self.__class__.__qualname__,
+            [],
+            kwargs
+        )
+
+    def state_forwards(self, app_label, state):
+        model_state = state.models[app_label, self.name_lower]
+        tidb_options = {**model_state.options.get('tidb_options', {}), 'tiflash_replica': self.count}
+        if not self.count:
+            del tidb_options['tiflash_replica']
+        if tidb_options:
+            model_state.options['tidb_options'] = tidb_options
+        else:
+            model_state.options.pop('tidb_options', None)
+        state.reload_model(app_label, self.name_lower, delay=True)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        new_model = to_state.apps.get_model(app_label, self.name)
+        if (
+            self.allow_migrate_model(schema_editor.connection.alias, new_model) and
+            hasattr(schema_editor, 'set_tiflash_replica')
+        ):
+            tidb_options = getattr(new_model._meta, 'tidb_options', None) or {}
+            schema_editor.set_tiflash_replica(
+                new_model, tidb_options.get('tiflash_replica', 0), wait=self.wait, timeout=self.timeout,
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        return self.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return "Set %d TiFlash replica(s) on %s" % (self.count, self.name)
+
+    @property
+    def migration_name_fragment(self):
+        return 'set_%s_tiflash_replica' % self.name_lower
+
+
+class ReorgDDL(Operation):
+    """
+    Run `operations`, such as AddIndex or AlterField, with the given DDL
+    reorg settings (see DatabaseSchemaEditor.ddl_reorg()). With
+    `concurrent`, the operations run at the same time, each on its own
+    connection, so that e.g. indexes on different tables are built
+    concurrently.
+    """
+
+    serialization_expand_args = ['operations']
+
+    def __init__(self, operations, concurrent=False, worker_cnt=None, batch_size=None, fast_reorg=None):
+        self.operations = operations
+        self.concurrent = concurrent
+        self.worker_cnt = worker_cnt
+        self.batch_size = batch_size
+        self.fast_reorg = fast_reorg
+
+    def deconstruct(self):
+        kwargs = {'operations': self.operations}
+        for name in ('concurrent', 'worker_cnt', 'batch_size', 'fast_reorg'):
+            if getattr(self, name) not in (None, False):
+                kwargs[name] = getattr(self, name)
+        return (
+            self.__class__.__qualname__,
+            [],
+            kwargs
+        )
+
+    @property
+    def reversible(self):
+        return all(operation.reversible for operation in self.operations)
+
+    def state_forwards(self, app_label, state):
+        for operation in self.operations:
+            operation.state_forwards(app_label, state)
+
+    def _states(self, app_label, state):
+        """Return the (operation, from_state, to_state) of each operation."""
+        states = []
+        for operation in self.operations:
+            to_state = state.clone()
+            operation.state_forwards(app_label, to_state)
+            states.append((operation, state, to_state))
+            state = to_state
+        return states
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self._run(schema_editor, [
+            (operation.database_forwards, app_label, old_state, new_state)
+            for operation, old_state, new_state in self._states(app_label, from_state)
+        ])
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self._run(schema_editor, [
+            (operation.database_backwards, app_label, new_state, old_state)
+            for operation, old_state, new_state in reversed(self._states(app_label, to_state))
+        ])
+
+    def _run(self, schema_editor, steps):
+        if not hasattr(schema_editor, 'ddl_reorg'):
+            for method, app_label, from_state, to_state in steps:
+                method(app_label, schema_editor, from_state, to_state)
+            return
+        with schema_editor.ddl_reorg(self.worker_cnt, self.batch_size, self.fast_reorg):
+            if not self.concurrent or schema_editor.collect_sql:
+                for method, app_label, from_state, to_state in steps:
+                    method(app_label, schema_editor, from_state, to_state)
+                return
+            for method, app_label, from_state, to_state in steps:
+                # Render the models before the states are shared by threads.
+                from_state.apps, to_state.apps
+            # The other connections don't see the buffered ALTER TABLE
+            # clauses of the previous operations.
+            schema_editor.flush_alter()
+            errors = []
+            threads = [
+                threading.Thread(target=self._run_on_new_connection, args=(schema_editor, errors, *step))
+                for step in steps
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+
+    def _run_on_new_connection(self, schema_editor, errors, method, app_label, from_state, to_state):
+        # Connections are per thread, this one is only used by this operation.
+        connection = connections[schema_editor.connection.alias]
+        try:
+            with connection.schema_editor(atomic=False) as editor:
+                editor.ddl_progress_callback = schema_editor.ddl_progress_callback
+                method(app_label, editor, from_state, to_state)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    def describe(self):
+        return 'Run %d operation(s)%s with DDL reorg settings' % (
+            len(self.operations), ' concurrently' if self.concurrent else '',
+        )
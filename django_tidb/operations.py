@@ -1,9 +1,52 @@
+import datetime
+import decimal
+import re
+
+from django.conf import settings
 from django.db.backends.mysql.operations import (
     DatabaseOperations as MysqlDatabaseOperations,
 )
+from django.utils import timezone
+
 
 class DatabaseOperations(MysqlDatabaseOperations):
+    compiler_module = "django_tidb.compiler"
+
+    # https://docs.pingcap.com/tidb/stable/optimizer-hints
+    optimizer_hints = {
+        # Query block
+        'QB_NAME',
+        # Join algorithms and order
+        'MERGE_JOIN', 'TIDB_SMJ', 'NO_MERGE_JOIN', 'INL_JOIN', 'TIDB_INLJ', 'NO_INDEX_JOIN',
+        'INL_HASH_JOIN', 'NO_INDEX_HASH_JOIN', 'INL_MERGE_JOIN', 'NO_INDEX_MERGE_JOIN',
+        'HASH_JOIN', 'TIDB_HJ', 'NO_HASH_JOIN', 'HASH_JOIN_BUILD', 'HASH_JOIN_PROBE',
+        'SHUFFLE_JOIN', 'BROADCAST_JOIN', 'LEADING', 'STRAIGHT_JOIN', 'SEMI_JOIN_REWRITE',
+        'NO_DECORRELATE', 'MERGE',
+        # Aggregation
+        'HASH_AGG', 'STREAM_AGG', 'MPP_1PHASE_AGG', 'MPP_2PHASE_AGG', 'AGG_TO_COP', 'LIMIT_TO_COP',
+        # Index and storage selection
+        'USE_INDEX', 'FORCE_INDEX', 'IGNORE_INDEX', 'ORDER_INDEX', 'NO_ORDER_INDEX',
+        'USE_INDEX_MERGE', 'NO_INDEX_MERGE', 'READ_FROM_STORAGE', 'USE_TOJA',
+        # Statement
+        'MAX_EXECUTION_TIME', 'MEMORY_QUOTA', 'READ_CONSISTENT_REPLICA', 'IGNORE_PLAN_CACHE',
+        'USE_CASCADES', 'NTH_PLAN', 'RESOURCE_GROUP', 'SET_VAR',
+    }
+    # The defaults of bulk_batch_size().
+    bulk_batch_bytes = 1024 * 1024
+    bulk_batch_sample_size = 100
+    # The separators of each value, and its CASE WHEN ... THEN in
+    # bulk_update().
+    bulk_value_overhead = 16
+
+    optimizer_hint_re = re.compile(r'^\s*(?P<name>[A-Za-z_][A-Za-z0-9_]*)\s*(\(.*\))?\s*$', re.DOTALL)
+
     def explain_query_prefix(self, format=None, **options):
+        analyze = options.pop('analyze', False)
+        if options:
+            raise ValueError('Unknown options: %s' % ', '.join(sorted(options.keys())))
+        prefix = self.explain_prefix
+        if analyze and self.connection.features.supports_explain_analyze:
+            prefix += ' ANALYZE'
         if format:
             supported_formats = self.connection.features.supported_explain_formats
             normalized_format = format.upper()
@@ -12,17 +55,109 @@ class DatabaseOperations(MysqlDatabaseOperations):
                 if supported_formats:
                     msg += ' Allowed formats: %s' % ', '.join(sorted(supported_formats))
                 raise ValueError(msg)
-        if options:
-            raise ValueError('Unknown options: %s' % ', '.join(sorted(options.keys())))
-        analyze = options.pop('analyze', False)
-        prefix = self.explain_prefix
-        if analyze and self.connection.features.supports_explain_analyze:
-            prefix += ' ANALYZE'
-        if format and not analyze:
-            # Only TiDB supports the analyze option with formats but with "ROW".
-            prefix += ' FORMAT=\"%s\"' % format
+            if analyze and normalized_format == 'DOT':
+                # EXPLAIN ANALYZE only has the row based formats.
+                raise ValueError('The DOT format is not supported with analyze.')
+            prefix += ' FORMAT="%s"' % normalized_format
         return prefix
 
+    def check_optimizer_hint(self, hint):
+        """
+        Raise ValueError if `hint`, such as 'USE_INDEX(t, idx)', isn't an
+        optimizer hint supported by TiDB.
+        """
+        match = self.optimizer_hint_re.match(hint)
+        if not match or '*/' in hint:
+            raise ValueError('%r is not a valid optimizer hint.' % hint)
+        if match['name'].upper() not in self.optimizer_hints:
+            raise ValueError(
+                '%s is not a recognized optimizer hint. Allowed hints: %s' % (
+                    match['name'], ', '.join(sorted(self.optimizer_hints)),
+                )
+            )
+
+    def optimizer_hints_sql(self, hints):
+        for hint in hints:
+            self.check_optimizer_hint(hint)
+        return '/*+ %s */' % ' '.join(hint.strip() for hint in hints)
+
+    def read_from_storage_hint(self, engine, tables):
+        return 'READ_FROM_STORAGE(%s[%s])' % (engine.upper(), ', '.join(tables))
+
+    def as_of_sql(self, timestamp):
+        """
+        Return the AS OF TIMESTAMP clause of a stale read at `timestamp`, a
+        datetime or a timedelta into the past.
+        """
+        if isinstance(timestamp, datetime.timedelta):
+            return 'AS OF TIMESTAMP NOW(6) - INTERVAL %s MICROSECOND', (
+                abs(timestamp) // datetime.timedelta(microseconds=1),
+            )
+        if not settings.USE_TZ and timezone.is_naive(timestamp):
+            return 'AS OF TIMESTAMP %s', (self.adapt_datetimefield_value(timestamp),)
+        if timezone.is_naive(timestamp):
+            # As DateTimeField does.
+            timestamp = timezone.make_aware(timestamp, timezone.get_default_timezone())
+        # A datetime literal would be read in the session time zone, which
+        # isn't necessarily the one of the connection.
+        epoch = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+        return 'AS OF TIMESTAMP FROM_UNIXTIME(%s)', (
+            decimal.Decimal((timestamp - epoch) // datetime.timedelta(microseconds=1)).scaleb(-6),
+        )
+
+    def non_transactional_dml_sql(self, table, column, batch_size):
+        """
+        Return the prefix splitting a DELETE or UPDATE statement into
+        batches of `batch_size` rows of `column`, each run in its own
+        transaction.
+        """
+        return 'BATCH ON %s.%s LIMIT %d' % (self.quote_name(table), self.quote_name(column), batch_size)
+
+    def on_duplicate_key_update_sql(self, fields):
+        """
+        Return the clause updating `fields` of the existing row with the
+        values of the conflicting INSERT.
+        """
+        return 'ON DUPLICATE KEY UPDATE %s' % ', '.join(
+            '%s = VALUES(%s)' % (self.quote_name(field.column), self.quote_name(field.column))
+            for field in fields
+        )
+
+    def bulk_batch_size(self, fields, objs):
+        """
+        Return how many objects fit in one multi-row INSERT (or CASE WHEN
+        UPDATE of bulk_update()) of at most OPTIONS['tidb_bulk_batch_bytes']
+        bytes of values, based on the largest row of a sample of `objs`.
+        Small batches waste round trips while large ones hit TiDB's
+        transaction and entry size limits.
+        """
+        budget = self.connection.settings_dict['OPTIONS'].get('tidb_bulk_batch_bytes', self.bulk_batch_bytes)
+        # The deletion collector passes the names of the fields of the
+        # related models, which aren't values of `objs`.
+        if not budget or not objs or any(isinstance(field, str) and field != 'pk' for field in fields):
+            return super().bulk_batch_size(fields, objs)
+        step = max(1, len(objs) // self.bulk_batch_sample_size)
+        row_size = max(self.estimate_row_size(fields, obj) for obj in objs[::step])
+        return max(1, min(len(objs), budget // row_size))
+
+    def estimate_row_size(self, fields, obj):
+        """Return the approximate size of the SQL values of `fields` of `obj`."""
+        size = 2
+        for field in fields:
+            # bulk_update() passes 'pk' for the primary key lookups.
+            value = obj.pk if field == 'pk' else getattr(obj, field.attname, None)
+            size += self.bulk_value_overhead
+            if value is None or isinstance(value, (bool, int, float, decimal.Decimal)):
+                size += len(str(value))
+            elif isinstance(value, (bytes, bytearray, memoryview)):
+                # Hex literal.
+                size += 2 * len(value) + 3
+            elif isinstance(value, str):
+                size += len(value.encode()) + 2
+            else:
+                size += len(str(value)) + 2
+        return size
+
     def regex_lookup(self, lookup_type):
         # REGEXP BINARY doesn't work correctly in MySQL 8+ and REGEXP_LIKE
         # doesn't exist in MySQL 5.x or in MariaDB.
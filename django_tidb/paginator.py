@@ -0,0 +1,108 @@
+import base64
+import collections.abc
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .query import keyset_filter, keyset_order_by, keyset_ordering
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    DjangoJSONEncoder, but keeping the microseconds of datetimes and times:
+    truncated keys would repeat or skip objects between pages.
+    """
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by seeking past the key of the last object of the
+    previous page instead of using an OFFSET, so that every page costs the
+    same however deep it is. On a table with a clustered primary key,
+    ordering by the primary key reads each page as a single range.
+
+    Pages are addressed by opaque cursors, there are no page numbers or
+    total count.
+    """
+    def __init__(self, object_list, per_page, ordering='pk'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = keyset_ordering(object_list.model._meta, ordering)
+
+    def page(self, after=None, before=None):
+        """
+        Return the page following the `after` cursor, or preceding the
+        `before` cursor, or the first page.
+        """
+        if after is not None and before is not None:
+            raise ValueError("Pass either 'after' or 'before', not both.")
+        reverse = before is not None
+        queryset = self.object_list.order_by(*keyset_order_by(self.ordering, reverse))
+        cursor = before if reverse else after
+        if cursor is not None:
+            queryset = queryset.filter(keyset_filter(self.ordering, self.decode_cursor(cursor), reverse))
+        objects = list(queryset[:self.per_page + 1])
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+        if reverse:
+            objects.reverse()
+            return KeysetPage(objects, self, has_next=True, has_previous=has_more)
+        return KeysetPage(objects, self, has_next=has_more, has_previous=cursor is not None)
+
+    def encode_cursor(self, obj):
+        values = [getattr(obj, field.attname) for field, descending in self.ordering]
+        return base64.urlsafe_b64encode(json.dumps(values, cls=CursorEncoder).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                raise ValueError
+            return [field.to_python(value) for (field, descending), value in zip(self.ordering, values)]
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidCursor('Invalid cursor %r.' % cursor)
+
+
+class KeysetPage(collections.abc.Sequence):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<KeysetPage of %d objects>' % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next and bool(self.object_list)
+
+    def has_previous(self):
+        return self._has_previous and bool(self.object_list)
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    def next_cursor(self):
+        """The cursor of the next page, pass it as `after`."""
+        return self.paginator.encode_cursor(self.object_list[-1]) if self.has_next() else None
+
+    def previous_cursor(self):
+        """The cursor of the previous page, pass it as `before`."""
+        return self.paginator.encode_cursor(self.object_list[0]) if self.has_previous() else None
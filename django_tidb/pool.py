@@ -0,0 +1,215 @@
+import itertools
+import threading
+import time
+from collections import deque
+
+from django.core.exceptions import ImproperlyConfigured
+from MySQLdb import Error as DatabaseError
+
+
+class Endpoint:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        # Connections handed out and not released yet.
+        self.active = 0
+        # (connection, time it was released)
+        self.idle = deque()
+        self.failures = 0
+        self.retry_at = 0
+
+    def __repr__(self):
+        return '<Endpoint %s:%s>' % (self.host, self.port)
+
+    def is_available(self, now):
+        return self.retry_at <= now
+
+
+class ConnectionPool:
+    """
+    Spread the connections of a database over several tidb-server
+    endpoints and keep the released ones for reuse.
+
+    Endpoints are picked round-robin or by the least number of active
+    connections. An endpoint that refuses a connection is skipped for a
+    backoff period which doubles on every consecutive failure. Idle
+    connections are pinged before reuse once they have been idle for longer
+    than `health_check_interval` seconds.
+    """
+    strategies = {'round-robin', 'least-connections'}
+
+    def __init__(self, endpoints, strategy='round-robin', size=0,
+                 health_check_interval=30, backoff=1, max_backoff=60):
+        if strategy not in self.strategies:
+            raise ImproperlyConfigured(
+                "Invalid load balancing strategy '%s' specified.\n"
+                "Use one of %s." % (strategy, ', '.join("'%s'" % s for s in sorted(self.strategies)))
+            )
+        if not endpoints:
+            raise ImproperlyConfigured('At least one endpoint is required.')
+        self.endpoints = [Endpoint(host, port) for host, port in endpoints]
+        self.strategy = strategy
+        self.size = size
+        self.health_check_interval = health_check_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        # Maps id(connection) to the endpoint of the connections handed out.
+        self._checked_out = {}
+
+    def _candidates(self):
+        """Return the endpoints to try, in order of preference."""
+        now = time.monotonic()
+        start = next(self._counter) % len(self.endpoints)
+        endpoints = self.endpoints[start:] + self.endpoints[:start]
+        if self.strategy == 'least-connections':
+            endpoints.sort(key=lambda endpoint: endpoint.active)
+        available = [endpoint for endpoint in endpoints if endpoint.is_available(now)]
+        if not available:
+            # Every endpoint is backing off, try them all rather than fail
+            # without a connection attempt.
+            available = sorted(endpoints, key=lambda endpoint: endpoint.retry_at)
+        return available
+
+    def acquire(self, conn_params, connect):
+        """
+        Return a connection to one of the endpoints, reusing an idle one if
+        possible. `connect` opens a new connection from `conn_params`.
+        """
+        with self._lock:
+            candidates = self._candidates()
+        error = None
+        for endpoint in candidates:
+            connection = self._reuse(endpoint)
+            if connection is None:
+                try:
+                    connection = connect({**conn_params, 'host': endpoint.host, 'port': endpoint.port})
+                except DatabaseError as e:
+                    error = e
+                    self._mark_failed(endpoint)
+                    continue
+            with self._lock:
+                endpoint.failures = 0
+                endpoint.retry_at = 0
+                endpoint.active += 1
+                self._checked_out[id(connection)] = endpoint
+            return connection
+        raise error
+
+    def _reuse(self, endpoint):
+        while True:
+            with self._lock:
+                if not endpoint.idle:
+                    return None
+                connection, released_at = endpoint.idle.pop()
+            if time.monotonic() - released_at < self.health_check_interval:
+                return connection
+            try:
+                connection.ping()
+            except DatabaseError:
+                self._close(connection)
+            else:
+                return connection
+
+    def _mark_failed(self, endpoint):
+        with self._lock:
+            endpoint.failures += 1
+            delay = min(self.backoff * 2 ** (endpoint.failures - 1), self.max_backoff)
+            endpoint.retry_at = time.monotonic() + delay
+            # The idle connections of a dead server are useless.
+            idle = list(endpoint.idle)
+            endpoint.idle.clear()
+        for connection, released_at in idle:
+            self._close(connection)
+
+    def release(self, connection, reusable=True):
+        """
+        Return a connection to the pool, or close it if it isn't `reusable`
+        or the pool is full.
+        """
+        with self._lock:
+            endpoint = self._checked_out.pop(id(connection), None)
+            if endpoint is not None:
+                endpoint.active -= 1
+        if endpoint is None or not reusable or not self.size:
+            self._close(connection)
+            return
+        try:
+            # Don't leak an open transaction to the next user.
+            if not connection.get_autocommit():
+                connection.rollback()
+        except DatabaseError:
+            self._close(connection)
+            return
+        with self._lock:
+            if len(endpoint.idle) < self.size and endpoint.is_available(time.monotonic()):
+                endpoint.idle.append((connection, time.monotonic()))
+                return
+        self._close(connection)
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle = [connection for endpoint in self.endpoints for connection, _ in endpoint.idle]
+            for endpoint in self.endpoints:
+                endpoint.idle.clear()
+        for connection in idle:
+            self._close(connection)
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except DatabaseError:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def parse_endpoints(endpoints, default_port):
+    """
+    Normalize a list of 'host', 'host:port' or (host, port) items to
+    (host, port) tuples.
+    """
+    parsed = []
+    for endpoint in endpoints:
+        if isinstance(endpoint, str):
+            host, _, port = endpoint.partition(':')
+        else:
+            host, port = endpoint
+        parsed.append((host, int(port) if port else default_port))
+    return parsed
+
+
+def get_pool(settings_dict):
+    """
+    Return the pool shared by the connections of this process configured
+    with `settings_dict`.
+    """
+    options = settings_dict['OPTIONS']
+    default_port = int(settings_dict['PORT']) if settings_dict['PORT'] else 4000
+    endpoints = parse_endpoints(
+        options.get('tidb_endpoints') or [(settings_dict['HOST'] or 'localhost', default_port)],
+        default_port,
+    )
+    # Sessions are only shared by databases with the same OPTIONS, most of
+    # them (isolation_level, tidb_replica_read, init_command, ...) change
+    # the state of the session.
+    key = (
+        tuple(endpoints),
+        settings_dict['NAME'],
+        settings_dict['USER'],
+        tuple(sorted((name, repr(value)) for name, value in options.items())),
+    )
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                endpoints,
+                strategy=options.get('tidb_load_balancing', 'round-robin'),
+                size=options.get('tidb_pool_size', 0),
+                health_check_interval=options.get('tidb_pool_health_check_interval', 30),
+                backoff=options.get('tidb_endpoint_backoff', 1),
+            )
+        return _pools[key]
@@ -0,0 +1,180 @@
+import re
+import threading
+from collections import OrderedDict
+
+from MySQLdb import DatabaseError, OperationalError
+
+# Statements worth preparing: DML with positional parameters.
+preparable_re = re.compile(r'^\s*(?:SELECT|INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+placeholder_re = re.compile(r'%([s%])')
+# The quoted strings and identifiers of a statement, or a placeholder.
+statement_token_re = re.compile(
+    r"""(?P<quoted>'(?:[^'\\]|\\.|'')*'|"(?:[^"\\]|\\.|"")*"|`(?:[^`]|``)*`)|%(?P<placeholder>[s%])""",
+    re.DOTALL,
+)
+
+# "Unknown prepared statement handler", the statement was deallocated on the
+# server.
+UNKNOWN_STATEMENT_ERROR_CODE = 1243
+
+# Bumped by the schema editors of this process after running DDL, the
+# prepared statements of every connection are forgotten on their next use.
+_schema_generation = 0
+_schema_generation_lock = threading.Lock()
+
+
+def invalidate_prepared_statements():
+    global _schema_generation
+    with _schema_generation_lock:
+        _schema_generation += 1
+
+
+def prepared_sql(query, param_count):
+    """
+    Return `query`, in the format of MySQLdb, with ? placeholders, or None
+    if it can't be prepared as is, such as when MySQLdb would interpolate a
+    placeholder inside a quoted string.
+    """
+    parts = []
+    count = 0
+    position = 0
+    for match in statement_token_re.finditer(query):
+        parts.append(query[position:match.start()])
+        position = match.end()
+        if match['quoted']:
+            # quoted_parts alternates the text and the 's' or '%' of each
+            # placeholder.
+            quoted_parts = placeholder_re.split(match['quoted'])
+            if 's' in quoted_parts[1::2]:
+                return None
+            parts.append(''.join(part if i % 2 == 0 else '%' for i, part in enumerate(quoted_parts)))
+        elif match['placeholder'] == 's':
+            parts.append('?')
+            count += 1
+        else:
+            parts.append('%')
+    parts.append(query[position:])
+    if count != param_count:
+        return None
+    return ''.join(parts)
+
+
+class PreparedStatements:
+    """
+    The statements prepared on one connection, least recently used first,
+    mapping the SQL to the name of the statement on the server.
+
+    There are at most `size` statements. Their names are reused: preparing
+    a statement under the name of the evicted one replaces it on the server,
+    so there's no need to deallocate it.
+    """
+    # Long IN lists and bulk inserts would evict the hot statements.
+    max_parameters = 100
+
+    def __init__(self, size):
+        self.size = size
+        self.statements = OrderedDict()
+        self.clear()
+
+    def __len__(self):
+        return len(self.statements)
+
+    def clear(self):
+        self.statements.clear()
+        self.free_names = ['django_tidb_stmt_%d' % i for i in reversed(range(self.size))]
+        self.generation = _schema_generation
+
+    def preparable(self, sql, params):
+        return (
+            isinstance(params, (list, tuple)) and 0 < len(params) <= self.max_parameters and
+            '?' not in sql and preparable_re.match(sql) is not None
+        )
+
+    def get(self, sql):
+        """Return the name of the statement `sql` is prepared as, or None."""
+        if self.generation != _schema_generation:
+            self.clear()
+        name = self.statements.get(sql)
+        if name is not None:
+            self.statements.move_to_end(sql)
+        return name
+
+    def add(self, sql):
+        """Return the name to prepare `sql` as, evicting the least recently used statement if needed."""
+        if self.free_names:
+            name = self.free_names.pop()
+        else:
+            name = self.statements.popitem(last=False)[1]
+        self.statements[sql] = name
+        return name
+
+    def discard(self, sql):
+        name = self.statements.pop(sql, None)
+        if name is not None:
+            self.free_names.append(name)
+
+
+class PreparedCursor:
+    """
+    Wrap a MySQLdb cursor to run parameterized statements as server side
+    prepared statements, so that TiDB can reuse their plan from its
+    prepared plan cache instead of optimizing each execution:
+
+        PREPARE django_tidb_stmt_0 FROM 'SELECT ... WHERE id = ?'
+        SET @django_tidb_p0 = 42; EXECUTE django_tidb_stmt_0 USING @django_tidb_p0
+
+    Each statement is prepared once per connection, then executed with a
+    single round trip.
+    """
+    def __init__(self, cursor, statements):
+        self.cursor = cursor
+        self.statements = statements
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def execute(self, query, args=None):
+        if not self.statements.preparable(query, args):
+            return self.cursor.execute(query, args)
+        name = self.statements.get(query)
+        if name is None:
+            name = self.prepare(query, len(args))
+            if name is None:
+                return self.cursor.execute(query, args)
+        try:
+            return self._execute(name, args)
+        except OperationalError as e:
+            if e.args[0] != UNKNOWN_STATEMENT_ERROR_CODE:
+                raise
+        # The statement is gone from the server, e.g. after a reconnection.
+        self.statements.clear()
+        return self.cursor.execute(query, args)
+
+    def prepare(self, query, param_count):
+        sql = prepared_sql(query, param_count)
+        if sql is None:
+            return None
+        name = self.statements.add(query)
+        try:
+            self.cursor.execute('PREPARE %s FROM %%s' % name, [sql])
+        except DatabaseError:
+            # Let the statement run unprepared, and fail there if it's
+            # invalid.
+            self.statements.discard(query)
+            return None
+        return name
+
+    def _execute(self, name, args):
+        variables = ['@django_tidb_p%d' % i for i in range(len(args))]
+        self.cursor.execute(
+            'SET %s; EXECUTE %s USING %s' % (
+                ', '.join('%s = %%s' % variable for variable in variables), name, ', '.join(variables),
+            ),
+            args,
+        )
+        # The result is the one of the EXECUTE.
+        self.cursor.nextset()
+        return self.cursor.rowcount
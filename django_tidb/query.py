@@ -0,0 +1,408 @@
+import datetime
+import threading
+from collections import namedtuple
+
+from django.db import NotSupportedError, connections
+from django.db.models import AutoField, Manager, Q, QuerySet, sql
+from django.db.models.query import ModelIterable
+from django.db.transaction import TransactionManagementError
+from django.utils.functional import partition
+
+from .explain import Plan
+from .fields import AutoRandomFieldMixin
+from .load import bulk_load
+
+# Progress of batch_delete() / batch_update(). `rows` is None when TiDB
+# ran the batches itself, it doesn't report the number of affected rows.
+BatchResult = namedtuple('BatchResult', 'batches rows')
+
+
+def keyset_ordering(opts, order_by):
+    """
+    Return the (field, descending) pairs of the keyset ordering `order_by`,
+    a field name or a sequence of them, optionally prefixed with '-'. The
+    primary key is appended when it's missing to make the ordering unique.
+    """
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    ordering = []
+    for name in order_by:
+        descending = name.startswith('-')
+        name = name.lstrip('-')
+        field = opts.pk if name == 'pk' else opts.get_field(name)
+        if not field.concrete or field.is_relation and not field.many_to_one:
+            raise ValueError("Keyset ordering field '%s' must be a concrete field." % name)
+        ordering.append((field, descending))
+    if not any(field.primary_key for field, descending in ordering):
+        ordering.append((opts.pk, ordering[-1][1] if ordering else False))
+    return ordering
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Return a Q object selecting the rows after `values`, the key of a row,
+    in the keyset `ordering` (before it with `reverse`):
+
+        (a > x) OR (a = x AND b > y) OR ...
+    """
+    condition = Q()
+    for i, (field, descending) in enumerate(ordering):
+        lookup = 'lt' if descending != reverse else 'gt'
+        condition |= Q(
+            *[Q(**{f.attname: v}) for (f, _), v in zip(ordering[:i], values)],
+            **{'%s__%s' % (field.attname, lookup): values[i]}
+        )
+    return condition
+
+
+def keyset_order_by(ordering, reverse=False):
+    return ['%s%s' % ('-' if descending != reverse else '', field.attname) for field, descending in ordering]
+
+
+class TiDBQuerySet(QuerySet):
+    """QuerySet exposing TiDB specific features."""
+
+    def as_of(self, timestamp):
+        """
+        Read the data as it was at `timestamp`, a datetime or a timedelta
+        into the past. Stale reads can be served by any replica instead of
+        the region leader.
+        """
+        self._not_support_combined_queries('as_of')
+        if self.query.select_for_update:
+            raise NotSupportedError('Calling QuerySet.as_of() after select_for_update() is not supported.')
+        if not isinstance(timestamp, (datetime.datetime, datetime.timedelta)):
+            raise TypeError('as_of() requires a datetime or a timedelta, got %r.' % (timestamp,))
+        clone = self._chain()
+        clone.query.tidb_as_of = timestamp
+        return clone
+
+    def tidb_hints(self, *hints):
+        """
+        Add optimizer hints, such as 'USE_INDEX(app_model, idx)',
+        'HASH_JOIN(app_a, app_b)' or 'MAX_EXECUTION_TIME(1000)', to the
+        SELECT, UPDATE or DELETE statement of the queryset.
+        """
+        self._not_support_combined_queries('tidb_hints')
+        ops = connections[self.db].ops
+        for hint in hints:
+            ops.check_optimizer_hint(hint)
+        clone = self._chain()
+        clone.query.tidb_hints = (*getattr(self.query, 'tidb_hints', ()), *hints)
+        return clone
+
+    def read_from_storage(self, engine):
+        """
+        Read the tables of the queryset from `engine`: 'tiflash' for the
+        columnar replicas, which are much faster for large aggregations, or
+        'tikv'.
+        """
+        self._not_support_combined_queries('read_from_storage')
+        if engine not in ('tikv', 'tiflash'):
+            raise ValueError("read_from_storage() engine must be 'tikv' or 'tiflash', got %r." % (engine,))
+        clone = self._chain()
+        clone.query.tidb_read_storage = engine
+        return clone
+
+    def batch_delete(self, batch_size=1000, callback=None):
+        """
+        Delete the rows of the queryset in batches of `batch_size` rows, each
+        in its own transaction, and return a BatchResult. `callback` is
+        called with a BatchResult after each batch.
+
+        Like a raw DELETE, related objects aren't collected and no signals
+        are sent.
+        """
+        self._not_support_stale_read('batch_delete')
+        query = self.query.clone()
+        query.__class__ = sql.DeleteQuery
+        return self._batch_dml(
+            'batch_delete', query, batch_size, callback, 'supports_non_transactional_delete',
+            lambda queryset: queryset._raw_delete(queryset.db),
+        )
+
+    def batch_update(self, batch_size=1000, callback=None, **kwargs):
+        """
+        Update the rows of the queryset like update(**kwargs), in batches of
+        `batch_size` rows, each in its own transaction. See batch_delete().
+        """
+        self._not_support_stale_read('batch_update')
+        query = self.query.chain(sql.UpdateQuery)
+        query.add_update_values(kwargs)
+        query.annotations = {}
+        return self._batch_dml(
+            'batch_update', query, batch_size, callback, 'supports_non_transactional_update',
+            lambda queryset: queryset.update(**kwargs),
+        )
+
+    def keyset_iterator(self, order_by='pk', batch_size=1000):
+        """
+        Iterate over the objects of the queryset in `order_by` order, fetching
+        `batch_size` objects at a time. Each batch seeks past the key of the
+        last object (WHERE pk > last) instead of using an OFFSET, so late
+        batches are as cheap as the first ones. The ordering fields must not
+        be NULL.
+        """
+        self._not_support_combined_queries('keyset_iterator')
+        if self.query.is_sliced:
+            raise TypeError('Cannot use keyset_iterator() once a slice has been taken.')
+        if self._iterable_class is not ModelIterable:
+            raise TypeError('keyset_iterator() requires a queryset of model instances.')
+        ordering = keyset_ordering(self.model._meta, order_by)
+        queryset = self.order_by(*keyset_order_by(ordering))
+        batch = list(queryset[:batch_size])
+        while batch:
+            yield from batch
+            if len(batch) < batch_size:
+                return
+            last = [getattr(batch[-1], field.attname) for field, descending in ordering]
+            batch = list(queryset.filter(keyset_filter(ordering, last))[:batch_size])
+
+    def explain_plan(self, *, format=None, analyze=False):
+        """
+        Return the execution plan of the queryset as a
+        django_tidb.explain.Plan. With `analyze`, the query is executed and
+        the plan has the actual row counts and execution info of each
+        operator.
+        """
+        query = self.query.clone()
+        query.explain_query = True
+        query.explain_format = format
+        query.explain_options = {'analyze': analyze}
+        sql, params = query.get_compiler(using=self.db).as_sql()
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return Plan.from_cursor(cursor)
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False, workers=None):
+        """
+        With `workers`, split the objects into batches (of `batch_size`, or
+        as large as bulk_batch_size() allows) and insert them with that many
+        threads, each on its own connection. Each batch is committed on its
+        own: when a batch fails, the batches already inserted remain.
+        """
+        objs = list(objs)
+        # Without objects, only the checks of Django are left.
+        if not workers or workers < 2 or not objs:
+            return super().bulk_create(objs, batch_size, ignore_conflicts)
+        self._parallel_batches(
+            'bulk_create', objs, self.model._meta.concrete_fields, batch_size, workers,
+            lambda queryset, batch: queryset.bulk_create(batch, ignore_conflicts=ignore_conflicts),
+        )
+        return objs
+
+    def bulk_update(self, objs, fields, batch_size=None, workers=None):
+        """
+        With `workers`, update the objects in batches with that many
+        threads, see bulk_create().
+        """
+        objs = list(objs)
+        if not workers or workers < 2 or not objs:
+            return super().bulk_update(objs, fields, batch_size)
+        self._parallel_batches(
+            'bulk_update', objs, ['pk', 'pk'] + [self.model._meta.get_field(name) for name in fields],
+            batch_size, workers, lambda queryset, batch: queryset.bulk_update(batch, fields),
+        )
+
+    def bulk_upsert(self, objs, update_fields, unique_fields=None, batch_size=None, workers=None):
+        """
+        Insert the objects, updating `update_fields` of the rows which
+        already exist instead, with batched
+        INSERT ... ON DUPLICATE KEY UPDATE col = VALUES(col).
+
+        A row exists when the primary key or any unique key conflicts,
+        TiDB doesn't allow choosing the key. `unique_fields` only checks
+        that these fields are the primary key or a unique key of the model.
+        The primary keys of the new objects aren't set. With
+        OPTIONS['tidb_pk_allocation'] = 'sequence', they are inserted with
+        primary keys from the allocator. `workers` works as in bulk_create().
+
+        Outside of an atomic block, each batch is committed on its own so
+        that large inputs stay within TiDB's transaction size limit: if a
+        batch fails, the previous ones are kept.
+        """
+        opts = self.model._meta
+        for parent in opts.get_parent_list():
+            if parent._meta.concrete_model is not opts.concrete_model:
+                raise ValueError("Can't bulk upsert a multi-table inherited model")
+        if not update_fields:
+            raise ValueError('Field names must be given to bulk_upsert().')
+        update_fields = [opts.get_field(name) for name in update_fields]
+        if any(not field.concrete or field.many_to_many for field in update_fields):
+            raise ValueError('bulk_upsert() can only be used with concrete fields.')
+        if any(field.primary_key for field in update_fields):
+            raise ValueError('bulk_upsert() cannot be used with primary key fields.')
+        if unique_fields is not None:
+            self._check_unique_fields(unique_fields)
+        objs = list(objs)
+        if not objs:
+            return objs
+        if workers and workers > 1:
+            self._parallel_batches(
+                'bulk_upsert', objs, opts.concrete_fields, batch_size, workers,
+                lambda queryset, batch: queryset.bulk_upsert(batch, [f.name for f in update_fields]),
+            )
+            return objs
+        self._for_write = True
+        self._prepare_for_bulk_create(objs)
+        connection = connections[self.db]
+        ops = connection.ops
+        objs_with_pk, objs_without_pk = partition(lambda obj: obj.pk is None, objs)
+        allocated = []
+        if (
+            objs_without_pk and connection.pk_allocation == 'sequence' and
+            isinstance(opts.pk, AutoField) and not isinstance(opts.pk, AutoRandomFieldMixin)
+        ):
+            # AUTO_INCREMENT values of the server could collide with the
+            # allocated ones.
+            allocated, objs_without_pk = objs_without_pk, []
+            for obj, pk_value in zip(allocated, connection.pk_allocator.allocate(connection, opts, len(allocated))):
+                obj.pk = pk_value
+        try:
+            for fields, group in (
+                (opts.concrete_fields, objs_with_pk + allocated),
+                ([f for f in opts.concrete_fields if not isinstance(f, AutoField)], objs_without_pk),
+            ):
+                if not group:
+                    continue
+                max_batch_size = max(ops.bulk_batch_size(fields, group), 1)
+                size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+                for i in range(0, len(group), size):
+                    query = sql.InsertQuery(self.model)
+                    query.insert_values(fields, group[i:i + size])
+                    query.tidb_on_duplicate_key_update = update_fields
+                    # A single statement, committed on its own in autocommit
+                    # mode.
+                    query.get_compiler(using=self.db).execute_sql()
+        finally:
+            # The row may have been updated through a unique key instead,
+            # the allocated primary key isn't necessarily its own.
+            for obj in allocated:
+                obj.pk = None
+        for obj in objs_with_pk:
+            obj._state.adding = False
+            obj._state.db = self.db
+        return objs
+
+    def bulk_load(self, rows, fields=None, chunk_size=100000):
+        """
+        Insert `rows` with LOAD DATA LOCAL INFILE, see
+        django_tidb.load.bulk_load().
+        """
+        self._for_write = True
+        return bulk_load(self.model, rows, fields, using=self.db, chunk_size=chunk_size)
+
+    def _check_unique_fields(self, unique_fields):
+        opts = self.model._meta
+        names = {opts.pk.name if name == 'pk' else opts.get_field(name).name for name in unique_fields}
+        unique_sets = [{opts.pk.name}]
+        unique_sets += [{field.name} for field in opts.concrete_fields if field.unique]
+        unique_sets += [set(fields) for fields in opts.unique_together]
+        unique_sets += [
+            set(constraint.fields) for constraint in opts.total_unique_constraints
+        ]
+        if names not in unique_sets:
+            raise ValueError(
+                'bulk_upsert() unique_fields %s must be the primary key or a unique key.' % (
+                    ', '.join(sorted(names)),
+                ))
+
+    def _parallel_batches(self, operation_name, objs, fields, batch_size, workers, run):
+        if connections[self.db].in_atomic_block:
+            raise TransactionManagementError(
+                "%s() with workers commits each batch on its own connection, "
+                "it can't be used inside an atomic block." % operation_name
+            )
+        if batch_size is None:
+            batch_size = connections[self.db].ops.bulk_batch_size(fields, objs)
+        batches = iter([objs[i:i + batch_size] for i in range(0, len(objs), batch_size)])
+        lock = threading.Lock()
+        errors = []
+
+        def worker():
+            # Connections are per thread, this one is only used by this worker.
+            try:
+                while not errors:
+                    with lock:
+                        batch = next(batches, None)
+                    if batch is None:
+                        return
+                    run(self._chain(), batch)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.db].close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+    def _batch_dml(self, operation_name, query, batch_size, callback, feature, run):
+        self._not_support_combined_queries(operation_name)
+        if self.query.is_sliced:
+            raise TypeError('Cannot use %s() once a slice has been taken.' % operation_name)
+        self._for_write = True
+        connection = connections[self.db]
+        if connection.in_atomic_block:
+            raise TransactionManagementError(
+                "%s() runs each batch in its own transaction, it can't be used "
+                "inside an atomic block." % operation_name
+            )
+        opts = self.model._meta
+        query.clear_ordering(True)
+        tables = [alias for alias in self.query.alias_map if self.query.alias_refcount[alias]]
+        if getattr(connection.features, feature) and len(tables) <= 1 and not self.query.distinct:
+            if getattr(query, 'related_updates', None):
+                # Only the first of the UPDATE statements would be batched.
+                raise ValueError(
+                    "%s() can't update the fields of parent models, use update() instead." % operation_name
+                )
+            # TiDB splits the statement into batches over the primary key.
+            sql, params = query.get_compiler(self.db).as_sql()
+            sql = '%s %s' % (connection.ops.non_transactional_dml_sql(opts.db_table, opts.pk.column, batch_size), sql)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                jobs = cursor.fetchone()[0]
+            result = BatchResult(int(jobs), None)
+            if callback:
+                callback(result)
+            return result
+        # Walk the primary keys of the matching rows in order.
+        pks = self.order_by('pk').values_list('pk', flat=True)
+        manager = self.model._base_manager.db_manager(self.db)
+        result = BatchResult(0, 0)
+        last_pk = None
+        while True:
+            batch = list((pks if last_pk is None else pks.filter(pk__gt=last_pk))[:batch_size])
+            if not batch:
+                return result
+            result = BatchResult(result.batches + 1, result.rows + run(manager.filter(pk__in=batch)))
+            last_pk = batch[-1]
+            if callback:
+                callback(result)
+
+    def update(self, **kwargs):
+        self._not_support_stale_read('update')
+        return super().update(**kwargs)
+
+    def delete(self):
+        self._not_support_stale_read('delete')
+        return super().delete()
+
+    def select_for_update(self, *args, **kwargs):
+        self._not_support_stale_read('select_for_update')
+        return super().select_for_update(*args, **kwargs)
+
+    def _not_support_stale_read(self, operation_name):
+        if getattr(self.query, 'tidb_as_of', None) is not None:
+            raise NotSupportedError(
+                'Calling QuerySet.%s() after as_of() is not supported.' % operation_name
+            )
+
+
+class TiDBManager(Manager.from_queryset(TiDBQuerySet)):
+    pass
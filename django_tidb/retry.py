@@ -0,0 +1,132 @@
+import functools
+import random
+import threading
+import time
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.backends.mysql.base import CursorWrapper as MysqlCursorWrapper
+from MySQLdb import OperationalError as DatabaseOperationalError
+
+from .transaction import atomic
+
+# TiDB errors after which running the statement or transaction again is
+# expected to succeed.
+RETRYABLE_ERROR_CODES = {
+    8002,  # SELECT FOR UPDATE write conflict
+    8022,  # Transaction commit failed, safe to retry
+    9001,  # PD server timeout
+    9007,  # Write conflict
+}
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+
+
+def is_retryable(exc):
+    return bool(exc.args) and exc.args[0] in RETRYABLE_ERROR_CODES
+
+
+def retry_counts():
+    """
+    Return the number of retries per (kind, error code) since the process
+    started, where kind is 'statement' or 'atomic'. Retries which ran out of
+    attempts are counted as (kind, 'exhausted').
+    """
+    with _counts_lock:
+        return dict(_counts)
+
+
+def reset_retry_counts():
+    with _counts_lock:
+        _counts.clear()
+
+
+def _count(kind, code):
+    with _counts_lock:
+        _counts[kind, code] += 1
+
+
+class RetryPolicy:
+    """
+    Retry a callable on retryable TiDB errors at most `attempts` more times,
+    sleeping a random delay of up to `base_delay * 2 ** retry` seconds
+    (capped at `max_delay`) between attempts. `on_retry` is called with the
+    error before each retry.
+    """
+    def __init__(self, attempts=3, base_delay=0.05, max_delay=1):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, retry):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def run(self, kind, func, *args, on_retry=None, **kwargs):
+        retry = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except (OperationalError, DatabaseOperationalError) as e:
+                if not is_retryable(e):
+                    raise
+                if retry >= self.attempts:
+                    _count(kind, 'exhausted')
+                    raise
+                _count(kind, e.args[0])
+                if on_retry is not None:
+                    on_retry(e)
+            time.sleep(self.delay(retry))
+            retry += 1
+
+
+class CursorWrapper(MysqlCursorWrapper):
+    """
+    Re-run statements which failed with a retryable error. A failed
+    statement is only run again in autocommit mode, inside a transaction the
+    whole transaction has to be retried, see retry_atomic().
+    """
+    def __init__(self, cursor, db):
+        super().__init__(cursor)
+        self.db = db
+
+    def execute(self, query, args=None):
+        if not self.db.get_autocommit():
+            return super().execute(query, args)
+        return self.db.retry_policy.run('statement', super().execute, query, args, on_retry=self._on_retry)
+
+    def executemany(self, query, args):
+        if not self.db.get_autocommit():
+            return super().executemany(query, args)
+        return self.db.retry_policy.run('statement', super().executemany, query, args, on_retry=self._on_retry)
+
+    def _on_retry(self, error):
+        self.db.statement_retries += 1
+
+
+def retry_atomic(using=None, attempts=3, base_delay=0.05, max_delay=1, mode=None):
+    """
+    Run the decorated function in atomic() and run it again, in a new
+    transaction, when it fails with a retryable error such as a write
+    conflict. The function must be safe to call more than once. `mode` is
+    passed to django_tidb.transaction.atomic().
+
+    Inside an outer atomic block the conflict aborts the outer transaction
+    as well, so the function isn't retried there.
+    """
+    if callable(using):
+        # Bare decorator: @retry_atomic
+        return retry_atomic()(using)
+    policy = RetryPolicy(attempts, base_delay, max_delay)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            def run():
+                with atomic(using=using, mode=mode):
+                    return func(*args, **kwargs)
+            if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+                return run()
+            return policy.run('atomic', run)
+        return inner
+    return decorator
@@ -1,9 +1,88 @@
+import logging
+import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import NotSupportedError
 from django.db.backends.mysql.schema import (
     DatabaseSchemaEditor as MysqlDatabaseSchemaEditor,
 )
+from django.utils.functional import cached_property
+
+from .fields import AutoRandomFieldMixin
+from .prepared import invalidate_prepared_statements
+
+logger = logging.getLogger('django_tidb.ddl')
+
+DDLJob = namedtuple('DDLJob', 'job_id table job_type schema_state row_count state')
+
+
+class PendingAlter:
+    """ALTER TABLE clauses buffered to be run as one statement."""
+    def __init__(self, table):
+        self.table = table
+        self.clauses = []
+        self.params = []
+        # The columns and indexes referenced by the clauses.
+        self.identifiers = set()
+
+
+class FlushAlter:
+    """
+    Placeholder in deferred_sql: executing it runs the pending ALTER TABLE.
+    It also keeps the migration executor from recording the migration
+    before the schema editor exits.
+    """
+    def __repr__(self):
+        return '<FlushAlter>'
+
+
+flush_alter = FlushAlter()
 
 
 class DatabaseSchemaEditor(MysqlDatabaseSchemaEditor):
+    sql_alter_table_options = 'ALTER TABLE %(table)s %(options)s'
+    sql_partition_by = 'PARTITION BY %(type)s (%(expression)s)'
+    sql_remove_partitioning = 'ALTER TABLE %(table)s REMOVE PARTITIONING'
+    sql_set_tiflash_replica = 'ALTER TABLE %(table)s SET TIFLASH REPLICA %(count)d'
+
+    # Statements which rewrite or backfill the rows of a table.
+    reorg_sql_re = re.compile(
+        r'^\s*(?:ALTER\s+TABLE\s+`?(?P<table>[^`\s]+)`?\s.*'
+        r'\b(?:ADD\s+(?:UNIQUE\s+)?(?:INDEX|KEY|CONSTRAINT)|MODIFY|CHANGE)\b'
+        r'|CREATE\s+(?:UNIQUE\s+)?INDEX\s+\S+\s+ON\s+`?(?P<index_table>[^`\s(]+)`?)',
+        re.IGNORECASE | re.DOTALL,
+    )
+    ddl_reorg_variables = {
+        'worker_cnt': 'tidb_ddl_reorg_worker_cnt',
+        'batch_size': 'tidb_ddl_reorg_batch_size',
+        'fast_reorg': 'tidb_ddl_enable_fast_reorg',
+    }
+    finished_ddl_job_states = {'done', 'synced', 'cancelled', 'rollback done'}
+    # ALTER TABLE clauses which TiDB can run together in a multi-schema
+    # change.
+    mergeable_alter_re = re.compile(
+        r'^ALTER TABLE (?P<table>`[^`]+`) (?P<clause>(?:ADD COLUMN|DROP COLUMN|MODIFY|CHANGE|ALTER COLUMN|'
+        r'RENAME COLUMN|RENAME (?:INDEX|KEY)|ADD (?:UNIQUE )?(?:INDEX|KEY)|DROP (?:INDEX|KEY)|'
+        r'ADD CONSTRAINT `[^`]+` UNIQUE) .*)$',
+        re.IGNORECASE | re.DOTALL,
+    )
+    mergeable_create_index_re = re.compile(
+        r'^CREATE (?P<unique>UNIQUE )?INDEX (?P<name>`[^`]+`) ON (?P<table>`[^`]+`) (?P<columns>\([^()]*\))$',
+        re.IGNORECASE,
+    )
+    mergeable_drop_index_re = re.compile(r'^DROP INDEX (?P<name>`[^`]+`) ON (?P<table>`[^`]+`)$', re.IGNORECASE)
+    unmergeable_alter_re = re.compile(r'\b(?:FOREIGN KEY|PRIMARY KEY|CHECK|PARTITION|AUTO_RANDOM)\b', re.IGNORECASE)
+
+    tidb_table_options = {
+        'shard_row_id_bits', 'pre_split_regions', 'clustered', 'partition', 'tiflash_replica', 'index_foreign_keys',
+    }
+    partition_types = {'RANGE', 'RANGE COLUMNS', 'LIST', 'LIST COLUMNS', 'HASH', 'KEY'}
+    integer_type_re = re.compile(r'(?:tiny|small|medium|big)?int(?:eger)?\b', re.IGNORECASE)
+
     @property
     def sql_delete_check(self):
         return 'ALTER TABLE %(table)s DROP CHECK %(name)s'
@@ -12,6 +91,388 @@ class DatabaseSchemaEditor(MysqlDatabaseSchemaEditor):
     def sql_rename_column(self):
         return 'ALTER TABLE %(table)s CHANGE %(old_column)s %(new_column)s %(type)s'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ddl_progress_interval = self.connection.settings_dict['OPTIONS'].get('tidb_ddl_progress_interval')
+        # Called with a DDLJob while a reorg statement runs, logs by default.
+        self.ddl_progress_callback = self.log_ddl_progress
+        self._pending_alter = None
+
+    def __enter__(self):
+        editor = super().__enter__()
+        self.connection.execute_wrappers.append(self._flush_alter_before_query)
+        return editor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            # The deferred statements may be merged as well, flush last.
+            if flush_alter in self.deferred_sql:
+                self.deferred_sql.remove(flush_alter)
+            if self.merge_alter_statements:
+                self.deferred_sql.append(flush_alter)
+        else:
+            self._pending_alter = None
+        try:
+            return super().__exit__(exc_type, exc_value, traceback)
+        finally:
+            self.connection.execute_wrappers.remove(self._flush_alter_before_query)
+
+    def _flush_alter_before_query(self, execute, sql, params, many, context):
+        # Queries run on the connection by other code, such as the ORM
+        # queries of a RunPython operation, see the buffered changes.
+        if self._pending_alter is not None:
+            self.flush_alter()
+        return execute(sql, params, many, context)
+
+    @cached_property
+    def merge_alter_statements(self):
+        return (
+            self.connection.settings_dict['OPTIONS'].get('tidb_merge_alter_statements', True) and
+            self.connection.features.supports_multi_schema_change
+        )
+
+    def execute(self, sql, params=()):
+        if sql is flush_alter:
+            return self.flush_alter()
+        # RunSQL passes the statements of the user as strings without params,
+        # run them as written.
+        user_sql = params is None and isinstance(sql, str)
+        alter = self._mergeable_alter(str(sql)) if self.merge_alter_statements and not user_sql else None
+        if alter is None:
+            self.flush_alter()
+            return self._execute(sql, params)
+        table, clause = alter
+        if params is None:
+            # Merged statements are always interpolated.
+            clause, params = clause.replace('%', '%%'), ()
+        identifiers = set(re.findall(r'`([^`]+)`', clause))
+        pending = self._pending_alter
+        if pending is not None and (pending.table != table or pending.identifiers & identifiers):
+            # TiDB doesn't allow a multi-schema change to touch the same
+            # column or index twice.
+            self.flush_alter()
+        if self._pending_alter is None:
+            self._pending_alter = PendingAlter(table)
+            if flush_alter not in self.deferred_sql:
+                self.deferred_sql.append(flush_alter)
+        self._pending_alter.clauses.append(clause)
+        self._pending_alter.params.extend(params)
+        self._pending_alter.identifiers |= identifiers
+
+    def flush_alter(self):
+        """Run the buffered ALTER TABLE clauses as a single statement."""
+        pending, self._pending_alter = self._pending_alter, None
+        if pending is not None:
+            self._execute(
+                self.sql_alter_table_options % {'table': pending.table, 'options': ', '.join(pending.clauses)},
+                pending.params,
+            )
+
+    def _mergeable_alter(self, sql):
+        """
+        Return the (quoted table name, clause) of a statement which can be
+        merged with other ALTER TABLE statements on the same table, or None.
+        """
+        if self.unmergeable_alter_re.search(sql):
+            return None
+        match = self.mergeable_alter_re.match(sql)
+        if match:
+            return match.group('table'), match.group('clause')
+        match = self.mergeable_create_index_re.match(sql)
+        if match:
+            return match.group('table'), 'ADD %sINDEX %s %s' % (
+                match.group('unique') or '', match.group('name'), match.group('columns'),
+            )
+        match = self.mergeable_drop_index_re.match(sql)
+        if match:
+            return match.group('table'), 'DROP INDEX %s' % match.group('name')
+        return None
+
+    def _constraint_names(self, *args, **kwargs):
+        # Introspect the table after the buffered changes.
+        self.flush_alter()
+        return super()._constraint_names(*args, **kwargs)
+
+    def _execute(self, sql, params=()):
+        if self.collect_sql:
+            return super().execute(sql, params)
+        try:
+            match = self.reorg_sql_re.match(str(sql))
+            if not self.ddl_progress_interval or not match:
+                return super().execute(sql, params)
+            table = match.group('table') or match.group('index_table')
+            stop = threading.Event()
+            tracker = threading.Thread(target=self._track_ddl_jobs, args=(table, stop), daemon=True)
+            tracker.start()
+            try:
+                return super().execute(sql, params)
+            finally:
+                stop.set()
+                tracker.join()
+        finally:
+            # Don't run statements prepared against the previous schema.
+            invalidate_prepared_statements()
+
+    def _track_ddl_jobs(self, table, stop):
+        """
+        Report the progress of the running DDL jobs on `table` every
+        `ddl_progress_interval` seconds until `stop` is set. ADMIN SHOW DDL
+        JOBS runs on its own connection, the schema editor's one is blocked
+        by the statement.
+        """
+        connection = self.connection.copy()
+        try:
+            while not stop.wait(self.ddl_progress_interval):
+                for job in self.ddl_jobs(connection, table):
+                    if job.state not in self.finished_ddl_job_states:
+                        self.ddl_progress_callback(job)
+        except Exception:
+            logger.exception('Cannot track the DDL jobs on %s.', table)
+        finally:
+            connection.close()
+
+    def ddl_jobs(self, connection, table, limit=10):
+        """Return the DDLJobs of the most recent DDL jobs on `table`."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'ADMIN SHOW DDL JOBS %d WHERE db_name = %%s AND table_name = %%s' % limit,
+                [connection.settings_dict['NAME'], table],
+            )
+            columns = [column[0].lower() for column in cursor.description]
+            rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        return [
+            DDLJob(
+                row['job_id'], row['table_name'], row['job_type'], row['schema_state'],
+                row['row_count'], row['state'],
+            )
+            for row in rows
+        ]
+
+    def log_ddl_progress(self, job):
+        logger.info(
+            'DDL job %s (%s) on %s: %s, %s, %s rows processed.',
+            job.job_id, job.job_type, job.table, job.state, job.schema_state, job.row_count,
+        )
+
+    @contextmanager
+    def ddl_reorg(self, worker_cnt=None, batch_size=None, fast_reorg=None):
+        """
+        Set the number of workers, the batch size and, on TiDB >= 6.3, the
+        fast (ingest) mode of the DDL statements which backfill rows, such
+        as ADD INDEX, run inside the block. These are global variables, the
+        previous values are restored afterwards.
+        """
+        values = {'worker_cnt': worker_cnt, 'batch_size': batch_size}
+        if self.connection.tidb_version >= (6, 3):
+            values['fast_reorg'] = None if fast_reorg is None else ('ON' if fast_reorg else 'OFF')
+        variables = {self.ddl_reorg_variables[name]: value for name, value in values.items() if value is not None}
+        if not variables:
+            yield
+            return
+        previous = None
+        if not self.collect_sql:
+            with self.connection.cursor() as cursor:
+                cursor.execute('SELECT %s' % ', '.join('@@GLOBAL.%s' % name for name in variables))
+                previous = dict(zip(variables, cursor.fetchone()))
+        self._set_global_variables(variables)
+        try:
+            yield
+        finally:
+            if previous is not None:
+                self._set_global_variables(previous)
+
+    def _set_global_variables(self, variables):
+        self.execute(
+            'SET %s' % ', '.join('@@GLOBAL.%s = %%s' % name for name in variables),
+            list(variables.values()),
+        )
+
+    def column_sql(self, model, field, include_default=False):
+        sql, params = super().column_sql(model, field, include_default)
+        if sql and field.primary_key:
+            clustered = self._tidb_options(model).get('clustered')
+            if isinstance(field, AutoRandomFieldMixin):
+                # AUTO_RANDOM is only allowed on a clustered primary key,
+                # don't depend on @@tidb_enable_clustered_index.
+                # _check_tidb_options() rejects 'clustered': False.
+                clustered = True
+            if clustered is not None:
+                sql = sql.replace(' PRIMARY KEY', ' PRIMARY KEY /*T![clustered_index] %s */' % (
+                    'CLUSTERED' if clustered else 'NONCLUSTERED'
+                ), 1)
+        return sql, params
+
+    def table_sql(self, model):
+        tidb_options = self._tidb_options(model)
+        self._check_tidb_options(model, tidb_options)
+        sql, params = super().table_sql(model)
+        options_sql = self._table_options_sql(tidb_options)
+        if options_sql:
+            # The statement is interpolated when column defaults are passed
+            # as params.
+            sql += ' ' + (options_sql.replace('%', '%%') if params else options_sql)
+        return sql, params
+
+    def create_model(self, model):
+        super().create_model(model)
+        if self._tidb_options(model).get('tiflash_replica'):
+            self.set_tiflash_replica(model, self._tidb_options(model)['tiflash_replica'])
+
+    def set_tiflash_replica(self, model, count, wait=False, timeout=None, interval=1):
+        """
+        Set the number of TiFlash (columnar) replicas of the model's table.
+        With `wait`, block until the replicas are available or `timeout`
+        seconds have passed.
+        """
+        self.execute(self.sql_set_tiflash_replica % {
+            'table': self.quote_name(model._meta.db_table),
+            'count': count,
+        })
+        if not wait or not count or self.collect_sql:
+            return
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT available, progress
+                    FROM information_schema.tiflash_replica
+                    WHERE table_schema = DATABASE() AND table_name = %s
+                """, [model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0]:
+                return
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(
+                    'TiFlash replica of %s is not available after %s seconds (progress %s).' % (
+                        model._meta.db_table, timeout, row[1] if row else 0,
+                    )
+                )
+            time.sleep(interval)
+
+    def alter_tidb_options(self, model, old_tidb_options, new_tidb_options):
+        """Apply the changes between two values of Meta.tidb_options."""
+        old_tidb_options = old_tidb_options or {}
+        new_tidb_options = new_tidb_options or {}
+        self._check_tidb_options(model, new_tidb_options)
+        if old_tidb_options.get('clustered') != new_tidb_options.get('clustered'):
+            raise NotSupportedError(
+                'TiDB cannot change whether the primary key of an existing table is clustered.'
+            )
+        table = self.quote_name(model._meta.db_table)
+        for name in ('shard_row_id_bits', 'pre_split_regions'):
+            if old_tidb_options.get(name) != new_tidb_options.get(name):
+                self.execute(self.sql_alter_table_options % {
+                    'table': table,
+                    'options': '%s = %d' % (name.upper(), new_tidb_options.get(name) or 0),
+                })
+        old_partition = old_tidb_options.get('partition')
+        new_partition = new_tidb_options.get('partition')
+        if old_partition != new_partition:
+            if new_partition:
+                self.execute(self.sql_alter_table_options % {
+                    'table': table,
+                    'options': self._partition_sql(new_partition),
+                })
+            else:
+                self.execute(self.sql_remove_partitioning % {'table': table})
+        if old_tidb_options.get('tiflash_replica') != new_tidb_options.get('tiflash_replica'):
+            self.set_tiflash_replica(model, new_tidb_options.get('tiflash_replica') or 0)
+
+    def _tidb_options(self, model):
+        return getattr(model._meta, 'tidb_options', None) or {}
+
+    def _check_tidb_options(self, model, tidb_options):
+        """
+        Raise an error for tidb_options which TiDB would reject when
+        creating or altering the table of `model`.
+        """
+        unknown = set(tidb_options) - self.tidb_table_options
+        if unknown:
+            raise ValueError('Unknown tidb_options: %s' % ', '.join(sorted(unknown)))
+        pk = model._meta.pk
+        auto_random = isinstance(pk, AutoRandomFieldMixin)
+        clustered = tidb_options.get('clustered')
+        if auto_random and clustered is False:
+            raise ImproperlyConfigured(
+                "The AUTO_RANDOM primary key of %s must be clustered, remove "
+                "tidb_options['clustered']." % model._meta.label
+            )
+        if tidb_options.get('shard_row_id_bits'):
+            if auto_random:
+                raise ImproperlyConfigured(
+                    "tidb_options['shard_row_id_bits'] of %s can't be used with an "
+                    "AUTO_RANDOM primary key, which is sharded already." % model._meta.label
+                )
+            # Integer primary keys are clustered unless told otherwise.
+            if clustered or (clustered is None and self.integer_type_re.match(pk.rel_db_type(self.connection) or '')):
+                raise ImproperlyConfigured(
+                    "tidb_options['shard_row_id_bits'] of %s requires a non-clustered "
+                    "primary key, set tidb_options['clustered'] to False." % model._meta.label
+                )
+        if tidb_options.get('pre_split_regions') and not (tidb_options.get('shard_row_id_bits') or auto_random):
+            raise ImproperlyConfigured(
+                "tidb_options['pre_split_regions'] of %s requires "
+                "tidb_options['shard_row_id_bits'] or an AUTO_RANDOM primary key." % model._meta.label
+            )
+
+    def _table_options_sql(self, tidb_options):
+        options = []
+        for name in ('shard_row_id_bits', 'pre_split_regions'):
+            if tidb_options.get(name):
+                options.append('%s = %d' % (name.upper(), tidb_options[name]))
+        if tidb_options.get('partition'):
+            options.append(self._partition_sql(tidb_options['partition']))
+        return ' '.join(options)
+
+    def _partition_sql(self, partition):
+        """
+        Render a partitioning clause from a dict such as
+
+            {'type': 'HASH', 'expression': 'id', 'partitions': 16}
+            {'type': 'RANGE', 'expression': 'YEAR(created)',
+             'partitions': [('p2020', 2021), ('pmax', 'MAXVALUE')]}
+            {'type': 'LIST COLUMNS', 'expression': 'region',
+             'partitions': [('p_east', ['ny', 'nj']), ('p_west', ['ca'])]}
+
+        A string is used as the clause verbatim.
+        """
+        if isinstance(partition, str):
+            return partition
+        partition_type = partition['type'].upper()
+        if partition_type not in self.partition_types:
+            raise ValueError(
+                '%s is not a recognized partition type. Allowed types: %s' % (
+                    partition_type, ', '.join(sorted(self.partition_types)),
+                )
+            )
+        sql = self.sql_partition_by % {'type': partition_type, 'expression': partition['expression']}
+        partitions = partition['partitions']
+        if isinstance(partitions, int):
+            return '%s PARTITIONS %d' % (sql, partitions)
+        definitions = []
+        for name, values in partitions:
+            if not partition_type.startswith('RANGE'):
+                clause = 'VALUES IN (%s)' % ', '.join(self._partition_value(value) for value in values)
+            elif values == 'MAXVALUE':
+                clause = 'VALUES LESS THAN MAXVALUE'
+            else:
+                clause = 'VALUES LESS THAN %s' % self._partition_value(
+                    values if isinstance(values, (list, tuple)) else [values]
+                )
+            definitions.append('PARTITION %s %s' % (self.quote_name(name), clause))
+        return '%s (%s)' % (sql, ', '.join(definitions))
+
+    def _partition_value(self, value):
+        if isinstance(value, (list, tuple)):
+            return '(%s)' % ', '.join(self._partition_value(v) for v in value)
+        if value is None:
+            return 'NULL'
+        if value == 'MAXVALUE' or isinstance(value, (int, float)):
+            return str(value)
+        # Partition bounds are part of DDL and can't be passed as params.
+        value = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+        return "'%s'" % value.replace('\\', '\\\\').replace("'", "''")
+
     def skip_default_on_alter(self, field):
         return False
 
@@ -20,4 +481,19 @@ class DatabaseSchemaEditor(MysqlDatabaseSchemaEditor):
         return True
 
     def _field_should_be_indexed(self, model, field):
-        return False
+        # TiDB doesn't index foreign key columns on its own, only index them
+        # when asked to.
+        if field.get_internal_type() != 'ForeignKey' or not self.index_foreign_keys(model):
+            return False
+        return super(MysqlDatabaseSchemaEditor, self)._field_should_be_indexed(model, field)
+
+    def index_foreign_keys(self, model):
+        """
+        Return whether the ForeignKey columns of `model` are indexed, set by
+        Meta.tidb_options['index_foreign_keys'] or
+        OPTIONS['tidb_index_foreign_keys'].
+        """
+        index = self._tidb_options(model).get('index_foreign_keys')
+        if index is None:
+            index = self.connection.settings_dict['OPTIONS'].get('tidb_index_foreign_keys', False)
+        return bool(index)
@@ -0,0 +1,87 @@
+import warnings
+from collections import deque
+
+from django.db.backends.mysql.base import CursorWrapper as MysqlCursorWrapper
+
+
+class StreamingCursorWrapper(MysqlCursorWrapper):
+    """
+    Wrap an unbuffered MySQLdb SSCursor, which reads the rows from the
+    server as they are fetched instead of loading the whole result set.
+
+    No other statement can run on the connection until all the rows are
+    read. The open stream is registered on the DatabaseWrapper, which calls
+    release() before using the connection for anything else; the rows which
+    haven't been fetched yet are then read into memory, with a
+    RuntimeWarning since memory no longer stays flat.
+    """
+    def __init__(self, cursor, db):
+        super().__init__(cursor)
+        self.db = db
+        # The rows left once the stream has been released.
+        self.rows = None
+
+    def execute(self, query, args=None):
+        self.db.release_stream()
+        self.rows = None
+        result = super().execute(query, args)
+        self.db.stream = self
+        return result
+
+    def executemany(self, query, args):
+        self.db.release_stream()
+        self.rows = None
+        result = super().executemany(query, args)
+        self.db.stream = self
+        return result
+
+    def release(self):
+        if self.rows is None:
+            self.rows = deque(self.cursor.fetchall())
+            if self.rows:
+                warnings.warn(
+                    'Read the %d remaining rows of a streaming result set into memory '
+                    'to run another statement on the connection. Use another '
+                    'database connection inside iterator() to keep memory flat.' % len(self.rows),
+                    RuntimeWarning,
+                )
+        self._done()
+
+    def _done(self):
+        if self.db.stream is self:
+            self.db.stream = None
+
+    def fetchone(self):
+        if self.rows is not None:
+            return self.rows.popleft() if self.rows else None
+        row = self.cursor.fetchone()
+        if row is None:
+            self._done()
+        return row
+
+    def fetchmany(self, size=None):
+        size = size or self.cursor.arraysize
+        if self.rows is not None:
+            return tuple(self.rows.popleft() for _ in range(min(size, len(self.rows))))
+        rows = self.cursor.fetchmany(size)
+        if not rows:
+            self._done()
+        return rows
+
+    def fetchall(self):
+        if self.rows is not None:
+            rows, self.rows = tuple(self.rows), deque()
+            return rows
+        rows = self.cursor.fetchall()
+        self._done()
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        try:
+            # Closing reads and discards the remaining rows.
+            self.cursor.close()
+        finally:
+            self._done()
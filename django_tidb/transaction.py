@@ -0,0 +1,66 @@
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.db.transaction import (
+    Atomic as BaseAtomic, TransactionManagementError, get_connection,
+)
+
+txn_modes = {'pessimistic', 'optimistic'}
+
+
+class Atomic(BaseAtomic):
+    """
+    transaction.Atomic which runs the outermost block in the given TiDB
+    transaction mode (@@tidb_txn_mode) and restores the previous mode after
+    it.
+    """
+    def __init__(self, using, savepoint, durable, mode):
+        super().__init__(using, savepoint, durable)
+        if mode is not None and mode not in txn_modes:
+            raise ValueError(
+                "Invalid transaction mode '%s'. Use one of %s." % (
+                    mode, ', '.join("'%s'" % s for s in sorted(txn_modes)),
+                ))
+        self.mode = mode
+
+    def __enter__(self):
+        if self.mode is not None:
+            connection = get_connection(self.using)
+            if connection.in_atomic_block:
+                raise TransactionManagementError(
+                    "The transaction mode can't be changed inside an atomic block."
+                )
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SET @django_tidb_txn_mode = @@tidb_txn_mode, @@tidb_txn_mode = %s', [self.mode],
+                )
+        super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            super().__exit__(exc_type, exc_value, traceback)
+        except Exception:
+            self._restore_mode(failed=True)
+            raise
+        self._restore_mode(failed=exc_type is not None)
+
+    def _restore_mode(self, failed):
+        connection = get_connection(self.using)
+        if self.mode is None or connection.connection is None or connection.in_atomic_block:
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SET @@tidb_txn_mode = @django_tidb_txn_mode')
+        except DatabaseError:
+            # Don't hide the error of the block.
+            if not failed:
+                raise
+
+
+def atomic(using=None, savepoint=True, durable=False, mode=None):
+    """
+    transaction.atomic() with an optional `mode`, 'pessimistic' or
+    'optimistic', for the transaction.
+    """
+    # Bare decorator: @atomic
+    if callable(using):
+        return Atomic(DEFAULT_DB_ALIAS, savepoint, durable, mode)(using)
+    return Atomic(using, savepoint, durable, mode)
@@ -21,7 +21,7 @@ setup(
     description='Django backend for tidb',
     long_description=open('README.md').read(),
     long_description_content_type='text/markdown',
-    packages=find_packages(),
+    packages=find_packages(exclude=['tests', 'tests.*']),
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Framework :: Django',
@@ -0,0 +1,154 @@
+"""
+A fake MySQLdb connection recording the statements it's given, so that the
+backend can be tested without a TiDB server.
+"""
+from contextlib import contextmanager
+from unittest import mock
+
+from django.db import connections
+from django.db.backends.mysql import base as mysql_base
+from django.utils.functional import cached_property
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+        self.description = None
+
+    def execute(self, sql, params=None):
+        self.connection.execute(sql, params)
+        rows = self.connection.results(sql, params)
+        self.rows = list(rows or [])
+        self.rowcount = len(self.rows) if rows is not None else 1
+        return self.rowcount
+
+    def executemany(self, sql, param_list):
+        for params in param_list:
+            self.execute(sql, params)
+
+    def fetchone(self):
+        return self.rows.pop(0) if self.rows else None
+
+    def fetchmany(self, size=1):
+        rows, self.rows = self.rows[:size], self.rows[size:]
+        return tuple(rows)
+
+    def fetchall(self):
+        rows, self.rows = self.rows, []
+        return tuple(rows)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def nextset(self):
+        return None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """
+    A connection to `host`:`port`. `results(sql, params)` returns the rows
+    of a statement, None for statements without a result set.
+    """
+    def __init__(self, host=None, port=None, results=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.results = results or (lambda sql, params: None)
+        self.encoders = {}
+        self.statements = []
+        self.autocommit_mode = True
+        self.closed = False
+        self.broken = False
+
+    def __repr__(self):
+        return '<FakeConnection %s:%s>' % (self.host, self.port)
+
+    def execute(self, sql, params):
+        if self.broken:
+            raise mysql_base.Database.OperationalError(2013, 'Lost connection to MySQL server during query')
+        self.statements.append((sql, params) if params else sql)
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def escape(self, value, encoders):
+        if isinstance(value, str):
+            return "'%s'" % value.replace('\\', '\\\\').replace("'", "\\'")
+        return str(value)
+
+    def autocommit(self, value):
+        self.autocommit_mode = value
+
+    def get_autocommit(self):
+        return self.autocommit_mode
+
+    def commit(self):
+        self.statements.append('COMMIT')
+
+    def rollback(self):
+        self.statements.append('ROLLBACK')
+
+    def ping(self, *args):
+        if self.broken:
+            raise mysql_base.Database.OperationalError(2006, 'MySQL server has gone away')
+
+    def close(self):
+        self.closed = True
+
+
+@contextmanager
+def fake_connections(results=None, refuse=()):
+    """
+    Make MySQLdb.connect() return FakeConnections, refusing to connect to
+    the (host, port) of `refuse`. Yield the list of the connections opened.
+    """
+    opened = []
+
+    def connect(**kwargs):
+        if (kwargs.get('host'), kwargs.get('port')) in refuse:
+            raise mysql_base.Database.OperationalError(2003, "Can't connect to MySQL server")
+        connection = FakeConnection(results=results, **kwargs)
+        opened.append(connection)
+        return connection
+
+    for connection in connections.all():
+        connection.close()
+    try:
+        with mock.patch.object(mysql_base.Database, 'connect', connect):
+            yield opened
+    finally:
+        for connection in connections.all():
+            connection.close()
+
+
+def statements(connection):
+    """Return the statements run on the current connection of a wrapper."""
+    return connection.connection.statements
+
+
+def _clear_cached_properties(connection):
+    # Not the django.db.connection proxy.
+    connection = connections[connection.alias]
+    for obj in (connection, connection.features, connection.ops):
+        for klass in type(obj).__mro__:
+            for name, value in vars(klass).items():
+                if isinstance(value, cached_property):
+                    obj.__dict__.pop(name, None)
+
+
+@contextmanager
+def override_options(connection, **options):
+    """Update the OPTIONS of `connection` inside the block."""
+    settings_options = connection.settings_dict['OPTIONS']
+    connection.settings_dict['OPTIONS'] = {**settings_options, **options}
+    _clear_cached_properties(connection)
+    try:
+        yield
+    finally:
+        connection.settings_dict['OPTIONS'] = settings_options
+        _clear_cached_properties(connection)
@@ -0,0 +1,22 @@
+DATABASES = {
+    'default': {
+        'ENGINE': 'django_tidb',
+        'NAME': 'django_tidb_tests',
+        'USER': 'root',
+        'PASSWORD': '',
+        'HOST': '127.0.0.1',
+        'PORT': 4000,
+        'OPTIONS': {
+            # Known up front so that the tests don't query the server.
+            'tidb_server_data': {'version': '5.7.25-TiDB-v7.5.0'},
+        },
+    },
+}
+INSTALLED_APPS = [
+    'django.contrib.contenttypes',
+    'django_tidb',
+    'tests',
+]
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+USE_TZ = False
+SECRET_KEY = 'django_tidb_tests_secret_key'
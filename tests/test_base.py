@@ -0,0 +1,118 @@
+import time
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.test import SimpleTestCase
+
+from django_tidb.base import clear_server_data_cache
+
+from .fake import fake_connections, override_options, statements
+from .models import Author
+
+
+class ReadEnginesTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_use_read_engines(self):
+        with fake_connections():
+            with connection.use_read_engines('TiFlash', 'tidb'):
+                pass
+            self.assertEqual(statements(connection)[-2:], [
+                ('SET @@tidb_isolation_read_engines = %s', ['tiflash,tidb']),
+                ('SET @@tidb_isolation_read_engines = %s', ['tikv,tiflash,tidb']),
+            ])
+
+    def test_invalid_read_engines(self):
+        msg = "Invalid isolation read engines 'tikvv'. Use some of 'tidb', 'tiflash', 'tikv'."
+        with fake_connections():
+            with self.assertRaisesMessage(ValueError, msg):
+                with connection.use_read_engines('tikvv'):
+                    pass
+            with override_options(connection, tidb_isolation_read_engines='tikvv'):
+                with self.assertRaisesMessage(ImproperlyConfigured, msg):
+                    connection.get_connection_params()
+
+
+class ReplicaReadTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_configured_mode(self):
+        with fake_connections(), override_options(connection, tidb_replica_read='Follower'):
+            connection.ensure_connection()
+            self.assertEqual(statements(connection), [
+                "SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED; SET @@tidb_replica_read = 'follower'",
+            ])
+            with connection.use_replica_read('closest-replicas'):
+                pass
+            self.assertEqual(statements(connection)[1:], [
+                ('SET @@tidb_replica_read = %s', ['closest-replicas']),
+                ('SET @@tidb_replica_read = %s', ['follower']),
+            ])
+
+    def test_restores_leader(self):
+        with fake_connections():
+            with connection.use_replica_read('leader-and-follower'):
+                list(Author.objects.all())
+            self.assertEqual(statements(connection)[1], ('SET @@tidb_replica_read = %s', ['leader-and-follower']))
+            self.assertTrue(statements(connection)[2].startswith('SELECT'))
+            self.assertEqual(statements(connection)[3], ('SET @@tidb_replica_read = %s', ['leader']))
+
+    def test_invalid_mode(self):
+        with fake_connections():
+            with self.assertRaisesMessage(ValueError, "Invalid replica read mode 'nearest'."):
+                with connection.use_replica_read('nearest'):
+                    pass
+            with override_options(connection, tidb_replica_read='nearest'):
+                with self.assertRaisesMessage(ImproperlyConfigured, "Invalid replica read mode 'nearest' specified."):
+                    connection.get_connection_params()
+
+
+class ServerDataTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        clear_server_data_cache()
+        self.addCleanup(clear_server_data_cache)
+
+    def results(self, sql, params):
+        if 'SELECT VERSION()' in sql:
+            return [('5.7.25-TiDB-v7.1.0', 'STRICT_TRANS_TABLES', 'InnoDB', 0, 0, 1, 2)]
+
+    def probes(self, opened):
+        return [
+            statement for conn in opened for statement in conn.statements
+            if 'SELECT VERSION()' in statement
+        ]
+
+    def test_shared(self):
+        with fake_connections(self.results) as opened, override_options(connection, tidb_server_data=None):
+            other = connection.copy()
+            self.assertEqual(connection.tidb_server_data['version'], '5.7.25-TiDB-v7.1.0')
+            self.assertEqual(other.tidb_server_data['auto_increment_increment'], 2)
+            self.assertEqual(other.mysql_server_data, other.tidb_server_data)
+            self.assertEqual(len(self.probes(opened)), 1)
+
+    def test_not_cached(self):
+        with fake_connections(self.results) as opened:
+            with override_options(connection, tidb_server_data=None, tidb_server_data_ttl=0):
+                connection.copy().tidb_server_data
+                connection.copy().tidb_server_data
+            self.assertEqual(len(self.probes(opened)), 2)
+
+    def test_expired(self):
+        with fake_connections(self.results) as opened, override_options(connection, tidb_server_data=None):
+            connection.copy().tidb_server_data
+            with mock.patch('time.monotonic', return_value=time.monotonic() + 301):
+                connection.copy().tidb_server_data
+            self.assertEqual(len(self.probes(opened)), 2)
+
+    def test_pre_seeded(self):
+        server_data = {'version': '8.0.11-TiDB-v8.1.0'}
+        with fake_connections() as opened, override_options(connection, tidb_server_data=server_data):
+            self.assertEqual(connection.tidb_version, (8, 1, 0))
+            self.assertEqual(opened, [])
+        msg = "OPTIONS['tidb_server_data'] must include the 'version'."
+        with override_options(connection, tidb_server_data={'sql_mode': ''}):
+            with self.assertRaisesMessage(ImproperlyConfigured, msg):
+                connection.tidb_server_data
@@ -0,0 +1,72 @@
+from django.db import connection, models
+from django.test import SimpleTestCase
+from django.test.utils import isolate_apps
+
+from django_tidb.query import BatchResult, TiDBQuerySet
+
+from .fake import fake_connections, override_options, statements
+from .models import Author
+
+
+class BatchDMLTests(SimpleTestCase):
+    databases = {'default'}
+
+    def results(self, sql, params):
+        if sql.startswith('BATCH ON'):
+            return [(3, 'all succeeded')]
+        if sql.startswith('SELECT'):
+            # Primary keys 1 to 5, after the `id` > %s parameter.
+            last = params[0] if params else 0
+            return [(pk,) for pk in range(last + 1, 6)][:int(sql.rsplit('LIMIT ', 1)[1])]
+
+    def test_batch_delete(self):
+        results = []
+        with fake_connections(self.results):
+            result = TiDBQuerySet(Author).filter(name='Ann').batch_delete(batch_size=2, callback=results.append)
+            self.assertEqual(statements(connection)[-1], (
+                'BATCH ON `tests_author`.`id` LIMIT 2 '
+                'DELETE FROM `tests_author` WHERE `tests_author`.`name` = %s', ('Ann',),
+            ))
+        self.assertEqual(result, BatchResult(3, None))
+        self.assertEqual(results, [result])
+
+    def test_batch_update(self):
+        with fake_connections(self.results):
+            TiDBQuerySet(Author).filter(name='Ann').batch_update(batch_size=100, name='Bob')
+            self.assertEqual(statements(connection)[-1], (
+                'BATCH ON `tests_author`.`id` LIMIT 100 '
+                'UPDATE `tests_author` SET `name` = %s WHERE `tests_author`.`name` = %s', ('Bob', 'Ann'),
+            ))
+
+    def test_walk_primary_keys(self):
+        results = []
+        with fake_connections(self.results), override_options(connection, tidb_server_data={
+            'version': '5.7.25-TiDB-v6.0.0',
+        }):
+            result = TiDBQuerySet(Author).batch_delete(batch_size=2, callback=results.append)
+            deletes = [statement for statement in statements(connection) if statement[0].startswith('DELETE')]
+        self.assertEqual(deletes, [
+            ('DELETE FROM `tests_author` WHERE `tests_author`.`id` IN (%s, %s)', (1, 2)),
+            ('DELETE FROM `tests_author` WHERE `tests_author`.`id` IN (%s, %s)', (3, 4)),
+            ('DELETE FROM `tests_author` WHERE `tests_author`.`id` IN (%s)', (5,)),
+        ])
+        self.assertEqual(result, BatchResult(3, 3))
+        self.assertEqual(results, [BatchResult(1, 1), BatchResult(2, 2), result])
+
+    @isolate_apps('tests')
+    def test_parent_fields(self):
+        class Place(models.Model):
+            name = models.CharField(max_length=50)
+
+        class Restaurant(Place):
+            stars = models.IntegerField()
+
+        msg = "batch_update() can't update the fields of parent models, use update() instead."
+        with fake_connections(self.results):
+            with self.assertRaisesMessage(ValueError, msg):
+                TiDBQuerySet(Restaurant).filter(stars=1).batch_update(name='Closed', stars=0)
+            TiDBQuerySet(Restaurant).filter(stars=1).batch_update(stars=0)
+            self.assertEqual(statements(connection)[-1], (
+                'BATCH ON `tests_restaurant`.`place_ptr_id` LIMIT 1000 '
+                'UPDATE `tests_restaurant` SET `stars` = %s WHERE `tests_restaurant`.`stars` = %s', (0, 1),
+            ))
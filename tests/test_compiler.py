@@ -0,0 +1,122 @@
+from unittest import TestCase
+
+from django.db import connection, transaction
+from django.db.backends.mysql import base as mysql_base
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, override_options, statements
+from .models import Author
+
+
+def next_value(sql, params):
+    if sql.startswith('SELECT NEXTVAL('):
+        return [(1000,)]
+    return None
+
+
+class SequencePKAllocationTests(TestCase):
+    def setUp(self):
+        # Blocks of 1000 ids, the fake sequence always starts at 1000.
+        connection.pk_allocator._blocks.clear()
+
+    def inserts(self):
+        return [statement for statement in statements(connection) if statement[0].startswith('INSERT')]
+
+    def test_allocated_pks(self):
+        with fake_connections(next_value), override_options(connection, tidb_pk_allocation='sequence'):
+            authors = Author.objects.bulk_create([Author(name='Ann'), Author(name='Bob')])
+            self.assertEqual([author.pk for author in authors], [1000, 1001])
+            self.assertEqual(self.inserts(), [(
+                'INSERT INTO `tests_author` (`name`, `id`) VALUES (%s, %s), (%s, %s)',
+                ('Ann', 1000, 'Bob', 1001),
+            )])
+
+    def test_create_with_pk(self):
+        with fake_connections(next_value), override_options(connection, tidb_pk_allocation='sequence'):
+            author = Author.objects.create(id=42, name='Ann')
+            self.assertEqual(author.pk, 42)
+            self.assertEqual(self.inserts(), [
+                ('INSERT INTO `tests_author` (`id`, `name`) VALUES (%s, %s)', (42, 'Ann')),
+            ])
+
+    def test_bulk_create_with_pks(self):
+        with fake_connections(next_value), override_options(connection, tidb_pk_allocation='sequence'):
+            authors = Author.objects.bulk_create([
+                Author(id=7, name='Ann'), Author(name='Bob'), Author(id=8, name='Cid'),
+            ])
+            self.assertEqual([author.pk for author in authors], [7, 1000, 8])
+            self.assertEqual(self.inserts(), [
+                ('INSERT INTO `tests_author` (`id`, `name`) VALUES (%s, %s), (%s, %s)', (7, 'Ann', 8, 'Cid')),
+                ('INSERT INTO `tests_author` (`name`, `id`) VALUES (%s, %s)', ('Bob', 1000)),
+            ])
+
+    def test_create_sequence(self):
+        created = []
+
+        def results(sql, params):
+            if sql.startswith('CREATE SEQUENCE'):
+                created.append(sql)
+            elif sql.startswith('SELECT NEXTVAL(') and not created:
+                raise mysql_base.Database.ProgrammingError(1146, "Table 'tests_author_pk_seq' doesn't exist")
+            elif sql.startswith('SELECT COALESCE('):
+                return [(1,)]
+            return next_value(sql, params)
+
+        with fake_connections(results) as opened, override_options(
+            connection, tidb_pk_allocation='sequence', tidb_pool_size=2, tidb_prepared_statements=10,
+        ):
+            connection.ensure_connection()
+            prepared_statements = connection.prepared_statements
+            Author.objects.bulk_create([Author(name='Ann')])
+            self.assertEqual(created, [
+                'CREATE SEQUENCE IF NOT EXISTS `tests_author_pk_seq` START WITH 1 INCREMENT BY 1000 NOCACHE',
+            ])
+            # The sequence was created on a connection of its own, closed
+            # afterwards.
+            self.assertEqual(len(opened), 2)
+            self.assertTrue(opened[1].closed)
+            self.assertIs(connection.prepared_statements, prepared_statements)
+            self.assertEqual([endpoint.active for endpoint in connection.pool.endpoints], [1])
+            self.assertEqual(len(connection.pool._checked_out), 1)
+
+
+class BulkUpsertTests(TestCase):
+    def test_allocated_pks(self):
+        connection.pk_allocator._blocks.clear()
+        authors = [Author(pk=7, name='Ann'), Author(name='Bob')]
+        with fake_connections(next_value), override_options(connection, tidb_pk_allocation='sequence'):
+            TiDBQuerySet(Author).bulk_upsert(authors, ['name'])
+            self.assertEqual(
+                [statement for statement in statements(connection) if statement[0].startswith('INSERT')],
+                [(
+                    'INSERT INTO `tests_author` (`id`, `name`) VALUES (%s, %s), (%s, %s) '
+                    'ON DUPLICATE KEY UPDATE `name` = VALUES(`name`)',
+                    (7, 'Ann', 1000, 'Bob'),
+                )],
+            )
+        self.assertEqual([author.pk for author in authors], [7, None])
+
+    def test_batches_are_committed_separately(self):
+        autocommit = []
+
+        def results(sql, params):
+            if sql.startswith('INSERT'):
+                autocommit.append(connection.connection.get_autocommit())
+
+        authors = [Author(id=i, name='x' * 100) for i in range(1, 11)]
+        with fake_connections(results), override_options(connection, tidb_bulk_batch_bytes=500):
+            TiDBQuerySet(Author).bulk_upsert(authors, ['name'])
+            self.assertEqual(autocommit, [True] * 4)
+            self.assertNotIn('COMMIT', statements(connection))
+
+    def test_atomic_block(self):
+        authors = [Author(id=i, name='x' * 100) for i in range(1, 11)]
+        with fake_connections(), override_options(connection, tidb_bulk_batch_bytes=500):
+            with transaction.atomic():
+                TiDBQuerySet(Author).bulk_upsert(authors, ['name'])
+            self.assertEqual(len(self.inserts()), 4)
+            self.assertEqual(statements(connection)[-1], 'COMMIT')
+
+    def inserts(self):
+        return [statement for statement in statements(connection) if statement[0].startswith('INSERT')]
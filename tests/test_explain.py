@@ -0,0 +1,103 @@
+from unittest import TestCase
+
+from django_tidb.explain import Plan
+
+columns = ['id', 'estRows', 'actRows', 'task', 'access object', 'execution info', 'operator info', 'memory', 'disk']
+# EXPLAIN ANALYZE SELECT * FROM t1 JOIN t2 ON t1.id = t2.t1_id
+analyze_rows = [
+    ('HashJoin_22', '12487.50', '3', 'root', '', 'time:2.1ms, loops:2, build_hash_table:{total:1.2ms}',
+     'inner join, equal:[eq(test.t1.id, test.t2.t1_id)]', '25.3 KB', '0 Bytes'),
+    ('├─TableReader_25(Build)', '9990.00', '3', 'root', '', 'time:1.2ms, loops:2, cop_task: {num: 1}',
+     'data:Selection_24', '300 Bytes', 'N/A'),
+    ('│ └─Selection_24', '9990.00', '3', 'cop[tikv]', '', 'tikv_task:{time:0s, loops:1}',
+     'not(isnull(test.t2.t1_id))', 'N/A', 'N/A'),
+    ('│   └─TableFullScan_23', '10000.00', '3', 'cop[tikv]', 'table:t2', 'tikv_task:{time:0s, loops:1}',
+     'keep order:false, stats:pseudo', 'N/A', 'N/A'),
+    ('└─TableReader_28(Probe)', '10000.00', '5000', 'root', '', 'time:1m2.5s, loops:2',
+     'data:TableFullScan_27', '1 KB', 'N/A'),
+    ('  └─TableFullScan_27', '10000.00', '5000', 'cop[tikv]', 'table:t1', 'tikv_task:{time:850µs, loops:5}',
+     'keep order:false', 'N/A', 'N/A'),
+]
+
+
+class PlanTests(TestCase):
+    def test_tree(self):
+        plan = Plan.from_rows(columns, analyze_rows)
+        self.assertTrue(plan.analyzed)
+        self.assertEqual(plan.root.id, 'HashJoin_22')
+        self.assertEqual(
+            [(node.id, node.parent.id if node.parent else None) for node in plan],
+            [
+                ('HashJoin_22', None),
+                ('TableReader_25(Build)', 'HashJoin_22'),
+                ('Selection_24', 'TableReader_25(Build)'),
+                ('TableFullScan_23', 'Selection_24'),
+                ('TableReader_28(Probe)', 'HashJoin_22'),
+                ('TableFullScan_27', 'TableReader_28(Probe)'),
+            ],
+        )
+        build, probe = plan.root.children
+        self.assertEqual((build.name, build.role), ('TableReader', 'Build'))
+        self.assertEqual((probe.name, probe.role), ('TableReader', 'Probe'))
+        self.assertIsNone(plan.root.role)
+        scan = probe.children[0]
+        self.assertEqual((scan.est_rows, scan.act_rows, scan.task), (10000.0, 5000, 'cop[tikv]'))
+        self.assertEqual((scan.access_object, scan.memory), ('table:t1', None))
+        self.assertEqual(plan.root.memory, '25.3 KB')
+
+    def test_execution_time(self):
+        plan = Plan.from_rows(columns, analyze_rows)
+        for node, seconds in zip(plan, [0.0021, 0.0012, 0.0, 0.0, 62.5, 0.00085]):
+            with self.subTest(node=node.id):
+                self.assertAlmostEqual(node.execution_time, seconds)
+
+    def test_full_scans_and_pseudo_stats(self):
+        plan = Plan.from_rows(columns, analyze_rows)
+        self.assertEqual([node.id for node in plan.full_scans()], ['TableFullScan_23', 'TableFullScan_27'])
+        self.assertEqual([node.id for node in plan.pseudo_stats()], ['TableFullScan_23'])
+
+    def test_mismatches(self):
+        plan = Plan.from_rows(columns, analyze_rows)
+        self.assertEqual(
+            [(mismatch.node.id, round(mismatch.ratio)) for mismatch in plan.mismatches()],
+            [('HashJoin_22', 4162), ('TableFullScan_23', 3333), ('TableReader_25(Build)', 3330),
+             ('Selection_24', 3330)],
+        )
+        self.assertEqual([mismatch.node.id for mismatch in plan.mismatches(ratio=2)][-2:], [
+            'TableReader_28(Probe)', 'TableFullScan_27',
+        ])
+        self.assertEqual(plan.mismatches(min_rows=20000), [])
+
+    def test_brief_format(self):
+        plan = Plan.from_rows(['id', 'estRows', 'task', 'access object', 'operator info'], [
+            ('IndexJoin', '12487.50', 'root', '', 'inner join'),
+            ('├─TableReader(Build)', '9990.00', 'root', '', 'data:TableFullScan'),
+            ('│ └─TableFullScan', '9990.00', 'cop[tikv]', 'table:t2', 'keep order:false'),
+            ('└─IndexLookUp(Probe)', '1.00', 'root', '', ''),
+            ('  ├─IndexRangeScan(Build)', '1.00', 'cop[tikv]', 'table:t1, index:idx(a)', ''),
+            ('  └─TableRowIDScan(Probe)', '1.00', 'cop[tikv]', 'table:t1', ''),
+        ])
+        self.assertFalse(plan.analyzed)
+        lookup = plan.root.children[1]
+        self.assertEqual([(node.name, node.role) for node in lookup.children], [
+            ('IndexRangeScan', 'Build'), ('TableRowIDScan', 'Probe'),
+        ])
+        self.assertIsNone(lookup.act_rows)
+        with self.assertRaisesRegex(ValueError, 'need a plan from EXPLAIN ANALYZE'):
+            plan.mismatches()
+
+    def test_count_column(self):
+        # Before TiDB 4.0.
+        plan = Plan.from_rows(['id', 'count', 'task', 'operator info'], [
+            ('TableReader_5', '10000.00', 'root', 'data:TableScan_4'),
+            ('└─TableScan_4', '10000.00', 'cop', 'table:t, range:[-inf,+inf], keep order:false, stats:pseudo'),
+        ])
+        self.assertEqual([node.est_rows for node in plan], [10000.0, 10000.0])
+
+    def test_invalid_plans(self):
+        with self.assertRaisesRegex(ValueError, 'must be in the row format'):
+            Plan.from_rows(['plan'], [('dot',)])
+        with self.assertRaisesRegex(ValueError, 'empty'):
+            Plan.from_rows(columns, [])
+        with self.assertRaisesRegex(ValueError, 'more than one root'):
+            Plan.from_rows(['id'], [('Projection_1',), ('Projection_2',)])
@@ -0,0 +1,59 @@
+import datetime
+from unittest import TestCase
+
+from django.db import connection
+from django.db.models import CharField
+from django.db.models.functions import Cast
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, override_options, statements
+from .models import Author
+
+
+class InListTableTests(TestCase):
+    ids = list(range(1, 6))
+
+    def test_str_doesnt_create_tables(self):
+        with fake_connections(), override_options(connection, tidb_in_list_threshold=3):
+            sql = str(Author.objects.filter(pk__in=self.ids).query)
+            self.assertIn('IN (1, 2, 3, 4, 5)', sql)
+            self.assertIsNone(connection.connection)
+
+    def test_execute(self):
+        with fake_connections(), override_options(connection, tidb_in_list_threshold=3):
+            list(Author.objects.filter(pk__in=self.ids))
+            self.assertEqual(statements(connection)[1:], [
+                'CREATE TEMPORARY TABLE `django_tidb_in_0` (`v` integer, PRIMARY KEY (`v`))',
+                ('INSERT IGNORE INTO `django_tidb_in_0` (`v`) VALUES (%s), (%s), (%s), (%s), (%s)', tuple(self.ids)),
+                'SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author` '
+                'WHERE `tests_author`.`id` IN (SELECT `v` FROM `django_tidb_in_0`)',
+            ])
+            list(Author.objects.all())
+            self.assertEqual(statements(connection)[-2], 'DROP TEMPORARY TABLE IF EXISTS `django_tidb_in_0`')
+
+    def test_stale_read(self):
+        with fake_connections(), override_options(connection, tidb_in_list_threshold=3):
+            list(TiDBQuerySet(Author).as_of(datetime.timedelta(seconds=5)).filter(pk__in=self.ids))
+            self.assertEqual(statements(connection)[1:], [(
+                'SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author` '
+                'AS OF TIMESTAMP NOW(6) - INTERVAL %s MICROSECOND '
+                'WHERE `tests_author`.`id` IN (%s, %s, %s, %s, %s)',
+                (5000000, *self.ids),
+            )])
+
+    def test_char_field_without_max_length(self):
+        with fake_connections(), override_options(connection, tidb_in_list_threshold=3):
+            list(Author.objects.annotate(text_id=Cast('id', CharField())).filter(text_id__in=map(str, self.ids)))
+            self.assertEqual(statements(connection)[1], 'CREATE TEMPORARY TABLE `django_tidb_in_0` (`v` longtext)')
+
+    def test_pooled_session(self):
+        options = {'tidb_in_list_threshold': 3, 'tidb_pool_size': 1}
+        with fake_connections() as opened, override_options(connection, **options):
+            list(Author.objects.filter(pk__in=self.ids))
+            connection.close()
+            self.assertEqual(opened[0].statements[-1], 'DROP TEMPORARY TABLE IF EXISTS `django_tidb_in_0`')
+            list(Author.objects.filter(pk__in=self.ids))
+            self.assertEqual(len(opened), 1)
+            connection.close()
+            connection.pool.clear()
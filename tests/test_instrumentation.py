@@ -0,0 +1,66 @@
+import hashlib
+from unittest import TestCase, mock
+
+from django_tidb import instrumentation
+from django_tidb.instrumentation import normalize_sql
+
+
+class NormalizeSQLTests(TestCase):
+    def assertNormalized(self, sql, normalized):
+        self.assertEqual(normalize_sql(sql), (normalized, hashlib.sha256(normalized.encode()).hexdigest()))
+
+    def test_tidb_normalizations(self):
+        # From the digester tests of TiDB's parser.
+        for sql, normalized in [
+            ('SELECT 1', 'select ?'),
+            ('select /*+ a hint */ 1', 'select ?'),
+            ('select /* a hint */ 1', 'select ?'),
+            ("select 1 from `b` where `id` in (1, 3, '3', 1, 2, 3, 4)", 'select ? from `b` where `id` in ( ... )'),
+            ('select 1 from `b` where `id` in (1, `a`, 4)', 'select ? from `b` where `id` in ( ? , `a` , ? )'),
+            ('select 1 from `b` order by 2', 'select ? from `b` order by 2'),
+            (
+                'select -1 + - 2 + `b` - `c` + 0.2 + (-2) from `c` where `d` in (1, -2, +3)',
+                'select ? + ? + `b` - `c` + ? + ( ? ) from `c` where `d` in ( ... )',
+            ),
+            (
+                'select * from `t` where `a` <= -1 and `b` < -2 and `c` = -3 and `c` > -4 and `c` >= -5 and `e` is 1',
+                'select * from `t` where `a` <= ? and `b` < ? and `c` = ? and `c` > ? and `c` >= ? and `e` is ?',
+            ),
+            ('select count(`a`), `b` from `t` group by 2', 'select count ( `a` ) , `b` from `t` group by 2'),
+            (
+                'select count(`a`), `b`, `c` from `t` group by (2, 3)',
+                'select count ( `a` ) , `b` , `c` from `t` group by ( 2 , 3 )',
+            ),
+            ('select `a`, `b` from `t` order by 1, 2', 'select `a` , `b` from `t` order by 1 , 2'),
+            ('select count(*) from `t`', 'select count ( ? ) from `t`'),
+            ('select * from `t` limit 1, 2', 'select * from `t` limit ...'),
+            ('select * from `t` limit 10', 'select * from `t` limit ?'),
+            ('insert into `t` values (1, 2), (3, 4)', 'insert into `t` values ( ... )'),
+        ]:
+            with self.subTest(sql=sql):
+                self.assertNormalized(sql, normalized)
+
+    def test_django_statements(self):
+        self.assertNormalized(
+            'SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author`\n'
+            'WHERE (`tests_author`.`id` IN (%s, %s, %s) AND `tests_author`.`name` = %s)  LIMIT 21',
+            'select `tests_author` . `id` , `tests_author` . `name` from `tests_author` '
+            'where ( `tests_author` . `id` in ( ... ) and `tests_author` . `name` = ? ) limit ?',
+        )
+        self.assertNormalized(
+            "SELECT /*+ USE_INDEX(`tests_author`, `name_idx`) */ COUNT(*) AS `__count` FROM `Tests_Author` "
+            "WHERE `tests_author`.`name` = 'O''Brien' -- comment",
+            'select count ( ? ) as `__count` from `tests_author` where `tests_author` . `name` = ?',
+        )
+
+    def test_literals_share_digest(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM `t` WHERE `a` = 1 AND `b` = 'x'")[1],
+            normalize_sql('select *\n from `t`  where `a`=-42 and `b`="y"')[1],
+        )
+
+    def test_long_statements_not_cached(self):
+        sql = 'SELECT * FROM `t` WHERE `id` IN (%s)' % ', '.join(['%s'] * 50000)
+        with mock.patch.object(instrumentation, '_cached_normalize_sql') as cached:
+            self.assertEqual(normalize_sql(sql)[0], 'select * from `t` where `id` in ( ... )')
+        cached.assert_not_called()
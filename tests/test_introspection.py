@@ -0,0 +1,101 @@
+from io import StringIO
+from unittest import TestCase
+
+from django.core.management import call_command
+from django.db import connection
+from MySQLdb.constants import FIELD_TYPE
+
+from django_tidb.fields import BigAutoRandomField
+from django_tidb.introspection import FieldInfo
+
+from .fake import fake_connections
+
+
+class GetFieldTypeTests(TestCase):
+    def description(self, extra):
+        return FieldInfo('id', FIELD_TYPE.LONGLONG, None, None, 20, 0, False, None, None, extra, False, False)
+
+    def test_auto_random(self):
+        for extra, params in [
+            ('auto_random', {}),
+            ('auto_random(5)', {}),
+            ('AUTO_RANDOM(5, 64)', {}),
+            ('auto_random(6)', {'shard_bits': 6}),
+            ('AUTO_RANDOM(5, 54)', {'range_bits': 54}),
+            ('auto_random(6,54)', {'shard_bits': 6, 'range_bits': 54}),
+        ]:
+            with self.subTest(extra=extra):
+                description = self.description(extra)
+                self.assertEqual(
+                    connection.introspection.get_field_type(description.type_code, description),
+                    'django_tidb.fields.BigAutoRandomField',
+                )
+                self.assertEqual(connection.introspection.get_field_params(description.type_code, description), params)
+
+    def test_not_auto_random(self):
+        description = self.description('auto_increment')
+        self.assertEqual(connection.introspection.get_field_type(description.type_code, description), 'BigAutoField')
+        self.assertEqual(connection.introspection.get_field_params(description.type_code, description), {})
+
+
+class InspectDBTests(TestCase):
+    def test_auto_random(self):
+        def results(sql, params):
+            if 'FROM information_schema.columns' in sql:
+                return [
+                    ('tests_event', 'id', 'bigint', None, 19, 0, 'auto_random(6)', None, None, 0, 'NO'),
+                    ('tests_event', 'name', 'varchar', 50, None, None, '', None, None, 0, 'NO'),
+                ]
+            if 'information_schema.key_column_usage AS kc' in sql:
+                return [('tests_event', 'PRIMARY', 'id', None, None, 'PRIMARY KEY')]
+
+        out = StringIO()
+        with fake_connections(results):
+            call_command('inspectdb', 'tests_event', stdout=out)
+        source = out.getvalue()
+        self.assertIn('from django.db import models\nimport django_tidb.fields\n', source)
+        self.assertIn('    id = django_tidb.fields.BigAutoRandomField(primary_key=True, shard_bits=6)\n', source)
+        namespace = {}
+        exec(source.split('\n\n\n')[0], namespace)
+        self.assertIs(namespace['django_tidb'].fields.BigAutoRandomField, BigAutoRandomField)
+
+
+class SnapshotTests(TestCase):
+    def results(self, sql, params):
+        if 'FROM information_schema.columns' in sql:
+            return [
+                ('tests_author', 'id', 'bigint', None, 19, 0, 'auto_increment', None, None, 0, 'NO'),
+                ('tests_author', 'name', 'varchar', 50, None, None, '', None, None, 0, 'NO'),
+                ('tests_book', 'id', 'bigint', None, 19, 0, 'auto_increment', None, None, 0, 'NO'),
+                ('tests_book', 'author_id', 'bigint', None, 19, 0, '', None, None, 0, 'NO'),
+                ('tests_log', 'message', 'varchar', 50, None, None, '', None, None, 0, 'YES'),
+            ]
+        if 'information_schema.key_column_usage AS kc' in sql:
+            return [
+                ('tests_author', 'PRIMARY', 'id', None, None, 'PRIMARY KEY'),
+                ('tests_book', 'PRIMARY', 'id', None, None, 'PRIMARY KEY'),
+                ('tests_book', 'book_author_fk', 'author_id', 'tests_author', 'id', 'FOREIGN KEY'),
+            ]
+
+    def test_snapshot(self):
+        with fake_connections(self.results):
+            with connection.cursor() as cursor:
+                with connection.introspection.snapshot(cursor):
+                    queries = len(connection.connection.statements)
+                    self.assertEqual(
+                        [info.name for info in connection.introspection.get_table_description(cursor, 'tests_book')],
+                        ['id', 'author_id'],
+                    )
+                    self.assertEqual(
+                        connection.introspection.get_relations(cursor, 'tests_book'),
+                        {'author_id': ('id', 'tests_author')},
+                    )
+                    self.assertEqual(
+                        connection.introspection.get_primary_key_column(cursor, 'tests_author'), 'id',
+                    )
+                    # Tables without constraints are answered from the snapshot too.
+                    self.assertEqual(connection.introspection.get_constraints(cursor, 'tests_log'), {})
+                    self.assertEqual(connection.introspection.get_relations(cursor, 'tests_log'), {})
+                    self.assertEqual(len(connection.connection.statements), queries)
+                connection.introspection.get_constraints(cursor, 'tests_log')
+                self.assertGreater(len(connection.connection.statements), queries)
@@ -0,0 +1,45 @@
+import datetime
+import re
+from unittest import TestCase
+
+from django.db import connection
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, override_options
+from .models import Event
+
+
+class BulkLoadTests(TestCase):
+    def load(self, rows, **kwargs):
+        loaded = []
+
+        def results(sql, params):
+            if sql.startswith('LOAD DATA'):
+                with open(params[0], 'rb') as file:
+                    loaded.append(file.read())
+
+        with fake_connections(results), override_options(connection, local_infile=1):
+            TiDBQuerySet(Event).bulk_load(rows, **kwargs)
+        return b''.join(loaded)
+
+    def test_pre_save(self):
+        event = Event(name='launch')
+        data = self.load([event])
+        self.assertIsInstance(event.created, datetime.datetime)
+        self.assertEqual(data, b'launch\t%s\n' % event.created.isoformat(' ').encode())
+
+    def test_escaping(self):
+        created = datetime.datetime(2024, 1, 1, 12, 0, 0, 123456)
+        data = self.load([{'name': 'tab\there\\', 'created': created}, ('new\nline', created)])
+        self.assertEqual(
+            data,
+            b'tab\\there\\\\\t2024-01-01 12:00:00.123456\n'
+            b'new\\nline\t2024-01-01 12:00:00.123456\n',
+        )
+
+    def test_missing_auto_now_add(self):
+        msg = 'bulk_load() rows given as dicts or tuples must have a value for created'
+        for row in [{'name': 'launch'}, ('launch', None)]:
+            with self.subTest(row=row), self.assertRaisesRegex(ValueError, re.escape(msg)):
+                self.load([row])
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+from io import StringIO
+from unittest import TestCase, mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.test.utils import override_settings
+
+from django_tidb.migration_operations import (
+    AlterTiDBOptions, SetTiFlashReplica,
+)
+
+from .fake import fake_connections
+from .models import Event
+
+
+class MakeMigrationsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.migrations = os.path.join(directory.name, 'tidb_options_migrations')
+        os.mkdir(self.migrations)
+        open(os.path.join(self.migrations, '__init__.py'), 'w').close()
+        sys.path.insert(0, directory.name)
+        self.addCleanup(sys.path.remove, directory.name)
+        self.addCleanup(sys.modules.pop, 'tidb_options_migrations', None)
+
+    def makemigrations(self):
+        out = StringIO()
+        with fake_connections(), override_settings(MIGRATION_MODULES={'tests': 'tidb_options_migrations'}):
+            call_command('makemigrations', 'tests', stdout=out)
+        for name in list(sys.modules):
+            if name.startswith('tidb_options_migrations.'):
+                del sys.modules[name]
+        return out.getvalue()
+
+    def read_migration(self, name):
+        with open(os.path.join(self.migrations, name + '.py')) as migration:
+            return migration.read()
+
+    def test_create_then_alter_tidb_options(self):
+        self.makemigrations()
+        self.assertIn(
+            "'tidb_options': {'clustered': False, 'shard_row_id_bits': 4}",
+            self.read_migration('0001_initial'),
+        )
+        tidb_options = {'clustered': False, 'shard_row_id_bits': 5}
+        with mock.patch.dict(Event._meta.original_attrs, {'tidb_options': tidb_options}):
+            self.makemigrations()
+            self.assertEqual(self.makemigrations(), "No changes detected in app 'tests'\n")
+        migration = self.read_migration('0002_alter_event_tidb_options')
+        self.assertIn('django_tidb.migration_operations.AlterTiDBOptions(', migration)
+        self.assertIn("tidb_options={'clustered': False, 'shard_row_id_bits': 5}", migration)
+
+    def test_tiflash_replica_set_by_operation(self):
+        self.makemigrations()
+        with open(os.path.join(self.migrations, '0002_set_event_tiflash_replica.py'), 'w') as migration:
+            migration.write(
+                'from django.db import migrations\n'
+                'from django_tidb.migration_operations import SetTiFlashReplica\n\n\n'
+                'class Migration(migrations.Migration):\n'
+                "    dependencies = [('tests', '0001_initial')]\n"
+                "    operations = [SetTiFlashReplica('Event', 2)]\n"
+            )
+        # Meta.tidb_options has no 'tiflash_replica', the replicas stay.
+        self.assertEqual(self.makemigrations(), "No changes detected in app 'tests'\n")
+        tidb_options = {'clustered': False, 'shard_row_id_bits': 5}
+        with mock.patch.dict(Event._meta.original_attrs, {'tidb_options': tidb_options}):
+            self.makemigrations()
+            self.assertEqual(self.makemigrations(), "No changes detected in app 'tests'\n")
+        self.assertIn(
+            "tidb_options={'clustered': False, 'shard_row_id_bits': 5}",
+            self.read_migration('0003_alter_event_tidb_options'),
+        )
+        tidb_options = {'clustered': False, 'shard_row_id_bits': 5, 'tiflash_replica': 0}
+        with mock.patch.dict(Event._meta.original_attrs, {'tidb_options': tidb_options}):
+            self.makemigrations()
+        self.assertIn("'tiflash_replica': 0}", self.read_migration('0004_alter_event_tidb_options'))
+
+
+class AlterTiDBOptionsTests(TestCase):
+    def test_keeps_tiflash_replica(self):
+        state = ProjectState.from_apps(apps)
+        collected = []
+        for operation in [
+            SetTiFlashReplica('Event', 2, wait=False),
+            AlterTiDBOptions('Event', {'clustered': False, 'shard_row_id_bits': 5}),
+        ]:
+            new_state = state.clone()
+            operation.state_forwards('tests', new_state)
+            with connection.schema_editor(collect_sql=True) as editor:
+                operation.database_forwards('tests', editor, state, new_state)
+            collected.extend(editor.collected_sql)
+            state = new_state
+        self.assertEqual(collected, [
+            'ALTER TABLE `tests_event` SET TIFLASH REPLICA 2;',
+            'ALTER TABLE `tests_event` SHARD_ROW_ID_BITS = 5;',
+        ])
+        self.assertEqual(state.models['tests', 'event'].options['tidb_options'], {
+            'clustered': False, 'shard_row_id_bits': 5, 'tiflash_replica': 2,
+        })
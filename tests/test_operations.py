@@ -0,0 +1,82 @@
+import datetime
+import decimal
+from unittest import TestCase
+
+from django.db import connection
+from django.db.backends.mysql.operations import (
+    DatabaseOperations as MysqlDatabaseOperations,
+)
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, statements
+from .models import Author
+
+
+class BulkBatchSizeTests(TestCase):
+    def test_byte_budget(self):
+        fields = [Author._meta.get_field('name')]
+        objs = [Author(name='x' * 100) for _ in range(100)]
+        options = connection.settings_dict['OPTIONS']
+        options['tidb_bulk_batch_bytes'] = 1000
+        try:
+            self.assertEqual(connection.ops.bulk_batch_size(fields, objs), 8)
+            self.assertEqual(connection.ops.bulk_batch_size(['pk', 'pk'] + fields, objs), 6)
+        finally:
+            del options['tidb_bulk_batch_bytes']
+
+    def test_related_field_names(self):
+        # The deletion collector passes the names of the related fields.
+        objs = [Author(pk=i) for i in range(1, 10)]
+        self.assertEqual(
+            connection.ops.bulk_batch_size(['author'], objs),
+            MysqlDatabaseOperations.bulk_batch_size(connection.ops, ['author'], objs),
+        )
+
+    def test_cascade_delete(self):
+        with fake_connections():
+            Author(pk=1, name='Ann').delete()
+            self.assertEqual(statements(connection), [
+                'SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED',
+                ('DELETE FROM `tests_book` WHERE `tests_book`.`author_id` IN (%s)', (1,)),
+                ('DELETE FROM `tests_author` WHERE `tests_author`.`id` IN (%s)', (1,)),
+                'COMMIT',
+            ])
+
+
+class AsOfTests(TestCase):
+    def test_timedelta(self):
+        self.assertEqual(
+            connection.ops.as_of_sql(datetime.timedelta(seconds=-5)),
+            ('AS OF TIMESTAMP NOW(6) - INTERVAL %s MICROSECOND', (5000000,)),
+        )
+
+    def test_naive_datetime(self):
+        self.assertEqual(
+            connection.ops.as_of_sql(datetime.datetime(2021, 6, 1, 20, 0)),
+            ('AS OF TIMESTAMP %s', ('2021-06-01 20:00:00',)),
+        )
+
+    def test_time_zone(self):
+        with override_settings(USE_TZ=True, TIME_ZONE='Asia/Shanghai'):
+            sql, params = connection.ops.as_of_sql(
+                timezone.make_aware(datetime.datetime(2021, 6, 1, 20, 0, 0, 500)),
+            )
+        # 2021-06-01 12:00:00.0005 UTC.
+        self.assertEqual(sql, 'AS OF TIMESTAMP FROM_UNIXTIME(%s)')
+        self.assertEqual(params, (decimal.Decimal('1622548800.000500'),))
+        self.assertEqual(str(params[0]), '1622548800.000500')
+
+    def test_query(self):
+        with override_settings(USE_TZ=True, TIME_ZONE='America/New_York'):
+            query = TiDBQuerySet(Author).as_of(datetime.datetime(2021, 6, 1, 8, 0)).query
+            self.assertEqual(
+                query.sql_with_params(),
+                (
+                    'SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author` '
+                    'AS OF TIMESTAMP FROM_UNIXTIME(%s)',
+                    (decimal.Decimal('1622548800.000000'),),
+                ),
+            )
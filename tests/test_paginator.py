@@ -0,0 +1,32 @@
+import datetime
+from unittest import TestCase
+
+from django.db import connection
+
+from django_tidb.paginator import KeysetPaginator
+
+from .fake import fake_connections, statements
+from .models import Event
+
+
+class KeysetPaginatorTests(TestCase):
+    def test_microseconds(self):
+        rows = [
+            (1, 'launch', datetime.datetime(2024, 1, 1, 12, 0, 0, 123456)),
+            (2, 'landing', datetime.datetime(2024, 1, 1, 12, 0, 0, 123999)),
+        ]
+
+        def results(sql, params):
+            if sql.startswith('SELECT'):
+                return rows[1:] if params[:1] else rows
+
+        paginator = KeysetPaginator(Event.objects.all(), 1, ordering='created')
+        with fake_connections(results):
+            page = paginator.page()
+            self.assertEqual([event.pk for event in page], [1])
+            cursor = page.next_cursor()
+            self.assertEqual(paginator.decode_cursor(cursor), [rows[0][2], 1])
+            page = paginator.page(after=cursor)
+            self.assertEqual([event.pk for event in page], [2])
+            sql, params = statements(connection)[-1]
+            self.assertEqual(params[:3], ('2024-01-01 12:00:00.123456', '2024-01-01 12:00:00.123456', 1))
@@ -0,0 +1,133 @@
+from unittest import TestCase
+
+from django.db import connection
+from django.db.backends.mysql.base import Database
+
+from django_tidb.pool import ConnectionPool, get_pool
+
+from .fake import FakeConnection, fake_connections, override_options
+
+
+class ConnectionPoolTests(TestCase):
+    def setUp(self):
+        self.opened = []
+        self.refused = set()
+
+    def connect(self, conn_params):
+        if (conn_params['host'], conn_params['port']) in self.refused:
+            raise Database.OperationalError(2003, "Can't connect to MySQL server")
+        connection = FakeConnection(**conn_params)
+        self.opened.append(connection)
+        return connection
+
+    def test_checkout_and_release(self):
+        pool = ConnectionPool([('a', 4000)], size=1)
+        first = pool.acquire({}, self.connect)
+        second = pool.acquire({}, self.connect)
+        self.assertEqual(self.opened, [first, second])
+        self.assertEqual(pool.endpoints[0].active, 2)
+        pool.release(first)
+        # The pool is full.
+        pool.release(second)
+        self.assertFalse(first.closed)
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.endpoints[0].active, 0)
+        self.assertIs(pool.acquire({}, self.connect), first)
+        self.assertEqual(len(self.opened), 2)
+
+    def test_without_size(self):
+        pool = ConnectionPool([('a', 4000)])
+        connection = pool.acquire({}, self.connect)
+        pool.release(connection)
+        self.assertTrue(connection.closed)
+
+    def test_round_robin(self):
+        pool = ConnectionPool([('a', 4000), ('b', 4000)])
+        hosts = [pool.acquire({}, self.connect).host for _ in range(4)]
+        self.assertEqual(hosts, ['a', 'b', 'a', 'b'])
+
+    def test_least_connections(self):
+        pool = ConnectionPool([('a', 4000), ('b', 4000)], strategy='least-connections')
+        first = pool.acquire({}, self.connect)
+        second = pool.acquire({}, self.connect)
+        pool.release(first)
+        self.assertEqual(pool.acquire({}, self.connect).host, first.host)
+        self.assertNotEqual(first.host, second.host)
+
+    def test_failover(self):
+        pool = ConnectionPool([('a', 4000), ('b', 4000)], backoff=60)
+        self.refused.add(('a', 4000))
+        self.assertEqual(pool.acquire({}, self.connect).host, 'b')
+        endpoint = pool.endpoints[0]
+        self.assertEqual(endpoint.failures, 1)
+        # 'a' is backing off, it isn't tried again.
+        self.refused.clear()
+        self.assertEqual([pool.acquire({}, self.connect).host for _ in range(2)], ['b', 'b'])
+
+    def test_all_endpoints_down(self):
+        pool = ConnectionPool([('a', 4000), ('b', 4000)])
+        self.refused.update({('a', 4000), ('b', 4000)})
+        with self.assertRaises(Database.OperationalError):
+            pool.acquire({}, self.connect)
+
+    def test_broken_idle_connection(self):
+        pool = ConnectionPool([('a', 4000)], size=1, health_check_interval=0)
+        connection = pool.acquire({}, self.connect)
+        pool.release(connection)
+        connection.broken = True
+        self.assertIsNot(pool.acquire({}, self.connect), connection)
+        self.assertTrue(connection.closed)
+
+    def test_open_transaction_isnt_leaked(self):
+        pool = ConnectionPool([('a', 4000)], size=1)
+        connection = pool.acquire({}, self.connect)
+        connection.autocommit(False)
+        pool.release(connection)
+        self.assertEqual(connection.statements, ['ROLLBACK'])
+        self.assertIs(pool.acquire({}, self.connect), connection)
+
+    def test_not_reusable(self):
+        pool = ConnectionPool([('a', 4000)], size=1)
+        connection = pool.acquire({}, self.connect)
+        pool.release(connection, reusable=False)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.acquire({}, self.connect), connection)
+
+
+class PooledDatabaseWrapperTests(TestCase):
+    def test_pool_per_options(self):
+        settings_dict = {
+            'HOST': 'a', 'PORT': 4000, 'NAME': 'test', 'USER': 'root', 'OPTIONS': {'tidb_pool_size': 1},
+        }
+        stale_settings_dict = {**settings_dict, 'OPTIONS': {'tidb_pool_size': 1, 'tidb_read_staleness': 5}}
+        self.assertIs(get_pool(settings_dict), get_pool({**settings_dict, 'OPTIONS': {'tidb_pool_size': 1}}))
+        self.assertIsNot(get_pool(settings_dict), get_pool(stale_settings_dict))
+
+    def test_session_variables_are_reset(self):
+        with fake_connections() as opened, override_options(connection, tidb_pool_size=1):
+            connection.ensure_connection()
+            connection.close()
+            connection.ensure_connection()
+            self.assertEqual(opened, [connection.connection])
+            reset = (
+                'SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED; '
+                'SET @@tidb_replica_read = DEFAULT; '
+                'SET @@tidb_isolation_read_engines = DEFAULT; '
+                'SET @@tidb_read_staleness = DEFAULT'
+            )
+            self.assertEqual(opened[0].statements, [reset, reset])
+            connection.close()
+            connection.pool.clear()
+
+    def test_session_variables(self):
+        options = {'tidb_pool_size': 1, 'tidb_replica_read': 'follower', 'tidb_read_staleness': 5}
+        with fake_connections() as opened, override_options(connection, **options):
+            connection.ensure_connection()
+            self.assertEqual(opened[0].statements, [
+                'SET SESSION TRANSACTION ISOLATION LEVEL READ COMMITTED; '
+                "SET @@tidb_replica_read = 'follower'; "
+                'SET @@tidb_isolation_read_engines = DEFAULT; '
+                "SET @@tidb_read_staleness = '-5'"
+            ])
+            connection.close()
+            connection.pool.clear()
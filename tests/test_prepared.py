@@ -0,0 +1,104 @@
+from unittest import TestCase
+
+from django.db import connection
+from django.db.backends.mysql import base as mysql_base
+
+from django_tidb.prepared import prepared_sql
+
+from .fake import fake_connections, override_options, statements
+from .models import Author
+
+
+class PreparedSQLTests(TestCase):
+    def test_placeholders(self):
+        self.assertEqual(
+            prepared_sql("SELECT `a` FROM `t` WHERE `a` = %s AND `b` LIKE '50%%' AND `c` = %s", 2),
+            "SELECT `a` FROM `t` WHERE `a` = ? AND `b` LIKE '50%' AND `c` = ?",
+        )
+        self.assertEqual(
+            prepared_sql('SELECT `a%%b` FROM `t` WHERE `a` = %s', 1),
+            'SELECT `a%b` FROM `t` WHERE `a` = ?',
+        )
+
+    def test_quoted_placeholder(self):
+        # MySQLdb interpolates it inside the string.
+        self.assertIsNone(prepared_sql("SELECT `a` FROM `t` WHERE `a` = '%s'", 1))
+        self.assertIsNone(prepared_sql("SELECT `a` FROM `t` WHERE `a` = 'it''s %s' AND `b` = %s", 2))
+
+    def test_param_count(self):
+        self.assertIsNone(prepared_sql('SELECT `a` FROM `t` WHERE `a` = %s', 2))
+
+
+class PreparedCursorTests(TestCase):
+    def query(self, pk):
+        list(Author.objects.filter(pk=pk))
+
+    def prepared(self):
+        return [statement for statement in statements(connection) if statement[0].startswith(('PREPARE', 'SET @'))]
+
+    def test_prepare_once(self):
+        with fake_connections(), override_options(connection, tidb_prepared_statements=2):
+            self.query(1)
+            self.query(2)
+            self.assertEqual(self.prepared(), [
+                (
+                    'PREPARE django_tidb_stmt_0 FROM %s',
+                    ['SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author` '
+                     'WHERE `tests_author`.`id` = ?'],
+                ),
+                ('SET @django_tidb_p0 = %s; EXECUTE django_tidb_stmt_0 USING @django_tidb_p0', (1,)),
+                ('SET @django_tidb_p0 = %s; EXECUTE django_tidb_stmt_0 USING @django_tidb_p0', (2,)),
+            ])
+
+    def test_unprepared(self):
+        with fake_connections(), override_options(connection, tidb_prepared_statements=2):
+            list(Author.objects.filter(name__startswith='50%'))
+            list(Author.objects.filter(pk__in=range(1, 102)))
+            list(Author.objects.all())
+            self.assertEqual(self.prepared()[0][0], 'PREPARE django_tidb_stmt_0 FROM %s')
+            self.assertIn('LIKE BINARY ?', self.prepared()[0][1][0])
+            # Too many parameters, or none.
+            self.assertEqual(len(self.prepared()), 2)
+
+    def test_eviction(self):
+        with fake_connections(), override_options(connection, tidb_prepared_statements=2):
+            self.query(1)
+            list(Author.objects.filter(name='Ann'))
+            self.query(2)
+            list(Author.objects.filter(name__in=['Ann', 'Bob']))
+            prepares = [(sql.split()[1], params[0]) for sql, params in self.prepared() if sql.startswith('PREPARE')]
+            self.assertEqual([name for name, sql in prepares], [
+                'django_tidb_stmt_0', 'django_tidb_stmt_1', 'django_tidb_stmt_1',
+            ])
+            # The least recently used statement, filtering on the name, was
+            # replaced.
+            self.assertTrue(prepares[1][1].endswith('WHERE `tests_author`.`name` = ?'))
+            self.assertTrue(prepares[2][1].endswith('WHERE `tests_author`.`name` IN (?, ?)'))
+            self.assertEqual(len(connection.prepared_statements), 2)
+
+    def test_reconnect(self):
+        with fake_connections() as opened, override_options(connection, tidb_prepared_statements=2):
+            self.query(1)
+            connection.close()
+            self.query(2)
+            self.assertEqual(len(opened), 2)
+            for fake in opened:
+                self.assertEqual(
+                    [statement[0].split()[0] for statement in fake.statements if statement[0].startswith('PREPARE')],
+                    ['PREPARE'],
+                )
+
+    def test_unknown_statement(self):
+        def results(sql, params):
+            if 'EXECUTE' in sql and params == (2,):
+                raise mysql_base.Database.OperationalError(1243, 'Unknown prepared statement handler')
+
+        with fake_connections(results), override_options(connection, tidb_prepared_statements=2):
+            self.query(1)
+            self.query(2)
+            self.assertEqual(statements(connection)[-1], (
+                'SELECT `tests_author`.`id`, `tests_author`.`name` FROM `tests_author` '
+                'WHERE `tests_author`.`id` = %s',
+                (2,),
+            ))
+            self.assertEqual(len(connection.prepared_statements), 0)
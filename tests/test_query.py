@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, statements
+from .models import Author, Book
+
+
+class ParallelBatchesTests(TestCase):
+    def test_workers(self):
+        authors = [Author(name=name) for name in ('Ann', 'Bob', 'Cid', 'Dan')]
+        with fake_connections() as opened:
+            self.assertEqual(TiDBQuerySet(Author).bulk_create(authors, batch_size=2, workers=2), authors)
+        inserts = sorted(
+            statement
+            for connection in opened
+            for statement in connection.statements
+            if statement[0].startswith('INSERT')
+        )
+        self.assertEqual(inserts, [
+            ('INSERT INTO `tests_author` (`name`) VALUES (%s), (%s)', ('Ann', 'Bob')),
+            ('INSERT INTO `tests_author` (`name`) VALUES (%s), (%s)', ('Cid', 'Dan')),
+        ])
+
+    def test_no_objects(self):
+        with fake_connections() as opened:
+            self.assertEqual(TiDBQuerySet(Author).bulk_create([], workers=2), [])
+            TiDBQuerySet(Author).bulk_update([], ['name'], workers=2)
+            self.assertEqual(TiDBQuerySet(Author).bulk_upsert([], ['name'], workers=2), [])
+        self.assertEqual(opened, [])
+
+
+class OptimizerHintsTests(SimpleTestCase):
+    databases = {'default'}
+
+    def test_select(self):
+        queryset = TiDBQuerySet(Author).tidb_hints('USE_INDEX(tests_author, name_idx)').filter(name='Ann')
+        self.assertEqual(
+            str(queryset.tidb_hints('MAX_EXECUTION_TIME(1000)').query),
+            'SELECT /*+ USE_INDEX(tests_author, name_idx) MAX_EXECUTION_TIME(1000) */ '
+            '`tests_author`.`id`, `tests_author`.`name` FROM `tests_author` WHERE `tests_author`.`name` = Ann',
+        )
+        # The hints stay with their queryset.
+        self.assertNotIn('MAX_EXECUTION_TIME', str(queryset.query))
+
+    def test_update_and_delete(self):
+        with fake_connections():
+            TiDBQuerySet(Author).tidb_hints('MEMORY_QUOTA(1024 MB)').filter(pk=1).update(name='Bob')
+            TiDBQuerySet(Book).tidb_hints('MAX_EXECUTION_TIME(1000)').filter(pk=1).delete()
+            writes = [sql for sql in statements(connection) if sql[0].startswith(('UPDATE', 'DELETE'))]
+            self.assertEqual(writes, [
+                ('UPDATE /*+ MEMORY_QUOTA(1024 MB) */ `tests_author` SET `name` = %s WHERE `tests_author`.`id` = %s',
+                 ('Bob', 1)),
+                ('DELETE /*+ MAX_EXECUTION_TIME(1000) */ FROM `tests_book` WHERE `tests_book`.`id` = %s', (1,)),
+            ])
+
+    def test_read_from_storage(self):
+        queryset = TiDBQuerySet(Book).read_from_storage('tiflash').filter(author__name='Ann')
+        self.assertTrue(str(queryset.query).startswith(
+            'SELECT /*+ READ_FROM_STORAGE(TIFLASH[tests_book, tests_author]) */ `tests_book`.`id`'
+        ))
+        with self.assertRaisesMessage(ValueError, "read_from_storage() engine must be 'tikv' or 'tiflash'"):
+            TiDBQuerySet(Book).read_from_storage('tidb')
+
+    def test_invalid_hints(self):
+        for hint, msg in [
+            ('USE_INDEX(t, idx) */ DROP TABLE t; /*', 'is not a valid optimizer hint.'),
+            ('USE INDEX(t, idx)', 'is not a valid optimizer hint.'),
+            ('FAST_QUERY', 'FAST_QUERY is not a recognized optimizer hint.'),
+        ]:
+            with self.subTest(hint=hint), self.assertRaisesMessage(ValueError, msg):
+                TiDBQuerySet(Author).tidb_hints(hint)
@@ -0,0 +1,86 @@
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.test import SimpleTestCase
+from MySQLdb import OperationalError as DatabaseOperationalError
+
+from django_tidb.retry import reset_retry_counts, retry_atomic, retry_counts
+from django_tidb.transaction import atomic
+
+from .fake import fake_connections, override_options
+
+
+class Conflicts:
+    """Fail the first `count` UPDATE statements with error `code`."""
+    def __init__(self, count, code=9007):
+        self.count = count
+        self.code = code
+
+    def __call__(self, sql, params):
+        if sql.startswith('UPDATE') and self.count:
+            self.count -= 1
+            raise DatabaseOperationalError(self.code, 'Write conflict')
+
+
+@mock.patch('django_tidb.retry.time.sleep')
+class RetryTests(SimpleTestCase):
+    databases = {'default'}
+    update = 'UPDATE tests_author SET name = %s'
+
+    def setUp(self):
+        reset_retry_counts()
+        self.addCleanup(reset_retry_counts)
+        options = override_options(connection, tidb_retry_attempts=2)
+        options.__enter__()
+        self.addCleanup(options.__exit__, None, None, None)
+
+    def updates(self, opened):
+        return [statement for statement in opened[0].statements if statement[0] == self.update]
+
+    def test_statement_retried(self, sleep):
+        with fake_connections(Conflicts(2)) as opened:
+            with connection.cursor() as cursor:
+                cursor.execute(self.update, ['Ann'])
+            self.assertEqual(len(self.updates(opened)), 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(retry_counts(), {('statement', 9007): 2})
+
+    def test_attempts_exhausted(self, sleep):
+        with fake_connections(Conflicts(3)) as opened:
+            with self.assertRaises(OperationalError), connection.cursor() as cursor:
+                cursor.execute(self.update, ['Ann'])
+            self.assertEqual(len(self.updates(opened)), 3)
+        self.assertEqual(retry_counts(), {('statement', 9007): 2, ('statement', 'exhausted'): 1})
+
+    def test_not_retryable(self, sleep):
+        with fake_connections(Conflicts(1, code=1105)) as opened:
+            with self.assertRaises(OperationalError), connection.cursor() as cursor:
+                cursor.execute(self.update, ['Ann'])
+            self.assertEqual(len(self.updates(opened)), 1)
+        sleep.assert_not_called()
+        self.assertEqual(retry_counts(), {})
+
+    def test_not_retried_in_transaction(self, sleep):
+        with fake_connections(Conflicts(1)) as opened:
+            with self.assertRaises(OperationalError), atomic(), connection.cursor() as cursor:
+                cursor.execute(self.update, ['Ann'])
+            self.assertEqual(len(self.updates(opened)), 1)
+            self.assertEqual(opened[0].statements[-1], 'ROLLBACK')
+        self.assertEqual(retry_counts(), {})
+
+    def test_retry_atomic(self, sleep):
+        calls = []
+
+        @retry_atomic
+        def rename():
+            calls.append(connection.in_atomic_block)
+            with connection.cursor() as cursor:
+                cursor.execute(self.update, ['Ann'])
+
+        with fake_connections(Conflicts(1)) as opened:
+            rename()
+            self.assertEqual(len(self.updates(opened)), 2)
+            transactions = [statement for statement in opened[0].statements if statement in ('COMMIT', 'ROLLBACK')]
+            self.assertEqual(transactions, ['ROLLBACK', 'COMMIT'])
+        self.assertEqual(calls, [True, True])
+        self.assertEqual(retry_counts(), {('atomic', 9007): 1})
@@ -0,0 +1,282 @@
+import itertools
+import threading
+from io import StringIO
+from unittest import TestCase, mock
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import connection, migrations, models
+from django.db.migrations.state import ProjectState
+from django.test import SimpleTestCase
+from django.test.utils import isolate_apps
+
+from django_tidb.fields import BigAutoRandomField
+from django_tidb.migration_operations import ReorgDDL
+from django_tidb.schema import DDLJob
+
+from .fake import fake_connections, override_options, statements
+
+
+def count_authors(apps, schema_editor):
+    apps.get_model('tests', 'Author').objects.count()
+
+
+class MergeAlterStatementsTests(TestCase):
+    def apply(self, *operations):
+        migration = migrations.Migration('0001_test', 'tests')
+        migration.operations = operations
+        with connection.schema_editor(atomic=False) as editor:
+            migration.apply(ProjectState.from_apps(apps), editor)
+
+    def test_merged_add_fields(self):
+        with fake_connections():
+            self.apply(
+                migrations.AddField('Author', 'age', models.IntegerField(null=True)),
+                migrations.AddField('Author', 'email', models.CharField(max_length=100, null=True)),
+            )
+            self.assertIn(
+                'ALTER TABLE `tests_author` ADD COLUMN `age` integer NULL, '
+                'ADD COLUMN `email` varchar(100) NULL',
+                statements(connection),
+            )
+
+    def test_run_python_after_add_field(self):
+        with fake_connections(lambda sql, params: [(0,)] if sql.startswith('SELECT') else None):
+            self.apply(
+                migrations.AddField('Author', 'age', models.IntegerField(null=True)),
+                migrations.RunPython(count_authors),
+                migrations.AddField('Author', 'email', models.CharField(max_length=100, null=True)),
+            )
+            executed = statements(connection)
+            add_age = executed.index('ALTER TABLE `tests_author` ADD COLUMN `age` integer NULL')
+            count = executed.index('SELECT COUNT(*) AS `__count` FROM `tests_author`')
+            add_email = executed.index('ALTER TABLE `tests_author` ADD COLUMN `email` varchar(100) NULL')
+            self.assertLess(add_age, count)
+            self.assertLess(count, add_email)
+
+    def test_run_sql_before_add_field(self):
+        with fake_connections():
+            self.apply(
+                migrations.RunSQL('ALTER TABLE `tests_author` ADD COLUMN `legacy` int NULL;'),
+                migrations.AddField('Author', 'age', models.IntegerField(null=True)),
+            )
+            executed = statements(connection)
+            self.assertIn('ALTER TABLE `tests_author` ADD COLUMN `legacy` int NULL;', executed)
+            self.assertIn('ALTER TABLE `tests_author` ADD COLUMN `age` integer NULL', executed)
+
+
+@isolate_apps('tests')
+class TiDBOptionsTests(SimpleTestCase):
+    counter = itertools.count()
+
+    def model(self, tidb_options, pk=None):
+        attrs = {
+            '__module__': __name__,
+            'Meta': type('Meta', (), {'app_label': 'tests', 'tidb_options': tidb_options}),
+        }
+        if pk is not None:
+            attrs['id'] = pk
+        return type('Event%d' % next(self.counter), (models.Model,), attrs)
+
+    def table_sql(self, model):
+        with connection.schema_editor(collect_sql=True) as editor:
+            return editor.table_sql(model)[0]
+
+    def test_shard_row_id_bits(self):
+        sql = self.table_sql(self.model({'clustered': False, 'shard_row_id_bits': 4, 'pre_split_regions': 2}))
+        self.assertIn('PRIMARY KEY /*T![clustered_index] NONCLUSTERED */', sql)
+        self.assertTrue(sql.endswith(') SHARD_ROW_ID_BITS = 4 PRE_SPLIT_REGIONS = 2'))
+        sql = self.table_sql(self.model(
+            {'shard_row_id_bits': 4}, models.CharField(primary_key=True, max_length=20),
+        ))
+        self.assertTrue(sql.endswith(') SHARD_ROW_ID_BITS = 4'))
+
+    def test_shard_row_id_bits_clustered(self):
+        msg = "requires a non-clustered primary key, set tidb_options['clustered'] to False."
+        for tidb_options, pk in [
+            ({'shard_row_id_bits': 4}, None),
+            ({'shard_row_id_bits': 4}, models.BigIntegerField(primary_key=True)),
+            ({'shard_row_id_bits': 4, 'clustered': True}, models.CharField(primary_key=True, max_length=20)),
+        ]:
+            with self.subTest(tidb_options=tidb_options, pk=pk):
+                with self.assertRaisesMessage(ImproperlyConfigured, msg):
+                    self.table_sql(self.model(tidb_options, pk))
+
+    def test_shard_row_id_bits_auto_random(self):
+        msg = "can't be used with an AUTO_RANDOM primary key, which is sharded already."
+        with self.assertRaisesMessage(ImproperlyConfigured, msg):
+            self.table_sql(self.model({'shard_row_id_bits': 4}, BigAutoRandomField(primary_key=True)))
+
+    def test_pre_split_regions(self):
+        msg = "requires tidb_options['shard_row_id_bits'] or an AUTO_RANDOM primary key."
+        with self.assertRaisesMessage(ImproperlyConfigured, msg):
+            self.table_sql(self.model({'clustered': False, 'pre_split_regions': 2}))
+        sql = self.table_sql(self.model({'pre_split_regions': 2}, BigAutoRandomField(primary_key=True)))
+        self.assertTrue(sql.endswith(') PRE_SPLIT_REGIONS = 2'))
+
+    def test_auto_random_not_clustered(self):
+        msg = "must be clustered, remove tidb_options['clustered']."
+        with self.assertRaisesMessage(ImproperlyConfigured, msg):
+            self.table_sql(self.model({'clustered': False}, BigAutoRandomField(primary_key=True)))
+
+    def test_alter_tidb_options(self):
+        model = self.model({})
+        msg = "requires tidb_options['shard_row_id_bits'] or an AUTO_RANDOM primary key."
+        with connection.schema_editor(collect_sql=True) as editor:
+            with self.assertRaisesMessage(ImproperlyConfigured, msg):
+                editor.alter_tidb_options(model, {}, {'pre_split_regions': 2})
+
+
+class DDLReorgTests(SimpleTestCase):
+    databases = {'default'}
+
+    def results(self, sql, params):
+        if sql.startswith('SELECT @@GLOBAL'):
+            return [(4, 256, 'OFF')[:sql.count('@@GLOBAL')]]
+
+    def test_ddl_reorg(self):
+        with fake_connections(self.results):
+            with connection.schema_editor(atomic=False) as editor:
+                with editor.ddl_reorg(worker_cnt=8, batch_size=1024, fast_reorg=True):
+                    editor.execute('CREATE INDEX `name_idx` ON `tests_author` (`name`)')
+            self.assertEqual(statements(connection)[-4:], [
+                'SELECT @@GLOBAL.tidb_ddl_reorg_worker_cnt, @@GLOBAL.tidb_ddl_reorg_batch_size, '
+                '@@GLOBAL.tidb_ddl_enable_fast_reorg',
+                (
+                    'SET @@GLOBAL.tidb_ddl_reorg_worker_cnt = %s, @@GLOBAL.tidb_ddl_reorg_batch_size = %s, '
+                    '@@GLOBAL.tidb_ddl_enable_fast_reorg = %s',
+                    [8, 1024, 'ON'],
+                ),
+                'ALTER TABLE `tests_author` ADD INDEX `name_idx` (`name`)',
+                (
+                    'SET @@GLOBAL.tidb_ddl_reorg_worker_cnt = %s, @@GLOBAL.tidb_ddl_reorg_batch_size = %s, '
+                    '@@GLOBAL.tidb_ddl_enable_fast_reorg = %s',
+                    [4, 256, 'OFF'],
+                ),
+            ])
+
+    def test_fast_reorg_unsupported(self):
+        with fake_connections(self.results), override_options(connection, tidb_server_data={
+            'version': '5.7.25-TiDB-v6.1.0',
+        }):
+            with connection.schema_editor(atomic=False) as editor:
+                with editor.ddl_reorg(worker_cnt=8, fast_reorg=True):
+                    pass
+            self.assertEqual(statements(connection)[-3:], [
+                'SELECT @@GLOBAL.tidb_ddl_reorg_worker_cnt',
+                ('SET @@GLOBAL.tidb_ddl_reorg_worker_cnt = %s', [8]),
+                ('SET @@GLOBAL.tidb_ddl_reorg_worker_cnt = %s', [4]),
+            ])
+
+    def test_reorg_ddl_operation(self):
+        operation = ReorgDDL(
+            [migrations.AddIndex('Author', models.Index(fields=['name'], name='author_name_idx'))],
+            batch_size=1024,
+        )
+        self.assertEqual(operation.deconstruct(), ('ReorgDDL', [], {
+            'operations': operation.operations, 'batch_size': 1024,
+        }))
+        project_state = ProjectState.from_apps(apps)
+        new_state = project_state.clone()
+        operation.state_forwards('tests', new_state)
+        self.assertEqual(
+            [index.name for index in new_state.models['tests', 'author'].options['indexes']], ['author_name_idx'],
+        )
+        with fake_connections(self.results):
+            with connection.schema_editor(atomic=False) as editor:
+                operation.database_forwards('tests', editor, project_state, new_state)
+            self.assertEqual(statements(connection)[-3:], [
+                ('SET @@GLOBAL.tidb_ddl_reorg_batch_size = %s', [1024]),
+                'ALTER TABLE `tests_author` ADD INDEX `author_name_idx` (`name`)',
+                ('SET @@GLOBAL.tidb_ddl_reorg_batch_size = %s', [4]),
+            ])
+
+    def test_track_ddl_jobs(self):
+        job = DDLJob(10, 'tests_author', 'add index', 'write reorganization', 5000, 'running')
+        reported = threading.Event()
+        jobs = []
+
+        def results(sql, params):
+            if sql.startswith('ALTER TABLE'):
+                # The statement runs until the progress has been reported.
+                self.assertTrue(reported.wait(5))
+
+        def report(job):
+            jobs.append(job)
+            reported.set()
+
+        with fake_connections(results), override_options(connection, tidb_ddl_progress_interval=0.01):
+            with connection.schema_editor(atomic=False) as editor:
+                editor.ddl_progress_callback = report
+                with mock.patch.object(editor, 'ddl_jobs', return_value=[job, job._replace(state='synced')]):
+                    editor.execute('CREATE INDEX `name_idx` ON `tests_author` (`name`)')
+                    editor.flush_alter()
+                    self.assertEqual(editor.ddl_jobs.call_args[0][1], 'tests_author')
+        self.assertEqual(jobs[0], job)
+        self.assertNotIn(job._replace(state='synced'), jobs)
+
+
+class IndexForeignKeysTests(SimpleTestCase):
+    databases = {'default'}
+
+    def results(self, indexed):
+        def results(sql, params):
+            if sql.startswith('SHOW FULL TABLES'):
+                return [('tests_author', 'BASE TABLE'), ('tests_book', 'BASE TABLE')]
+            if 'FROM information_schema.statistics' in sql and indexed:
+                return [('tests_book', 1, 'book_author_idx', 'author_id', 'A', 'BTREE')]
+        return results
+
+    def index_sql(self, model):
+        with fake_connections(), connection.schema_editor(collect_sql=True, atomic=False) as editor:
+            editor.create_model(model)
+        return [sql for sql in editor.collected_sql if ' ADD INDEX ' in sql]
+
+    @isolate_apps('tests')
+    def test_options(self):
+        counter = itertools.count()
+
+        class Shelf(models.Model):
+            pass
+
+        for options, tidb_options, indexed in [
+            ({}, {}, False),
+            ({'tidb_index_foreign_keys': True}, {}, True),
+            ({}, {'index_foreign_keys': True}, True),
+            ({'tidb_index_foreign_keys': True}, {'index_foreign_keys': False}, False),
+        ]:
+            with self.subTest(options=options, tidb_options=tidb_options):
+                name = 'Box%d' % next(counter)
+                box = type(name, (models.Model,), {
+                    '__module__': __name__,
+                    'shelf': models.ForeignKey(Shelf, models.CASCADE),
+                    'Meta': type('Meta', (), {'app_label': 'tests', 'tidb_options': tidb_options}),
+                })
+                with override_options(connection, **options):
+                    self.assertIs(connection.features.indexes_foreign_keys, 'tidb_index_foreign_keys' in options)
+                    index_sql = self.index_sql(box)
+                self.assertEqual(len(index_sql), indexed)
+                if indexed:
+                    self.assertRegex(
+                        index_sql[0],
+                        r'^ALTER TABLE `tests_%s` ADD INDEX `tests_%s_shelf_id_\w+` \(`shelf_id`\);$' % (
+                            name.lower(), name.lower(),
+                        ),
+                    )
+
+    def test_command(self):
+        out = StringIO()
+        with fake_connections(self.results(indexed=False)):
+            call_command('tidb_index_foreign_keys', 'tests', dry_run=True, batch_size=1024, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[:2], ['Indexing tests.Book.author', 'SET @@GLOBAL.tidb_ddl_reorg_batch_size = 1024;'])
+        self.assertRegex(lines[2], r'^ALTER TABLE `tests_book` ADD INDEX `tests_book_author_id_\w+` \(`author_id`\);$')
+        self.assertEqual(len(lines), 3)
+
+    def test_command_indexed(self):
+        out = StringIO()
+        with fake_connections(self.results(indexed=True)):
+            call_command('tidb_index_foreign_keys', stdout=out)
+            self.assertFalse(any(' ADD INDEX ' in str(statement) for statement in statements(connection)))
+        self.assertEqual(out.getvalue(), 'All ForeignKey columns are indexed.\n')
@@ -0,0 +1,54 @@
+import warnings
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from django_tidb.query import TiDBQuerySet
+
+from .fake import fake_connections, override_options
+from .models import Author
+
+
+class StreamingTests(SimpleTestCase):
+    databases = {'default'}
+
+    def setUp(self):
+        options = override_options(connection, tidb_streaming_cursors=True)
+        options.__enter__()
+        self.addCleanup(options.__exit__, None, None, None)
+
+    def results(self, sql, params):
+        if sql.startswith('SELECT `tests_author`'):
+            return [(1, 'Ann'), (2, 'Bob'), (3, 'Cid')]
+
+    def test_iterator(self):
+        with fake_connections(self.results):
+            authors = TiDBQuerySet(Author).iterator(chunk_size=2)
+            self.assertEqual(next(authors).name, 'Ann')
+            self.assertIsNotNone(connection.stream)
+            self.assertEqual([author.name for author in authors], ['Bob', 'Cid'])
+            self.assertIsNone(connection.stream)
+
+    def test_released_on_close(self):
+        with fake_connections(self.results):
+            for author in TiDBQuerySet(Author).iterator(chunk_size=2):
+                break
+            self.assertIsNone(connection.stream)
+            with warnings.catch_warnings():
+                warnings.simplefilter('error', RuntimeWarning)
+                connection.cursor().execute('SELECT 1')
+
+    def test_query_inside_iterator(self):
+        msg = (
+            'Read the 2 remaining rows of a streaming result set into memory to run '
+            'another statement on the connection.'
+        )
+        names = []
+        with fake_connections(self.results):
+            for author in TiDBQuerySet(Author).iterator(chunk_size=1):
+                if author.pk == 1:
+                    with self.assertWarnsMessage(RuntimeWarning, msg):
+                        connection.cursor().execute('SELECT 1')
+                names.append(author.name)
+            self.assertIsNone(connection.stream)
+        self.assertEqual(names, ['Ann', 'Bob', 'Cid'])
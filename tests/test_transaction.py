@@ -0,0 +1,71 @@
+from django.db import connection
+from django.db.transaction import TransactionManagementError
+from django.test import SimpleTestCase
+
+from django_tidb.transaction import atomic
+
+from .fake import fake_connections, override_options, statements
+
+
+class VersionTests(SimpleTestCase):
+    def test_transaction_features(self):
+        for version, transactions, savepoints in [
+            ('5.7.25-TiDB-v3.0.20', False, False),
+            ('5.7.25-TiDB-v4.0.0', True, False),
+            ('5.7.25-TiDB-v6.1.7', True, False),
+            ('5.7.25-TiDB-v6.2.0', True, True),
+            ('8.0.11-TiDB-v8.1.0', True, True),
+        ]:
+            with self.subTest(version=version), override_options(connection, tidb_server_data={'version': version}):
+                self.assertIs(connection.features.supports_transactions, transactions)
+                self.assertIs(connection.features.uses_savepoints, savepoints)
+                self.assertIs(connection.features.can_release_savepoints, savepoints)
+                self.assertIs(connection.features.atomic_transactions, False)
+
+
+class AtomicModeTests(SimpleTestCase):
+    databases = {'default'}
+    set_mode = 'SET @django_tidb_txn_mode = @@tidb_txn_mode, @@tidb_txn_mode = %s'
+    restore_mode = 'SET @@tidb_txn_mode = @django_tidb_txn_mode'
+
+    def test_mode(self):
+        with fake_connections():
+            with atomic(mode='optimistic'):
+                with atomic(savepoint=False):
+                    connection.cursor().execute('SELECT 1')
+            self.assertEqual(statements(connection)[-4:], [
+                (self.set_mode, ['optimistic']), 'SELECT 1', 'COMMIT', self.restore_mode,
+            ])
+
+    def test_restored_on_error(self):
+        with fake_connections():
+            with self.assertRaisesMessage(ZeroDivisionError, 'division by zero'):
+                with atomic(mode='pessimistic'):
+                    1 / 0
+            self.assertEqual(statements(connection)[-3:], [
+                (self.set_mode, ['pessimistic']), 'ROLLBACK', self.restore_mode,
+            ])
+
+    def test_decorator(self):
+        @atomic(mode='optimistic')
+        def update():
+            return connection.in_atomic_block
+
+        with fake_connections():
+            self.assertIs(update(), True)
+            self.assertEqual(statements(connection)[-3:], [
+                (self.set_mode, ['optimistic']), 'COMMIT', self.restore_mode,
+            ])
+
+    def test_invalid_mode(self):
+        with self.assertRaisesMessage(ValueError, "Invalid transaction mode 'strict'. Use one of 'optimistic', "):
+            atomic(mode='strict')
+
+    def test_nested_mode(self):
+        msg = "The transaction mode can't be changed inside an atomic block."
+        with fake_connections():
+            with atomic():
+                with self.assertRaisesMessage(TransactionManagementError, msg):
+                    with atomic(mode='optimistic'):
+                        pass
+            self.assertNotIn((self.set_mode, ['optimistic']), statements(connection))